@@ -13,13 +13,13 @@ from .catalogparser import CatalogParser, CatalogResultList
 from .crawler import Crawler
 from .datastructures import GET, Page, POST, Query, Request
 from .etree_parser import parse_html_etree, parse_xml_etree, strip_xml_namespaces
-from .exceptions import AlcazarException, HttpError, HttpRedirect, ScraperError, SkipThisPage
+from .exceptions import AlcazarException, CacheMiss, HttpError, HttpRedirect, ScraperError, SkipThisPage
 from .fetcher import Fetcher
 from .forms import Form
 from .http import HttpClient
 from .husker import (
-    ElementHusker, Husker, HuskerError, HuskerAttributeNotFound, HuskerLookupError, HuskerMismatch, HuskerMultipleSpecMatch,
-    HuskerNotUnique, JmesPathHusker, ListHusker, NullHusker, ScalarHusker, TextHusker, husk,
+    ElementHusker, ExtractionPlan, Field, Husker, HuskerError, HuskerAttributeNotFound, HuskerLookupError, HuskerMismatch,
+    HuskerMultipleSpecMatch, HuskerNotUnique, JmesPathHusker, ListHusker, NullHusker, ScalarHusker, Scope, TextHusker, husk,
 )
 from .scraper import Scraper
 from .skeleton import Skeleton, SkeletonItem
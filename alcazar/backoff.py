@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import logging
+from random import random
+from threading import Lock
+from time import time
+
+# alcazar
+from .exceptions import HttpError
+from .utils.compatibility import urlparse
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# backoff policies
+
+class BackoffPolicy(object):
+    """
+    Decides how long the Scraper waits before re-attempting a query that failed.
+    """
+
+    def delay(self, error, attempt_i):
+        """
+        Returns the number of seconds to wait before re-attempting a query whose attempt number `attempt_i` (counting from 0)
+        failed with `error`, or None if the query shouldn't be re-attempted at all.
+        """
+        raise NotImplementedError
+
+
+class ExponentialBackoff(BackoffPolicy):
+    """
+    Waits `initial * multiplier ** attempt_i` seconds, capped at `max_delay` if it's not None. If `jitter` is non-zero, the delay
+    is then reduced by a random fraction of up to `jitter` of itself, so that queries that failed together don't all retry
+    together; with `jitter=1` this is what's known as "full jitter". The defaults, 1, 5, 25, 125 seconds, etc, are what `Scraper`
+    has always used.
+    """
+
+    def __init__(self, initial=1, multiplier=5, max_delay=None, jitter=0.0):
+        self.initial = initial
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, error, attempt_i):
+        delay = self.initial * self.multiplier ** attempt_i
+        if self.max_delay is not None:
+            delay = min(delay, self.max_delay)
+        if self.jitter:
+            delay *= 1 - self.jitter * random()
+        return delay
+
+
+class NoRetry(BackoffPolicy):
+
+    def delay(self, error, attempt_i):
+        return None
+
+
+class PerErrorClassBackoff(BackoffPolicy):
+    """
+    Picks the policy by the class of the error. `policies` is a list of `(error_class, policy)` pairs, and the first one whose
+    class matches the error is used. A policy of None means errors of that class are never retried. Errors that match none of them
+    use the `default` policy. For instance, this doesn't retry 404s, and waits longer on 429s:
+
+        PerErrorClassBackoff([
+            (HttpError.Http404, None),
+            (HttpError.Http429, ExponentialBackoff(initial=30, multiplier=2, max_delay=600)),
+        ])
+    """
+
+    def __init__(self, policies, default=None):
+        self.policies = list(policies)
+        self.default = default if default is not None else ExponentialBackoff()
+
+    def delay(self, error, attempt_i):
+        for error_class, policy in self.policies:
+            if isinstance(error, error_class):
+                return None if policy is None else policy.delay(error, attempt_i)
+        return self.default.delay(error, attempt_i)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# circuit breaker
+
+class CircuitBreaker(object):
+    """
+    Pauses all requests to a host for `pause_seconds` once `max_consecutive_failures` requests to it in a row have failed. When the
+    pause is over, requests are let through again, but a single further failure pauses the host again; it takes a success to reset
+    the count. Only the errors that are the host's doing count as failures, see `is_failure`.
+
+    This is shared by all the threads of a crawl, hence the lock.
+    """
+
+    def __init__(self, max_consecutive_failures=5, pause_seconds=300):
+        self.max_consecutive_failures = max_consecutive_failures
+        self.pause_seconds = pause_seconds
+        self._lock = Lock()
+        self._num_failures = {}
+        self._paused_until = {}
+
+    @staticmethod
+    def host(url):
+        return urlparse(url).hostname
+
+    @staticmethod
+    def is_failure(error):
+        """
+        Server errors, 429s and network errors count as failures, but not e.g. a 404, or a page that doesn't parse.
+        """
+        if not isinstance(error, HttpError):
+            return False
+        status_code = getattr(error, 'status_code', None)
+        return status_code is None or status_code >= 500 or status_code == 429
+
+    def record_success(self, url):
+        host = self.host(url)
+        with self._lock:
+            self._num_failures.pop(host, None)
+
+    def record_failure(self, url):
+        host = self.host(url)
+        with self._lock:
+            num_failures = self._num_failures.get(host, 0) + 1
+            if num_failures < self.max_consecutive_failures:
+                self._num_failures[host] = num_failures
+                return
+            self._paused_until[host] = time() + self.pause_seconds
+            # NB so that the first failure after the pause re-opens the circuit
+            self._num_failures[host] = self.max_consecutive_failures - 1
+        logging.warning(
+            "%s: %d consecutive failures, pausing for %d seconds",
+            host,
+            num_failures,
+            self.pause_seconds,
+        )
+
+    def paused_until(self, url):
+        """
+        Returns the time until which requests to the host of `url` are paused, or None if they're not.
+        """
+        host = self.host(url)
+        with self._lock:
+            paused_until = self._paused_until.get(host)
+            if paused_until is not None and paused_until <= time():
+                del self._paused_until[host]
+                paused_until = None
+        return paused_until
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -8,14 +8,28 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # standards
+from contextlib import contextmanager
 import logging
 from os import path
 from sys import argv, exit, stderr, stdout
+from time import time
 
 # this library
 from alcazar.etree_parser import parse_html_etree
 from alcazar.http.cache import DiskCache
+from alcazar.http.cache_archive import export_cache, import_cache
+from alcazar.http.warc_cache import WarcCache
 from alcazar.husker import husk
+from alcazar.utils.compatibility import stdin_buffer, stdout_buffer
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+# What the index of a DiskCache can be called, depending on the dbm module that the shelf uses, and on the Python version
+_INDEX_FILE_NAMES = tuple(
+    base_name + extension
+    for base_name in ('index.shelf', 'index.p2.shelf')
+    for extension in ('', '.db', '.dat', '.dir')
+)
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
@@ -60,6 +74,72 @@ class AlcazarCli(object):
             "uncached" if was_present else "no such key",
         ))
 
+    def train_dictionary(self, cache_root_path, num_samples='1000', dict_size='112640'):
+        cache = self._build_cache(cache_root_path)
+        try:
+            dict_id = cache.train_dictionary(int(num_samples), int(dict_size))
+        finally:
+            cache.close()
+        print("%s: trained dictionary %d, which will be used for new bodies if the cache codec is 'zstd+dict'" % (
+            cache_root_path,
+            dict_id,
+        ))
+
+    def cache_gc(self, cache_root_path, max_age_seconds='-', max_total_bytes='-', time_budget_seconds='-'):
+        # NB any of the optional arguments can be given as '-' to leave it unset
+        max_age_seconds, max_total_bytes, time_budget_seconds = (
+            None if value is None else float(value)
+            for value in map(self._optional_arg, (max_age_seconds, max_total_bytes, time_budget_seconds))
+        )
+        cache = self._build_cache(cache_root_path)
+        try:
+            report = cache.purge(
+                min_timestamp=None if max_age_seconds is None else time() - max_age_seconds,
+                max_total_bytes=max_total_bytes,
+                time_budget=time_budget_seconds,
+            )
+        finally:
+            cache.close()
+        print("%s: %s, removed %d of %d entries scanned, freed %d bytes" % (
+            cache_root_path,
+            "done" if report.completed else "time budget exhausted",
+            report.num_entries_removed,
+            report.num_entries_scanned,
+            report.num_bytes_freed,
+        ))
+
+    def export_cache(self, cache_root_path, archive_path, hosts='-', key_prefix='-', max_age_seconds='-'):
+        # NB archive_path can be '-' for stdout, and any of the optional arguments can be given as '-' to leave it unset.
+        # `hosts` is comma-separated.
+        hosts, key_prefix, max_age_seconds = map(self._optional_arg, (hosts, key_prefix, max_age_seconds))
+        cache = self._build_cache(cache_root_path)
+        try:
+            with self._open_archive(archive_path, 'wb') as file_out:
+                num_exported = export_cache(
+                    cache,
+                    file_out,
+                    hosts=None if hosts is None else frozenset(hosts.split(',')),
+                    key_prefix=key_prefix,
+                    min_timestamp=None if max_age_seconds is None else time() - float(max_age_seconds),
+                )
+        finally:
+            cache.close()
+        print("%s: exported %d entries" % (cache_root_path, num_exported), file=stderr)
+
+    def import_cache(self, cache_root_path, archive_path):
+        # NB archive_path can be '-' for stdin
+        cache = self._build_cache(cache_root_path)
+        try:
+            with self._open_archive(archive_path, 'rb') as file_in:
+                num_imported = import_cache(cache, file_in)
+        finally:
+            cache.close()
+        print("%s: imported %d entries" % (cache_root_path, num_imported), file=stderr)
+
+    def index_warcs(self, cache_root_path):
+        # NB building the cache indexes any WARC files that aren't indexed yet, and closing it saves the index
+        WarcCache.build(cache_root_path).close()
+
     def _lookup_response(self, cache_file_path):
         cache = self._load_cache(cache_file_path)
         cache_key = self._cache_key(cache_file_path)
@@ -70,18 +150,47 @@ class AlcazarCli(object):
         else:
             return cache_entry.response
 
-    @staticmethod
-    def _load_cache(cache_file_path):
-        cache_root_path = path.dirname(path.dirname(cache_file_path))
-        return DiskCache.build(cache_root_path)
+    @classmethod
+    def _load_cache(cls, cache_file_path):
+        return cls._build_cache(cls._split_cache_file_path(cache_file_path)[0])
 
     @staticmethod
-    def _cache_key(cache_file_path):
-        return (
-            path.basename(path.dirname(cache_file_path)),
-            path.splitext(path.basename(cache_file_path))[0],
+    def _build_cache(cache_root_path):
+        return DiskCache.build(
+            cache_root_path,
+            dedup=path.isdir(path.join(cache_root_path, 'bodies')),
         )
 
+    @staticmethod
+    def _optional_arg(value):
+        return None if value == '-' else value
+
+    @staticmethod
+    @contextmanager
+    def _open_archive(archive_path, mode):
+        if archive_path == '-':
+            yield stdout_buffer if 'w' in mode else stdin_buffer
+        else:
+            with open(archive_path, mode) as handle:
+                yield handle
+
+    @classmethod
+    def _cache_key(cls, cache_file_path):
+        return cls._split_cache_file_path(cache_file_path)[1]
+
+    @staticmethod
+    def _split_cache_file_path(cache_file_path):
+        # NB keys have as many directory levels as their key scheme gives them, so we walk up to the directory with the index
+        key = [path.splitext(path.basename(cache_file_path))[0]]
+        dir_path = path.dirname(path.abspath(cache_file_path))
+        while not any(path.exists(path.join(dir_path, name)) for name in _INDEX_FILE_NAMES):
+            parent_path = path.dirname(dir_path)
+            if parent_path == dir_path:
+                raise ValueError("%s is not in a cache directory" % cache_file_path)
+            key.insert(0, path.basename(dir_path))
+            dir_path = parent_path
+        return dir_path, tuple(key)
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 def main():
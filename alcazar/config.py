@@ -19,19 +19,33 @@ _DEFAULT_VALUES = {
     'allow_redirects': True,
     'auto_raise_for_redirect': False,
     'auto_raise_for_status': True,
+    'cache_codec': 'gzip',
+    'cache_dedup': False,
+    'cache_format': 'files',
     'cache_key': None,
     'cache_key_salt': None,
+    'cache_key_scheme': 'md5',
+    'cache_offline': False,
+    'cache_read_only': False,
+    'cache_revalidation': False,
     'courtesy_seconds': 5,
     'encoding': None,
     'encoding_errors': 'strict',
     'force_cache_stale': False,
+    'json_decoder': 'auto',
+    'max_cache_bytes': None,
     'max_cache_life': None,
+    'max_pools': 10,
     'num_attempts_per_scrape': 5,
     'http_proxy': None,
     'https_proxy': None,
+    'pool_block': False,
+    'pool_idle_timeout': None,
+    'pool_size': 10,
     'ssl_verification': True,
     'stream': False,
     'strip_namespaces': True,
+    'tcp_keep_alive': False,
     'timeout': 30,
     'use_cache': True,
     'user_agent': 'Alcazar/%s' % ALCAZAR_VERSION,
@@ -7,8 +7,15 @@
 # 2+3 compat
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+# standards
+from heapq import heappop, heappush
+from itertools import count
+from time import time
+
 # alcazar
-from .scraper import Scraper
+from .exceptions import ScraperError, SkipThisPage
+from .parse_pool import ParsePool
+from .scraper import Retry, Scraper
 
 #----------------------------------------------------------------------------------------------------------------------------------
 # scheduler
@@ -31,6 +38,13 @@ class Scheduler(object):
     def __len__(self):
         raise NotImplementedError
 
+    def drained(self):
+        """
+        Called by the crawler when the scheduler is empty and it has nothing else to do. Returns True if the crawl is over, or
+        False if queries have come in meanwhile. Schedulers that are fed by other processes can wait here until either happens.
+        """
+        return True
+
     @property
     def empty(self):
         return len(self) == 0
@@ -65,12 +79,22 @@ class Crawler(Scraper):
     isn't fully pre-programmed.
     """
 
+    # If non-zero, pages are parsed by a `ParsePool` of this many worker processes, while this process keeps fetching. In that
+    # mode the query's `fetch` method isn't used, the worker picks the parser by content type like `Fetcher.fetch` does, and the
+    # page passed to `record_payload` has no husker.
+    num_parse_processes = 0
+
     def __init__(self, scheduler=None, **kwargs):
+        self.num_parse_processes = kwargs.pop('num_parse_processes', self.num_parse_processes)
         # NB this class saves some state on `self', so it is not thread-safe. When building a multithreaded crawler, each thread
         # must instantiate its own Crawler, and they can all share the same scheduler (or they can use a Scheduler implementation
         # that reads from a central database).
         super(Crawler, self).__init__(**kwargs)
-        self.scheduler = scheduler or StackScheduler()
+        self.scheduler = scheduler if scheduler is not None else StackScheduler()
+        # Queries that can't be attempted yet, as a heap of `(not_before, sequence_number, query)` tuples. They're moved back to
+        # the scheduler once their time has come.
+        self.deferred = []
+        self._deferred_sequence = count()
 
     def crawl(self, **kwargs):
         for _ in self.crawl_iter(**kwargs):
@@ -78,12 +102,110 @@ class Crawler(Scraper):
 
     def crawl_iter(self, **kwargs):
         self.crawler_starting(**kwargs)
-        while not self.scheduler.empty:
-            query = self.scheduler.pop()
-            payload = self.scrape(query)
+        payloads = self._crawl_with_parse_pool() if self.num_parse_processes else self._crawl()
+        for payload in payloads:
+            yield payload
+        self.crawler_stopped()
+        self.profiler.report()
+
+    def _crawl(self):
+        while True:
+            query = self.next_query()
+            if query is None:
+                break
+            payload = self._attempt_outcome(self.scrape_attempt(query))
             if payload is not None:
                 yield payload
-        self.crawler_stopped()
+
+    def _crawl_with_parse_pool(self):
+        parse_pool = ParsePool(self, self.num_parse_processes)
+        try:
+            while True:
+                # NB we only wait on the workers if they're all busy, or if there's nothing to fetch meanwhile
+                while parse_pool.num_pending:
+                    parsed = parse_pool.pop_parsed(block=parse_pool.is_full or not self._has_ready_query())
+                    if parsed is None:
+                        break
+                    payload = self._attempt_outcome(self._parsed_attempt(*parsed))
+                    if payload is not None:
+                        yield payload
+                query = self.next_query()
+                if query is None:
+                    break
+                try:
+                    page = self._attempt_fetch(query, self.fetcher.fetch_unparsed)
+                except SkipThisPage as reason:
+                    payload = query.methods.record_skipped_page(query, reason)
+                except ScraperError as error:
+                    payload = self._failed_attempt(query, error)
+                else:
+                    parse_pool.submit(query, page)
+                    continue
+                payload = self._attempt_outcome(payload)
+                if payload is not None:
+                    yield payload
+        finally:
+            parse_pool.close()
+
+    def _parsed_attempt(self, query, page, result):
+        """
+        Completes the attempt at scraping `query` once a `ParsePool` worker has parsed its page, and returns what `scrape_attempt`
+        would've returned.
+        """
+        self.scheduler.add_many(result.queries)
+        methods = query.methods
+        try:
+            if result.error is not None:
+                raise result.error # NB so that it's handled, and logged, just like an error raised in this process
+        except SkipThisPage as reason:
+            return methods.record_skipped_page(query, reason)
+        except ScraperError as error:
+            return self._failed_attempt(query, error)
+        with self.profiler.stage('record_payload'):
+            return methods.record_payload(page, result.payload)
+
+    def _attempt_outcome(self, result):
+        """
+        Defers the query if `result` is a `Retry`, and returns the payload to be yielded, if any.
+        """
+        if isinstance(result, Retry):
+            self.defer(result.query, result.query.not_before)
+            return None
+        return result
+
+    def parse_worker_kwargs(self):
+        """
+        Returns the kwargs with which each `ParsePool` worker process instantiates this crawler's class. Override this if the
+        subclass's constructor needs more arguments, but note that they need to be picklable.
+        """
+        return {'id': self.id}
+
+    def _has_ready_query(self):
+        return not self.scheduler.empty or bool(self.deferred and self.deferred[0][0] <= time())
+
+    def next_query(self):
+        """
+        Returns the next query to attempt. Queries that can't be attempted yet, either because they're waiting to be re-attempted
+        or because the circuit breaker has paused their host, are deferred, and the others are attempted meanwhile. Only when
+        there's nothing else to do does this wait for the first deferred query's time to come. Returns None once all is done.
+        """
+        while True:
+            now = time()
+            while self.deferred and self.deferred[0][0] <= now:
+                self.scheduler.add(heappop(self.deferred)[2])
+            if not self.scheduler.empty:
+                query = self.scheduler.pop()
+                not_before = self._not_before(query)
+                if not_before is None or not_before <= now:
+                    return query
+                self.defer(query, not_before)
+            elif self.deferred:
+                self._sleep_until(self.deferred[0][0])
+            elif self.scheduler.drained():
+                return None
+
+    def defer(self, query, not_before):
+        heappush(self.deferred, (not_before, next(self._deferred_sequence), query))
 
     def crawler_starting(self):
         pass
@@ -173,7 +173,7 @@ def POST(url, data=None, **kwargs): # pylint: disable=invalid-name
 
 class Query(object):
 
-    def __init__(self, request, methods={}, config=DEFAULT_CONFIG, extras={}, depth=0):
+    def __init__(self, request, methods={}, config=DEFAULT_CONFIG, extras={}, depth=0, attempt=0, not_before=None):
 
         # This holds whatever our fetcher's `request` method returns, typically a Request instance
         self.request = request
@@ -194,6 +194,13 @@ class Query(object):
         # to `fetch()`, `scrape()` or `query()`.
         self.depth = depth
 
+        # How many times the Scraper has already tried, and failed, to scrape this query. This is 0 on the first attempt.
+        self.attempt = attempt
+
+        # If not None, the `time()` before which this query must not be attempted. The Scraper sets this when a query is to be
+        # re-attempted after a failure, so that it can be put back in the queue rather than waited on.
+        self.not_before = not_before
+
     def replace(self, **fields):
         return Query(
             request=fields.get('request', self.request),
@@ -201,6 +208,8 @@ class Query(object):
             config=fields.get('config', self.config),
             extras=fields.get('extras', self.extras),
             depth=fields.get('depth', self.depth),
+            attempt=fields.get('attempt', self.attempt),
+            not_before=fields.get('not_before', self.not_before),
         )
 
     def replace_config(self, **fields):
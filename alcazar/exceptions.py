@@ -48,4 +48,9 @@ for _status_code in range(100, 600):
 class SkipThisPage(AlcazarException):
     pass
 
+
+class CacheMiss(ScraperError):
+    # Raised when the cache is offline, and it doesn't have what was requested
+    pass
+
 #----------------------------------------------------------------------------------------------------------------------------------
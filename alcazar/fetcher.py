@@ -8,14 +8,23 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # standards
-from contextlib import closing
+import codecs
+from contextlib import closing, contextmanager
 import re
 
 # alcazar
 from .datastructures import Page, Request
 from .etree_parser import parse_html_etree, parse_xml_etree
 from .http import HttpClient
+from .http.metrics import RequestMetrics, response_metrics
 from .husker import ElementHusker, JmesPathHusker
+from .profiling import Profiler
+from .utils.jsonutils import iter_json_array, pick_json_decoder
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# globals
+
+_RE_CHARSET = re.compile(r';\s*charset=[\'\"]?([\w\-]+)', re.I)
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
@@ -26,12 +35,43 @@ class Fetcher(object):
     or a Chrome DevTools fetcher, that connect to external browser processes.
     """
 
-    def __init__(self, base_config, http_client=None, **kwargs):
+    # How many bytes at a time `fetch_json_records` reads off the network
+    json_stream_chunk_size = 64 * 1024
+
+    def __init__(self, base_config, http_client=None, profiler=None, **kwargs):
         self.base_config = base_config
         self.http = http_client if http_client is not None else HttpClient(base_config, **kwargs)
-
-    def fetch_response(self, query):
-        return self.http.submit(query.request, query.config)
+        self.profiler = profiler if profiler is not None else Profiler()
+
+    def fetch_response(self, query, metrics=None):
+        return self.http.submit(query.request, query.config, metrics)
+
+    @contextmanager
+    def _fetched_response(self, query):
+        """
+        Fetches the response, closes it once the caller is done with it, and only then records the request's metrics, so that they
+        include the time spent parsing the response.
+        """
+        metrics = RequestMetrics()
+        metrics.attempt = query.attempt
+        try:
+            with closing(self.fetch_response(query, metrics)) as response:
+                yield response
+        finally:
+            self.http.metrics.record(metrics)
+
+    @contextmanager
+    def fetch_stream(self, query):
+        """
+        Yields the response without having read its body, for the caller to stream it, and closes it once the caller is done.
+        """
+        with self._fetched_response(query.replace_config(stream=True)) as response:
+            yield response
+
+    @contextmanager
+    def _stage(self, metrics, stage):
+        with metrics.timing(stage), self.profiler.stage(stage):
+            yield
 
     def request(self, request_or_url, **kwargs):
         if isinstance(request_or_url, Request):
@@ -41,38 +81,68 @@ class Fetcher(object):
             return Request(request_or_url, **kwargs)
 
     def fetch(self, query):
-        with closing(self.fetch_response(query)) as response:
-            content_type = re.sub(r'\s*;.*', '', response.headers.get('Content-Type') or '')
-            if content_type == 'text/html':
-                return self.html_page(query, response)
-            elif content_type in ('text/xml', 'application/xml'):
-                return self.xml_page(query, response)
-            elif content_type == 'application/json':
-                return self.json_page(query, response)
-            else:
-                return self.unparsed_page(query, response)
+        with self._fetched_response(query) as response:
+            return self.build_page(query, response)
+
+    def fetch_unparsed(self, query):
+        """
+        Downloads the whole body but doesn't parse it, so that it can be parsed elsewhere, e.g. in a `ParsePool` worker.
+        """
+        with self._fetched_response(query) as response:
+            response.content # pylint: disable=pointless-statement
+            return self.unparsed_page(query, response)
 
     def fetch_html(self, query):
-        with closing(self.fetch_response(query)) as response:
+        with self._fetched_response(query) as response:
             return self.html_page(query, response)
 
     def fetch_xml(self, query):
-        with closing(self.fetch_response(query)) as response:
+        with self._fetched_response(query) as response:
             return self.xml_page(query, response)
 
     def fetch_json(self, query):
-        with closing(self.fetch_response(query)) as response:
+        with self._fetched_response(query) as response:
+            return self.json_page(query, response)
+
+    def fetch_json_records(self, query):
+        """
+        For huge JSON arrays: fetches the document as a stream, and yields a JmesPathHusker for each element of the array as soon
+        as it's been read, without ever loading the whole document into memory.
+        """
+        query = query.replace_config(stream=True)
+        with self._fetched_response(query) as response:
+            encoding = self._pick_json_encoding(query, response) or 'UTF-8'
+            decoder = codecs.getincrementaldecoder(encoding)(errors=query.config.encoding_errors)
+            text_chunks = (
+                decoder.decode(chunk)
+                for chunk in response.iter_content(chunk_size=self.json_stream_chunk_size)
+            )
+            for record in iter_json_array(text_chunks):
+                yield JmesPathHusker(record)
+
+    def build_page(self, query, response):
+        content_type = re.sub(r'\s*;.*', '', response.headers.get('Content-Type') or '')
+        if content_type == 'text/html':
+            return self.html_page(query, response)
+        elif content_type in ('text/xml', 'application/xml'):
+            return self.xml_page(query, response)
+        elif content_type == 'application/json':
             return self.json_page(query, response)
+        else:
+            return self.unparsed_page(query, response)
 
     def html_page(self, query, response):
-        html_string = response.content.decode(
-            encoding=self._pick_encoding(query, response),
-            errors=query.config.encoding_errors,
-        )
-        husker = ElementHusker(
-            parse_html_etree(html_string),
-            is_full_document=True,
-        )
+        metrics = response_metrics(response)
+        html_bytes = response.content
+        with self._stage(metrics, 'decode'):
+            html_string = html_bytes.decode(
+                encoding=self._pick_encoding(query, response),
+                errors=query.config.encoding_errors,
+            )
+        with self._stage(metrics, 'parse'):
+            etree = parse_html_etree(html_string)
+        with self._stage(metrics, 'husk'):
+            husker = ElementHusker(etree, is_full_document=True)
         return Page(query, response, husker)
 
     @staticmethod
@@ -88,24 +158,51 @@ class Fetcher(object):
         )
 
     def xml_page(self, query, response):
-        # NB we let lxml do the character decoding
+        # NB we let lxml do the character decoding, so that's timed as part of the parsing
+        metrics = response_metrics(response)
         xml_bytes = response.content
-        husker = ElementHusker(
-            parse_xml_etree(
+        with self._stage(metrics, 'parse'):
+            etree = parse_xml_etree(
                 xml_bytes,
                 strip_namespaces=query.config.strip_namespaces,
-            ),
-            is_full_document=True,
-        )
+            )
+        with self._stage(metrics, 'husk'):
+            husker = ElementHusker(etree, is_full_document=True)
         return Page(query, response, husker)
 
     def unparsed_page(self, query, response):
         return Page(query, response, husker=None)
 
     def json_page(self, query, response):
-        husker = JmesPathHusker(response.json())
+        # NB we don't use `response.json()`, which decodes the whole body to text, guessing the encoding if it's not declared,
+        # before handing it to the standard library's parser. JSON parsers can take bytes directly, and faster ones exist.
+        metrics = response_metrics(response)
+        loads = pick_json_decoder(query.config.json_decoder)
+        encoding = self._pick_json_encoding(query, response)
+        json_input = response.content
+        if encoding is not None:
+            with self._stage(metrics, 'decode'):
+                json_input = json_input.decode(encoding, query.config.encoding_errors)
+        with self._stage(metrics, 'parse'):
+            json_obj = loads(json_input)
+        with self._stage(metrics, 'husk'):
+            husker = JmesPathHusker(json_obj)
         return Page(query, response, husker)
 
+    @staticmethod
+    def _pick_json_encoding(query, response):
+        """
+        JSON is UTF-8 unless otherwise specified (RFC 8259), in which case the parser can take the raw bytes directly. We only
+        return an encoding if one other than UTF-8 is either configured or explicitly declared by the server.
+        """
+        encoding = query.config.encoding
+        if encoding is None:
+            match = _RE_CHARSET.search(response.headers.get('Content-Type') or '')
+            encoding = match and match.group(1)
+        if encoding and codecs.lookup(encoding).name != 'utf-8':
+            return encoding
+        return None
+
     @property
     def default_headers(self):
         # NB this should return the original, modifyable header dict
@@ -11,38 +11,55 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # standards
 from collections import namedtuple
-from contextlib import contextmanager
-import email.message
-from functools import partial
-import gzip
-from hashlib import md5
+from contextlib import closing, contextmanager
+from datetime import timedelta
 import json
 import logging
-from os import path, makedirs, rename, rmdir, unlink
+from os import path, makedirs
+import random
 import shelve
+from threading import RLock, Thread
 from time import time
 
 # 3rd parties
+import requests
 try:
     from requests.packages import urllib3
 except ImportError:
     import urllib3
 
 # alcazar
+from ..exceptions import CacheMiss
 from ..utils.compatibility import PY2, pickle, text_type
+from .cache_base import Cache, CacheEntry, CachePurgeReport, NullCache
+from .cache_keys import Md5KeyScheme, build_cache_key_scheme
+from .cache_storage import ContentAddressedStorage, FlatFileStorage, MockedHttplibResponse
+from .warc_cache import WarcCache
 
 #----------------------------------------------------------------------------------------------------------------------------------
 # data structures
 
-class CacheEntry(namedtuple('CacheEntry', (
-        'response',
-        'exception',
-        'timestamp',
-        'raw_headers',
-        ))):
-
-    def __new__(cls, response, exception, timestamp, raw_headers=None):
-        return super(CacheEntry, cls).__new__(cls, response, exception, timestamp, raw_headers)
+# What the index of a `DiskCache` stores for a response, as plain values that are cheap to unpickle, rather than the pickled
+# requests.Response object itself. `headers` is the list of the raw headers, as received, and the request's body is only kept if
+# it's a string. `history` holds one record, as a plain tuple, for each redirect that was followed to get the response, and
+# `elapsed` is a number of seconds. `content` is only kept for the responses in `history`, since the body of the response itself
+# is in the storage.
+CacheRecord = namedtuple('CacheRecord', (
+    'status',
+    'reason',
+    'url',
+    'headers',
+    'encoding',
+    'request_method',
+    'request_url',
+    'request_headers',
+    'request_body',
+    'history',
+    'elapsed',
+    'content',
+))
+# NB records written before `history`, `elapsed` and `content` were added are shorter tuples, and these defaults fill them in
+CacheRecord.__new__.__defaults__ = ((), None, None)
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
@@ -52,12 +69,15 @@ class CacheAdapterMixin(object):
     """
 
     def __init__(self, base_config, **kwargs):
-        self.cache, rest = self._build_cache_from_kwargs(**kwargs)
+        self.cache_key_scheme = build_cache_key_scheme(base_config.cache_key_scheme)
+        self.cache, rest = self._build_cache_from_kwargs(base_config, self.cache_key_scheme, **kwargs)
         super(CacheAdapterMixin, self).__init__(base_config, **rest)
-        self.needs_purge = base_config.max_cache_life is not None
+        # NB when revalidation is on we don't purge stale entries, since they can still save us a download
+        self.purges_stale_entries = base_config.max_cache_life is not None and not base_config.cache_revalidation
+        self.needs_purge = self.purges_stale_entries or base_config.max_cache_bytes is not None
 
     @staticmethod
-    def _build_cache_from_kwargs(**kwargs):
+    def _build_cache_from_kwargs(base_config, cache_key_scheme, **kwargs):
         if 'cache' in kwargs:
             cache = kwargs.pop('cache')
             kwargs.pop('cache_id', None)
@@ -69,7 +89,19 @@ class CacheAdapterMixin(object):
             if cache_root_path is not None:
                 if cache_id:
                     cache_root_path = path.join(cache_root_path, cache_id)
-                cache = DiskCache.build(cache_root_path)
+                if base_config.cache_format == 'files':
+                    cache = DiskCache.build(
+                        cache_root_path,
+                        dedup=base_config.cache_dedup,
+                        codec=base_config.cache_codec,
+                        read_only=base_config.cache_read_only,
+                    )
+                elif base_config.cache_read_only:
+                    raise ValueError("Only the 'files' cache format can be read-only")
+                elif base_config.cache_format == 'warc':
+                    cache = WarcCache.build(cache_root_path, cache_key_scheme)
+                else:
+                    raise ValueError("Unknown cache format: %r" % (base_config.cache_format,))
             else:
                 cache = NullCache()
         return cache, kwargs
@@ -80,14 +112,22 @@ class CacheAdapterMixin(object):
         config_stream = kwargs['stream'] # NB we've passed it from config to kwargs before invoking Session.send()
         kwargs['stream'] = True # regardless of what config_stream is set to -- see below
         log = kwargs['log']
-        cache_key, entry = self._get(prepared_request, config)
+        metrics = kwargs['metrics']
+        with metrics.timing('cache_lookup'):
+            cache_key, entry, stale_entry = self._get(prepared_request, config)
         log['cache_key'] = cache_key
-        if entry is None:
+        if stale_entry is not None:
+            log['cache_or_courtesy'] = 'stale'
+            metrics.cache = 'stale'
+            entry = self._revalidate(cache_key, stale_entry, prepared_request, config, kwargs)
+        elif entry is None:
             log['cache_or_courtesy'] = ''
+            metrics.cache = 'miss'
             entry = self._fetch(prepared_request, config, kwargs)
             self.cache.put(cache_key, entry)
         else:
             log['cache_or_courtesy'] = 'cached'
+            metrics.cache = 'hit'
             log['prepared_request'] = prepared_request
             self.logger.flush(log, end='\n')
         if entry.response is not None and not config_stream:
@@ -100,20 +140,94 @@ class CacheAdapterMixin(object):
             return entry.response
 
     def _get(self, prepared_request, config):
+        """
+        Returns the cache key, the fresh cache entry if there is one, and the stale entry if there's a stale entry that we can
+        revalidate rather than download anew.
+        """
         now = time()
         if self.needs_purge:
             # NB the per-request config.max_cache_life is never used to purge the whole cache
-            self.cache.purge(now - self.base_config.max_cache_life)
+            self.cache.start_background_purge(
+                min_timestamp=(now - self.base_config.max_cache_life) if self.purges_stale_entries else None,
+                max_total_bytes=self.base_config.max_cache_bytes,
+                on_done=self.metrics_sink.record_cache_purge,
+            )
             self.needs_purge = False
         cache_key = config.cache_key or self.compute_cache_key(prepared_request, config.cache_key_salt)
         if config.force_cache_stale:
-            entry = None
-        else:
-            min_timestamp = 0 if config.max_cache_life is None else (now - config.max_cache_life)
-            entry = self.cache.get(cache_key, min_timestamp)
+            return cache_key, None, None
+        min_timestamp = 0 if config.max_cache_life is None else (now - config.max_cache_life)
+        if not config.cache_revalidation or min_timestamp == 0:
+            return self._lookup(cache_key, prepared_request, config, min_timestamp) + (None,)
+        cache_key, entry = self._lookup(cache_key, prepared_request, config, 0)
+        if entry is None or entry.timestamp >= min_timestamp:
+            return cache_key, entry, None
+        if entry.exception is None and entry.response is not None and self._validator_headers(entry.response):
+            return cache_key, None, entry
+        if entry.response is not None:
+            entry.response.close()
+        return cache_key, None, None
+
+    def _lookup(self, cache_key, prepared_request, config, min_timestamp):
+        """
+        Returns the key under which the request's entry was found, and the entry, or None. If there's nothing under `cache_key`,
+        the legacy keys of the key scheme are tried too, so entries cached before the scheme was changed are still found.
+        """
+        entry = self.cache.get(cache_key, min_timestamp)
+        if entry is None and not config.cache_key:
+            for legacy_key in self.cache_key_scheme.legacy_keys(
+                    prepared_request.method,
+                    prepared_request.url,
+                    prepared_request.body,
+                    config.cache_key_salt,
+                    ):
+                entry = self.cache.get(legacy_key, min_timestamp)
+                if entry is not None:
+                    return legacy_key, entry
         return cache_key, entry
 
+    def _revalidate(self, cache_key, stale_entry, prepared_request, config, kwargs):
+        """
+        Sends a conditional request for a stale cache entry. If the server answers "304 Not Modified", the entry's timestamp is
+        refreshed and its stored body served, without rewriting it to disk. Otherwise the new response replaces the stale one.
+        """
+        stale_response = stale_entry.response
+        conditional_request = prepared_request.copy()
+        conditional_request.headers.update(self._validator_headers(stale_response))
+        entry = self._fetch(conditional_request, config, kwargs)
+        if entry.response is not None and entry.response.status_code == 304:
+            not_modified = entry.response
+            not_modified.close()
+            for header in self.revalidation_updated_headers:
+                if header in not_modified.headers:
+                    stale_response.headers[header] = not_modified.headers[header]
+                    # NB the raw headers are what the index saves, so they must be updated too
+                    if stale_entry.raw_headers is not None:
+                        stale_entry.raw_headers[header] = not_modified.headers[header]
+            entry = stale_entry._replace(timestamp=entry.timestamp)
+            self.cache.refresh(cache_key, entry)
+        else:
+            stale_response.close()
+            self.cache.put(cache_key, entry)
+        return entry
+
+    # The headers of a cached response that get updated with those of the 304 response that revalidates it
+    revalidation_updated_headers = ('Cache-Control', 'Date', 'ETag', 'Expires', 'Last-Modified')
+
+    @staticmethod
+    def _validator_headers(response):
+        headers = {}
+        etag = response.headers.get('ETag')
+        if etag:
+            headers['If-None-Match'] = etag
+        last_modified = response.headers.get('Last-Modified')
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return headers
+
     def _fetch(self, prepared_request, config, kwargs):
+        if config.cache_offline:
+            raise CacheMiss("%s %s is not in the cache" % (prepared_request.method, prepared_request.url))
         exception = None
         try:
             response = super(CacheAdapterMixin, self).send(prepared_request, config, **kwargs)
@@ -128,76 +242,53 @@ class CacheAdapterMixin(object):
         )
 
     def compute_cache_key(self, prepared_request, cache_key_salt):
-        # Notes on the use of md5 rather than something stronger:
-        # * MD5 hashes are comparatively short, which is convenient when logging and debugging
-        # * experience shows it's plenty good enough
-        # * if a particular scraper is going to scrape billions of pages, then this method can be overriden
-        parts = [
+        # NB if a particular scraper is going to scrape billions of pages, then this method can be overriden, or the
+        # `cache_key_scheme` config changed
+        return self.cache_key_scheme.compute(
             prepared_request.method,
             prepared_request.url,
             prepared_request.body,
-        ]
-        if cache_key_salt is not None:
-            parts.append(cache_key_salt)
-        hexdigest = md5(b''.join(
-            repr(part).encode('UTF-8')
-            for part in parts
-        )).hexdigest()
-        hexdigest = text_type(hexdigest)
-        return (hexdigest[:3], hexdigest[3:])
+            cache_key_salt,
+        )
 
     def close(self):
         super(CacheAdapterMixin, self).close()
         self.cache.close()
 
-#----------------------------------------------------------------------------------------------------------------------------------
-
-class Cache(object):
-    """ Abstract base class for HTTP cache implementations """
-
-    def get(self, key, min_timestamp):
-        """
-        Looks up an entry in the cache by key, and returns it. Entries with a timestamp less than `min_timestamp` are ignored.
-        """
-        raise NotImplementedError
-
-    def put(self, key, entry):
-        """
-        Saves an entry in the cache, under the given key
-        """
-        raise NotImplementedError
-
-    def discard(self, key):
-        """
-        Removed an entry from the cache, if present. Returns a bool indicating whether the entry was present in the cache.
-        """
-        raise NotImplementedError
-
-    def purge(self, min_timestamp):
-        """
-        Removes from the cache all entries whose `timestamp` is less than the given min_timestamp.
-        """
 
-    def close(self):
-        """
-        Closes any open resources such as file handles. The cache will not be used after it has been closed.
-        """
+def default_cache_key(method, url, body, cache_key_salt=None):
+    return Md5KeyScheme().compute(method, url, body, cache_key_salt)
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class DiskCache(Cache):
     """
     The default cache implementation, uses a `shelf` object as an index that maps cache key to response object, and one gzipped
-    file per request for the response data.
+    file per request for the response data (or another format, depending on the storage codec).
+
+    A cache that is `read_only` opens its shelves read-only, so that any number of processes can read it at once, e.g. to re-parse
+    a frozen cache in parallel. New responses aren't saved to it, nor do reads leave any trace, and trying to discard, purge or
+    import entries raises a ValueError.
     """
 
-    def __init__(self, index, storage):
+    def __init__(self, index, storage, read_only=False):
         self.index = index
         self.storage = storage
+        self.read_only = read_only
+        # NB purging can run in a background thread, so all access to the index and storage goes through this lock
+        self.lock = RLock()
+        self._purge = None
+        self._purge_thread = None
+        self._closing = False
 
     @classmethod
-    def build(cls, cache_root_path):
-        if not path.isdir(cache_root_path):
+    def build(cls, cache_root_path, dedup=False, codec='gzip', read_only=False):
+        """
+        Builds a cache in the given directory. If `dedup` is true, response bodies are stored in a `ContentAddressedStorage`,
+        which keeps only one copy of identical bodies, else in a `FlatFileStorage`, with one file per cache key. `codec` is the
+        name of the storage codec that new bodies are written with. If `read_only` is true, the cache must already exist.
+        """
+        if not read_only and not path.isdir(cache_root_path):
             makedirs(cache_root_path)
         shelf_file_name = 'index.shelf'
         if PY2:
@@ -211,58 +302,258 @@ class DiskCache(Cache):
             # share the request data files.
             shelf_file_name = 'index.p2.shelf'
         return cls(
-            index=ShelfIndex(path.join(cache_root_path, shelf_file_name)),
-            storage=FlatFileStorage(cache_root_path),
+            index=ShelfIndex(path.join(cache_root_path, shelf_file_name), read_only),
+            storage=(ContentAddressedStorage if dedup else FlatFileStorage)(cache_root_path, codec, read_only),
+            read_only=read_only,
         )
 
     def get(self, key, min_timestamp):
         # NB In likely usage scenarios, a `get' that returns None will almost always be followed by a `put' to save a fresh entry
         # under the same key, so deleting entries that are present but outdated might actually slow things down. So we don't do it.
-        entry = self.index.lookup(key, min_timestamp)
-        if entry is not None and entry.response is not None:
-            self.storage.load(key, entry)
+        with self.lock:
+            entry = self.index.lookup(key, min_timestamp)
+            if entry is not None and entry.response is not None:
+                self.storage.load(key, entry)
         return entry
 
     def put(self, key, entry):
+        if self.read_only:
+            return
         # NB doing storage first, and only inserting into the index once all data has been saved to disk, ensures that if we're
         # interrupted in between the two we won't end up with an index entry that points to nonexistent data in the storage.
-        insert_in_index = lambda: self.index.insert(key, entry)
+        # Both are done while holding the lock, since the body is only saved once it's been read, which happens in whichever
+        # thread consumes the response, while a purge may be running in another.
+        def save_and_index(save_file):
+            with self.lock:
+                save_file()
+                self.index.insert(key, entry)
         if entry.response is not None:
-            self.storage.store(
-                key,
-                entry.response,
-                on_completion=insert_in_index,
-            )
+            with self.lock:
+                self.storage.store(
+                    key,
+                    entry.response,
+                    on_completion=save_and_index,
+                )
         else:
-            insert_in_index()
-
-    def purge(self, min_timestamp):
-        all_keys = tuple(self.index.keys())
-        for key in all_keys:
-            entry = self.index.lookup(key)
-            if entry is not None and entry.timestamp < min_timestamp:
-                self.discard(key)
+            with self.lock:
+                self.index.insert(key, entry)
+
+    def refresh(self, key, entry):
+        if self.read_only:
+            return
+        with self.lock:
+            self.index.insert(key, entry)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise ValueError("%s is read-only" % self.storage.cache_root_path)
+
+    def purge(self, min_timestamp=None, max_total_bytes=None, time_budget=None):
+        self._check_writable()
+        purge = self._purge
+        if purge is None or purge.completed or (purge.min_timestamp, purge.max_total_bytes) != (min_timestamp, max_total_bytes):
+            purge = self._purge = DiskCachePurge(self, min_timestamp, max_total_bytes)
+        return purge.run(time_budget)
+
+    def start_background_purge(self, min_timestamp=None, max_total_bytes=None, on_done=None):
+        if self.read_only:
+            # NB this is started by the HttpClient when its config asks for purges, which a read-only cache just doesn't do
+            return
+        purge = DiskCachePurge(self, min_timestamp, max_total_bytes)
+        def run():
+            report = purge.run(should_stop=lambda: self._closing)
+            if on_done is not None:
+                on_done(report)
+        self._purge_thread = Thread(target=run, name='alcazar-cache-purge')
+        self._purge_thread.daemon = True
+        self._purge_thread.start()
 
     def discard(self, key):
-        was_present = self.index.delete(key)
-        self.storage.remove(key)
+        self._check_writable()
+        with self.lock:
+            was_present = self.index.delete(key)
+            self.storage.remove(key)
         return was_present
 
+    def export_entry(self, key, min_timestamp=None):
+        """
+        Returns the index entry stored under `key`, without its body, along with the path to the file that holds its body as
+        stored, i.e. still encoded, or None. Returns (None, None) if there is no such entry, or if it's older than `min_timestamp`.
+        """
+        with self.lock:
+            entry = self.index.lookup(key, min_timestamp)
+            file_path = self.storage.stored_file_path(key) if entry is not None and entry.response is not None else None
+        return entry, file_path
+
+    def import_entry(self, key, entry, stored_file=None):
+        """
+        Saves `entry`, as returned by another cache's `export_entry`, under `key`. `stored_file`, if given, is a pair of the body's
+        stored file extension, and a file object from which its data can be read.
+        """
+        self._check_writable()
+        save_file = None
+        if stored_file is not None:
+            extension, file_in = stored_file
+            # NB the data is copied without holding the lock, so that several threads can import at once
+            save_file = self.storage.write_encoded_file(key, extension, file_in)
+        with self.lock:
+            if save_file is not None:
+                save_file()
+            self.index.insert(key, entry)
+
+    def train_dictionary(self, num_samples=1000, dict_size=112640):
+        """
+        Trains a new Zstandard dictionary on a random sample of the bodies in the cache, and makes it the one that the 'zstd+dict'
+        codec compresses new bodies with. Earlier dictionaries are kept, so that the bodies they compressed remain readable.
+        Returns the ID of the new dictionary.
+        """
+        self._check_writable()
+        all_keys = tuple(self.index.keys())
+        samples = []
+        for key in random.sample(all_keys, min(num_samples, len(all_keys))):
+            entry = self.get(key, 0)
+            if entry is None or entry.response is None:
+                continue
+            with closing(entry.response):
+                # NB bodies that were encoded for transport are stored as is, so they're not worth training on
+                if not self.storage._is_transport_encoded(entry.response) and entry.response.content:
+                    samples.append(entry.response.content)
+        if not samples:
+            raise ValueError("No bodies to train a dictionary on")
+        return self.storage.dictionaries.train(samples, dict_size)
+
     def close(self):
+        if self._purge_thread is not None:
+            self._closing = True
+            self._purge_thread.join()
+            self._purge_thread = None
         self.index.close()
+        self.storage.close()
+
+
+class DiskCachePurge(object):
+    """
+    Does the work of `DiskCache.purge` in small steps, each done while holding the cache's lock, so that it can be run in a
+    background thread while the cache is being used, and be interrupted and resumed.
+
+    Entries are first looked up in the index, in random order, and removed if they are older than `min_timestamp`. Then, if
+    `max_total_bytes` is given, the size and last access time of every stored body are listed, and the least recently used ones
+    are removed until the total fits.
+    """
+
+    def __init__(self, cache, min_timestamp=None, max_total_bytes=None):
+        self.cache = cache
+        self.min_timestamp = min_timestamp
+        self.max_total_bytes = max_total_bytes
+        self.num_entries_scanned = 0
+        self.num_entries_removed = 0
+        self.num_bytes_freed = 0
+        self.completed = False
+        self._steps = self._iter_steps()
+
+    def run(self, time_budget=None, should_stop=None):
+        deadline = None if time_budget is None else time() + time_budget
+        for _ in self._steps:
+            if (deadline is not None and time() >= deadline) or (should_stop is not None and should_stop()):
+                break
+        else:
+            self.completed = True
+        return self.report()
+
+    def report(self):
+        return CachePurgeReport(
+            num_entries_scanned=self.num_entries_scanned,
+            num_entries_removed=self.num_entries_removed,
+            num_bytes_freed=self.num_bytes_freed,
+            completed=self.completed,
+        )
+
+    def _iter_steps(self):
+        cache = self.cache
+        if self.min_timestamp is not None:
+            with cache.lock:
+                all_keys = list(cache.index.keys())
+            # NB we go through the keys in random order so that a purge that never gets to complete because its time budget is too
+            # short still makes progress from one run to the next
+            random.shuffle(all_keys)
+            for key in all_keys:
+                with cache.lock:
+                    self.num_entries_scanned += 1
+                    entry = cache.index.lookup(key)
+                    if entry is not None and entry.timestamp < self.min_timestamp:
+                        self._remove(key)
+                yield
+        if self.max_total_bytes is not None:
+            for step in self._iter_eviction_steps():
+                yield step
+        with cache.lock:
+            cache.storage.collect_garbage()
+        yield
+
+    def _iter_eviction_steps(self):
+        cache = self.cache
+        keys_by_file_path = {}
+        usage = cache.storage.iter_usage()
+        while True:
+            with cache.lock:
+                item = next(usage, None)
+            if item is None:
+                break
+            key, file_path = item
+            keys_by_file_path.setdefault(file_path, []).append(key)
+            yield
+        file_stats = []
+        for file_path in keys_by_file_path:
+            try:
+                file_stats.append((path.getmtime(file_path), path.getsize(file_path), file_path))
+            except OSError:
+                pass # removed in the meantime
+            yield
+        # NB the storage updates the mtime of the files it reads, so this is the last access time
+        file_stats.sort()
+        total_bytes = sum(num_bytes for _, num_bytes, _ in file_stats)
+        for last_access, num_bytes, file_path in file_stats:
+            if total_bytes <= self.max_total_bytes:
+                break
+            with cache.lock:
+                try:
+                    is_unchanged = path.getmtime(file_path) == last_access
+                except OSError:
+                    is_unchanged = False
+                if is_unchanged:
+                    for key in keys_by_file_path[file_path]:
+                        self.num_entries_scanned += 1
+                        self._remove(key)
+                    total_bytes -= num_bytes
+            yield
+
+    def _remove(self, key):
+        was_present = self.cache.index.delete(key)
+        num_bytes_freed = self.cache.storage.remove(key)
+        if was_present:
+            self.num_entries_removed += 1
+        self.num_bytes_freed += num_bytes_freed
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class ShelfIndex(object):
     """
-    Stores request.Response objects into a shelf database. The Response objects are modified before being pickled, so that their
-    body content data is not stored in the index (as happens by default when a response object is pickled). Because of this, when
-    Response objects are retrieved from the index, they will be lacking their content data.
+    Stores cache entries into a shelf database. Each response is saved as a `CacheRecord`, pickled separately from the entry's
+    timestamp, so that looking up an entry that turns out to be stale only unpickles a small tuple, and the requests.Response
+    object is only built for entries that are fresh. The response's body content data is not stored in the index, so the Response
+    objects retrieved from the index will be lacking it.
+
+    Entries that hold an exception, which may itself refer to the response, are pickled whole, as were all entries written by
+    earlier versions, which can still be read.
     """
 
-    def __init__(self, file_path):
+    # Marks the values that are in the record format, i.e. `(record_format, timestamp, pickled_record)`
+    record_format = 'alcazar-record-1'
+
+    def __init__(self, file_path, read_only=False):
         self.file_path = file_path
-        # NB only open DB file on demand, as it opens it exclusively
+        self.read_only = read_only
+        # NB only open DB file on demand, as it opens it exclusively, unless it's read-only
         self._db = None
 
     @property
@@ -271,7 +562,7 @@ class ShelfIndex(object):
             try:
                 self._db = shelve.open(
                     self.file_path,
-                    'c',
+                    'r' if self.read_only else 'c',
                     protocol=pickle.HIGHEST_PROTOCOL,
                 )
             except Exception:
@@ -292,23 +583,92 @@ class ShelfIndex(object):
         return tuple(parsed)
 
     def lookup(self, key, min_timestamp=None):
-        entry = self.db.get(self._key_to_string(key))
-        # logging.debug(
-        #     "Cache[%r] entry is %s",
-        #     key,
-        #     'None' if entry is None
-        #     else 'stale (%d, min=%d)' % (entry.timestamp, min_timestamp) if entry.timestamp < (min_timestamp or 0)
-        #     else 'fresh (%d, min=%s)' % (entry.timestamp, min_timestamp)
-        # )
-        if entry is not None and entry.timestamp >= (min_timestamp or 0):
-            return entry
+        value = self.db.get(self._key_to_string(key))
+        if value is None:
+            return None
+        if isinstance(value, tuple) and value[0] == self.record_format:
+            _, timestamp, pickled_record = value
+            if timestamp < (min_timestamp or 0):
+                return None
+            return self._record_to_entry(CacheRecord(*pickle.loads(pickled_record)), timestamp)
+        if value.timestamp >= (min_timestamp or 0):
+            return value
         else:
             return None
 
     def insert(self, key, entry):
+        if entry.response is not None and entry.exception is None:
+            pickled_record = pickle.dumps(tuple(self._entry_to_record(entry)), protocol=pickle.HIGHEST_PROTOCOL)
+            self.db[self._key_to_string(key)] = (self.record_format, entry.timestamp, pickled_record)
+            return
         with self._modify_for_pickling(entry):
             self.db[self._key_to_string(key)] = entry
 
+    @classmethod
+    def _entry_to_record(cls, entry):
+        return cls._response_to_record(entry.response, entry.raw_headers)
+
+    @classmethod
+    def _response_to_record(cls, response, raw_headers=None, content=None):
+        request = response.request
+        headers = raw_headers if raw_headers is not None else response.headers
+        return CacheRecord(
+            status=response.status_code,
+            reason=response.reason,
+            url=response.url,
+            headers=list(getattr(headers, 'iteritems', headers.items)()),
+            encoding=response.encoding,
+            request_method=request.method if request is not None else None,
+            request_url=request.url if request is not None else None,
+            request_headers=list(request.headers.items()) if request is not None else [],
+            request_body=request.body if request is not None and isinstance(request.body, (bytes, text_type)) else None,
+            history=tuple(
+                tuple(cls._response_to_record(
+                    previous,
+                    # NB the raw headers keep repeated headers, e.g. Set-Cookie, which the parsed ones merge
+                    raw_headers=getattr(previous.raw, 'headers', None),
+                    # NB requests reads the body of every redirect it follows, so it's normally there
+                    content=previous._content if isinstance(previous._content, bytes) else None,
+                ))
+                for previous in response.history
+            ),
+            elapsed=response.elapsed.total_seconds() if response.elapsed is not None else None,
+            content=content,
+        )
+
+    @classmethod
+    def _record_to_entry(cls, record, timestamp):
+        response, headers = cls._record_to_response(record)
+        return CacheEntry(response=response, exception=None, timestamp=timestamp, raw_headers=headers)
+
+    @classmethod
+    def _record_to_response(cls, record):
+        headers = urllib3._collections.HTTPHeaderDict()
+        for name, value in record.headers:
+            headers.add(name, value)
+        request = requests.PreparedRequest()
+        request.method = record.request_method
+        request.url = record.request_url
+        request.headers = requests.structures.CaseInsensitiveDict(record.request_headers)
+        request.body = record.request_body
+        # NB this does the same as requests.adapters.HTTPAdapter.build_response, save for the `raw` object, which is left for the
+        # storage to build
+        response = CachedResponse()
+        response.status_code = record.status
+        response.reason = record.reason
+        response.url = record.url
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.encoding = record.encoding
+        response.request = request
+        response._cookies_pending = 'Set-Cookie' in headers
+        response.history = [cls._record_to_response(CacheRecord(*previous))[0] for previous in record.history]
+        if record.elapsed is not None:
+            response.elapsed = timedelta(seconds=record.elapsed)
+        if record.content is not None:
+            response._content = record.content
+            response._content_consumed = True
+        return response, headers
+
     @contextmanager
     def _modify_for_pickling(self, entry):
         previous = {}
@@ -334,230 +694,28 @@ class ShelfIndex(object):
             self._db.close()
             self._db = None
 
-#----------------------------------------------------------------------------------------------------------------------------------
-
-class FlatFileStorage(object):
-    """
-    Stores response body content data to disk. The data that gets written to disk is pre-decoding, so if the server gzips data for
-    transport (as most web servers do), we'll store that gzipped data to disk.
-    """
-
-    def __init__(self, cache_root_path):
-        self.cache_root_path = cache_root_path
-
-    def _file_path(self, key):
-        if not (
-                isinstance(key, tuple)
-                and all(isinstance(e, text_type) for e in key)
-                ):
-            raise ValueError("Invalid cache key: %r" % key)
-        return path.join(self.cache_root_path, *key) + '.gz'
-
-    @staticmethod
-    def _open_local_file(response, file_path, mode):
-        # If the response does not have an encoding, we use the 'gzip' module, so that the data is stored to disk in compressed
-        # format
-        content_encoding = response.headers.get('Content-Encoding')
-        if content_encoding is None or content_encoding == 'identity':
-            opener = gzip.open
-        else:
-            opener = open
-            mode += 'b'
-        return opener(file_path, mode)
-
-    def load(self, key, entry):
-        file_path = self._file_path(key)
-        response = entry.response
-        response.raw = urllib3.HTTPResponse(
-            # The data that we write to disk is pre-decoding, which is good because it means in most cases we can have a gzipped
-            # cache without expanding CPU cycles for it. However it means that in order to provide the user with decoded data, we
-            # need to recreate an HTTPResponse object, since that's the object doing the decoding. Trying to pickle that got messy,
-            # so we reconstruct it like this, which isn't pretty, but works.
-            headers=urllib3._collections.HTTPHeaderDict(entry.raw_headers if entry.raw_headers is not None else response.headers),
-            status=response.status_code,
-            reason=response.reason,
-            request_method=response.request.method,
-            preload_content=False,
-            decode_content=False,
-            body=AutoClosingFile(self._open_local_file(response, file_path, 'r')),
-        )
-        response.raw._original_response = MockedHttplibResponse(response.raw)
-        response._content_consumed = False
-        response._content = False
-
-    def store(self, key, response, on_completion):
-        file_path = self._file_path(key)
-        if not path.isdir(path.dirname(file_path)):
-            makedirs(path.dirname(file_path))
-        assert not response._content_consumed, response._content
-        if response.raw.chunked:
-            # 2017-08-19 - chunked responses can't be streamed to the user and cached simultaneously with the same StreamTee trick
-            # that we use below for other responses. This dichotomy is a bit ugly, though, and I'm starting to think a better
-            # solution is needed. This works for now, but I think the whole thing needs refactored at some point.
-            self._first_download_then_read_from_cache(file_path, response, on_completion)
-        else:
-            self._download_and_save_to_cache_simultaneously(file_path, response, on_completion)
-
-    def _first_download_then_read_from_cache(self, file_path, response, on_completion):
-        with self._open_local_file(response, file_path, 'w') as cache_out:
-            for chunk in response.raw.stream(decode_content=False):
-                cache_out.write(chunk)
-        on_completion()
-        response.raw.chunked = False
-        response.raw._fp = self._open_local_file(response, file_path, 'r')
-
-    def _download_and_save_to_cache_simultaneously(self, file_path, response, on_completion):
-        part_file_path = file_path + '.part'
-        response.raw._fp.fp = StreamTee(
-            source=response.raw._fp.fp,
-            sink=self._open_local_file(response, part_file_path, 'w'),
-            length=response.raw._fp.length,
-            on_completion=lambda: [
-                rename(part_file_path, file_path),
-                on_completion(),
-            ],
-        )
-
-    def remove(self, key):
-        file_path = self._file_path(key)
-        if path.isfile(file_path):
-            unlink(file_path)
-        self._remove_empty_directories(path.dirname(file_path))
-
-    def _remove_empty_directories(self, dir_path):
-        while dir_path != self.cache_root_path:
-            try:
-                rmdir(dir_path)
-            except OSError:
-                break # we'll assume it wasn't empty
-            dir_path = path.dirname(dir_path)
-
-
-class MockedHttplibResponse(object):
-    """
-    Wherein we realise that under the requests library's respectable and elegant interface is a matryoshka of HTTP libraries,
-    several layers deep, peppered with a generous amount of backwards compatibility and other hacks.
 
-    We need this for requests' `extract_cookies_to_jar` to work.
+class CachedResponse(requests.Response): # all the attributes of a Response, pylint: disable=too-many-instance-attributes
     """
-
-    def __init__(self, urllib3_response):
-        self.msg = email.message.Message()
-        self.msg._headers = list(urllib3_response.headers.items())
-        self.msg.getheaders = partial(self.msg.get_all, failobj=[])
-
-    def isclosed(self):
-        return True
-
-
-class StreamTee(object):
+    A requests.Response rebuilt from a `CacheRecord`. Its `cookies` are only parsed from the headers when first used, since that
+    costs more than all the rest of rebuilding the response, and it's seldom needed.
     """
-    Readable file-like object that simply wraps around another file object (the "source") and pipes its data through, unmodified;
-    every time some data is read, however, we also write it so a separate file (the "sink"). This allows us to save to cache
-    streamed HTTP responses, without having to load the data to memory.
-    """
-
-    def __init__(self, source, sink, length, on_completion):
-        self.source = source
-        self.sink = sink
-        self.remaining = length
-        self.on_completion = on_completion
-
-    def read(self, *args):
-        chunk = self.source.read(*args)
-        self.sink.write(chunk)
-        want_everything = not args or (args[0] in (-1, None))
-        if self.remaining is not None:
-            self.remaining -= len(chunk)
-        if want_everything or not chunk or self.remaining == 0:
-            self._complete()
-        return chunk
-
-    def readinto(self, b):
-        n = self.source.readinto(b)
-        self.sink.write(b[:n])
-        if self.remaining is not None:
-            self.remaining -= n
-        if n == 0 or self.remaining == 0:
-            self._complete()
-        return n
-
-    # def readline(self, size=-1):
-    #     line = self.source.readline(size)
-    #     self.sink.write(line)
-    #     if self.remaining is not None:
-    #         self.remaining -= len(line)
-    #         if self.remaining == 0:
-    #             self._complete()
-    #     return line
-
-    def flush(self):
-        self.source.flush()
-        self.sink.flush()
-
-    def close(self):
-        self.source.close()
-        self.sink.close()
-
-    @property
-    def closed(self):
-        return self.source.closed
-
-    def _complete(self):
-        if self.on_completion is not None:
-            self.on_completion()
-            self.on_completion = None
-
-
-class AutoClosingFile(object):
-    """
-    Readable file-like object that closes automatically once its data is exhausted.
-    """
-
-    def __init__(self, wrapped):
-        self.wrapped = wrapped
 
-    def read(self, *args):
-        chunk = self.wrapped.read(*args)
-        want_everything = not args or (args[0] in (-1, None))
-        if want_everything or not chunk:
-            self.close()
-        return chunk
-
-    def stream(self, *args, **kwargs):
-        for chunk in self.wrapped.stream(*args, **kwargs):
-            yield chunk
-        self.close()
-
-    def close(self):
-        if not self.wrapped.closed:
-            self.wrapped.close()
+    _cookies = None
+    _cookies_pending = False
 
     @property
-    def closed(self):
-        return self.wrapped.closed
-
-#----------------------------------------------------------------------------------------------------------------------------------
-
-class NullCache(Cache):
-    """
-    Cache that does not cache. It makes the code lighter to use this when the client is configured without a cache, than to have
-    if/else checks throughout.
-    """
-
-    def get(self, key, min_timestamp):
-        pass
-
-    def put(self, key, entry):
-        pass
-
-    def discard(self, key):
-        return False
-
-    def purge(self, min_timestamp):
-        pass
-
-    def close(self):
-        pass
+    def cookies(self):
+        if self._cookies_pending:
+            self._cookies_pending = False
+            cookie_source = urllib3.HTTPResponse(headers=self.headers, preload_content=False)
+            cookie_source._original_response = MockedHttplibResponse(cookie_source)
+            requests.cookies.extract_cookies_to_jar(self._cookies, self.request, cookie_source)
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, cookies):
+        self._cookies = cookies
+        self._cookies_pending = False
 
 #----------------------------------------------------------------------------------------------------------------------------------
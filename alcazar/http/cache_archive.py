@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from base64 import b64decode, b64encode
+from functools import partial
+from io import BytesIO
+import json
+from multiprocessing.pool import ThreadPool
+from os import fstat, path
+import tarfile
+from time import time
+
+# alcazar
+from ..utils.compatibility import pickle, urlparse
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# globals
+
+# Bodies up to this size are read to memory by the worker threads. Larger ones are streamed straight between the disk and the
+# archive by the main thread.
+MAX_BUFFERED_BODY_SIZE = 1024 * 1024
+
+# How many entries are handed to the worker threads at a time, per thread. Along with the above, this bounds memory usage.
+BATCH_SIZE_PER_THREAD = 16
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# export
+
+def export_cache(cache, file_out, hosts=None, key_prefix=None, min_timestamp=None, num_threads=4):
+    """
+    Writes the entries of `cache`, a `DiskCache`, to `file_out`, as an uncompressed tar stream. For every entry, the archive holds
+    a JSON record named `entries/<key>.json`, immediately followed, if the entry has a body, by the body data exactly as it is
+    stored on disk, i.e. still compressed, named `bodies/<key><extension>`.
+
+    If `hosts` is given, only the entries whose URL's host is in it are exported. Likewise, if `key_prefix` is given, only those
+    whose key, joined with slashes, starts with it, and if `min_timestamp` is given, only those that are no older than that.
+
+    Entries are read from disk by `num_threads` threads, while the archive is written sequentially, which is what keeps it
+    streamable. Returns the number of entries exported.
+    """
+    with cache.lock:
+        all_keys = [
+            key
+            for key in cache.index.keys()
+            if key_prefix is None or '/'.join(key).startswith(key_prefix)
+        ]
+    num_exported = 0
+    pool = ThreadPool(num_threads)
+    try:
+        with tarfile.open(fileobj=file_out, mode='w|', format=tarfile.PAX_FORMAT) as archive:
+            for batch in _iter_batches(all_keys, num_threads * BATCH_SIZE_PER_THREAD):
+                for exported in pool.map(partial(_read_entry, cache, hosts, min_timestamp), batch):
+                    if exported is not None:
+                        _write_entry(archive, *exported)
+                        num_exported += 1
+    finally:
+        pool.close()
+        pool.join()
+    return num_exported
+
+
+def _read_entry(cache, hosts, min_timestamp, key):
+    entry, file_path = cache.export_entry(key, min_timestamp)
+    if entry is None:
+        return None
+    if hosts is not None:
+        url = entry.response.url if entry.response is not None else None
+        if url is None or urlparse(url).hostname not in hosts:
+            return None
+    body = None
+    if file_path is not None and path.getsize(file_path) <= MAX_BUFFERED_BODY_SIZE:
+        with open(file_path, 'rb') as file_in:
+            body = file_in.read()
+    return key, entry, file_path, body
+
+
+def _write_entry(archive, key, entry, file_path, body):
+    key_path = '/'.join(key)
+    record = {
+        'key': list(key),
+        'timestamp': entry.timestamp,
+        'url': entry.response.url if entry.response is not None else None,
+        'status': entry.response.status_code if entry.response is not None else None,
+        'body': None if file_path is None else 'bodies/%s%s' % (key_path, path.splitext(file_path)[1]),
+        'entry': b64encode(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)).decode('us-ascii'),
+    }
+    record_bytes = json.dumps(record, sort_keys=True).encode('UTF-8')
+    _add_member(archive, 'entries/%s.json' % key_path, BytesIO(record_bytes), len(record_bytes))
+    if body is not None:
+        _add_member(archive, record['body'], BytesIO(body), len(body))
+    elif file_path is not None:
+        with open(file_path, 'rb') as file_in:
+            _add_member(archive, record['body'], file_in, fstat(file_in.fileno()).st_size)
+
+
+def _add_member(archive, name, file_in, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time())
+    archive.addfile(info, file_in)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# import
+
+def import_cache(cache, file_in, num_threads=4):
+    """
+    Reads an archive written by `export_cache` from `file_in`, and saves its entries to `cache`, a `DiskCache`, replacing any
+    entries that it already has under the same keys. The bodies are stored as they are in the archive, so they keep the codec they
+    were written with in the original cache. The entries are written to disk by `num_threads` threads. Returns the number of
+    entries imported.
+
+    The records in the archive hold pickled objects, so as with the cache index itself, only import archives that you trust.
+    """
+    num_imported = 0
+    pool = ThreadPool(num_threads)
+    pending = []
+    try:
+        with tarfile.open(fileobj=file_in, mode='r|*') as archive:
+            members = iter(archive)
+            for member in members:
+                if not member.name.startswith('entries/'):
+                    raise ValueError("Malformed cache archive: unexpected member %r" % member.name)
+                record = json.loads(archive.extractfile(member).read().decode('UTF-8'))
+                key = tuple(record['key'])
+                entry = pickle.loads(b64decode(record['entry']))
+                stored_file = None
+                if record['body'] is not None:
+                    body_member = next(members, None)
+                    if body_member is None or body_member.name != record['body']:
+                        raise ValueError("Malformed cache archive: expected %r after %r" % (record['body'], member.name))
+                    extension = path.splitext(body_member.name)[1]
+                    body_file = archive.extractfile(body_member)
+                    if body_member.size > MAX_BUFFERED_BODY_SIZE:
+                        # NB this must be read before we move on to the next member, so it can't be handed to the pool
+                        cache.import_entry(key, entry, (extension, body_file))
+                        num_imported += 1
+                        continue
+                    stored_file = (extension, BytesIO(body_file.read()))
+                pending.append(pool.apply_async(cache.import_entry, (key, entry, stored_file)))
+                num_imported += 1
+                if len(pending) >= num_threads * BATCH_SIZE_PER_THREAD:
+                    _wait_for_all(pending)
+            _wait_for_all(pending)
+    finally:
+        pool.close()
+        pool.join()
+    return num_imported
+
+
+def _wait_for_all(pending):
+    for result in pending:
+        result.get() # NB this raises any exception raised by the worker
+    del pending[:]
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# utils
+
+def _iter_batches(items, batch_size):
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from collections import namedtuple
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# data structures
+
+class CacheEntry(namedtuple('CacheEntry', (
+        'response',
+        'exception',
+        'timestamp',
+        'raw_headers',
+        ))):
+
+    def __new__(cls, response, exception, timestamp, raw_headers=None):
+        return super(CacheEntry, cls).__new__(cls, response, exception, timestamp, raw_headers)
+
+
+class CachePurgeReport(namedtuple('CachePurgeReport', (
+        'num_entries_scanned',
+        'num_entries_removed',
+        'num_bytes_freed',
+        'completed',
+        ))):
+    pass
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class Cache(object):
+    """ Abstract base class for HTTP cache implementations """
+
+    def get(self, key, min_timestamp):
+        """
+        Looks up an entry in the cache by key, and returns it. Entries with a timestamp less than `min_timestamp` are ignored.
+        """
+        raise NotImplementedError
+
+    def put(self, key, entry):
+        """
+        Saves an entry in the cache, under the given key
+        """
+        raise NotImplementedError
+
+    def refresh(self, key, entry):
+        """
+        Updates the metadata (timestamp and headers) of an entry that's already in the cache, after it's been revalidated, leaving
+        its stored body untouched. Does nothing by default, which only means the entry will be revalidated again next time.
+        """
+
+    def discard(self, key):
+        """
+        Removed an entry from the cache, if present. Returns a bool indicating whether the entry was present in the cache.
+        """
+        raise NotImplementedError
+
+    def purge(self, min_timestamp=None, max_total_bytes=None, time_budget=None): # pylint: disable=unused-argument
+        """
+        Removes from the cache all entries whose `timestamp` is less than the given min_timestamp, if any, and then, if
+        `max_total_bytes` is given, the least recently used entries until the stored data fits in that many bytes. If
+        `time_budget` is given, stops after roughly that many seconds, in which case calling `purge` again with the same arguments
+        resumes the work. Returns a `CachePurgeReport`.
+
+        Only `DiskCache` supports purging. This default implementation, which `WarcCache` and `NullCache` use, ignores all of its
+        arguments, removes nothing, and reports an empty purge that completed, so `max_cache_life` and `max_cache_bytes` have no
+        effect on those caches.
+        """
+        return CachePurgeReport(0, 0, 0, completed=True)
+
+    def start_background_purge(self, min_timestamp=None, max_total_bytes=None, on_done=None):
+        """
+        Same as `purge`, but for caches that support it, the work is done in a background thread, so that requests can be served in
+        the meantime. `on_done`, if given, is called with the `CachePurgeReport` once finished. By default this just calls `purge`.
+        """
+        report = self.purge(min_timestamp, max_total_bytes)
+        if on_done is not None:
+            on_done(report)
+
+    def close(self):
+        """
+        Closes any open resources such as file handles. The cache will not be used after it has been closed.
+        """
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class NullCache(Cache):
+    """
+    Cache that does not cache. It makes the code lighter to use this when the client is configured without a cache, than to have
+    if/else checks throughout.
+    """
+
+    def get(self, key, min_timestamp):
+        pass
+
+    def put(self, key, entry):
+        pass
+
+    def refresh(self, key, entry):
+        pass
+
+    def discard(self, key):
+        return False
+
+    def purge(self, min_timestamp=None, max_total_bytes=None, time_budget=None):
+        return CachePurgeReport(0, 0, 0, completed=True)
+
+    def close(self):
+        pass
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from hashlib import md5
+try:
+    from hashlib import blake2b
+except ImportError:
+    blake2b = NotImplemented # pylint: disable=invalid-name
+
+# alcazar
+from ..utils.compatibility import text_type
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# schemes
+
+class CacheKeyScheme(object):
+    """
+    Computes the key under which the response to a request is cached. Keys are tuples of strings; with a `DiskCache`, all but the
+    last string are the names of the nested directories in which the response's file is saved, which spreads the files out over
+    enough directories that none of them gets too large.
+    """
+
+    name = None
+
+    def compute(self, method, url, body, cache_key_salt=None):
+        raise NotImplementedError
+
+    def legacy_keys(self, method, url, body, cache_key_salt=None): # pylint: disable=unused-argument,no-self-use
+        """
+        Returns the keys under which other schemes would have cached the same request, which are looked up when the cache has
+        nothing under the key that `compute` returns, so that the responses cached before the scheme was changed can still be used.
+        """
+        return ()
+
+
+class Md5KeyScheme(CacheKeyScheme):
+    """
+    The scheme that has always been used, and the default, so that existing caches keep working. It hashes the `repr` of each
+    part of the request, which for large request bodies is wasteful, and the keys are spread over 4096 directories.
+    """
+
+    name = 'md5'
+
+    def compute(self, method, url, body, cache_key_salt=None):
+        # Notes on the use of md5 rather than something stronger:
+        # * MD5 hashes are comparatively short, which is convenient when logging and debugging
+        # * experience shows it's plenty good enough
+        parts = [
+            method,
+            url,
+            body,
+        ]
+        if cache_key_salt is not None:
+            parts.append(cache_key_salt)
+        hexdigest = md5(b''.join(
+            repr(part).encode('UTF-8')
+            for part in parts
+        )).hexdigest()
+        hexdigest = text_type(hexdigest)
+        return (hexdigest[:3], hexdigest[3:])
+
+
+class Blake2KeyScheme(CacheKeyScheme):
+    """
+    Hashes the bytes of the request with BLAKE2b, feeding the body to the hash as is, so that it's neither copied nor re-encoded.
+
+    The key has `fan_out_depth` levels of directories, each named after two hex digits of the hash, so 256 directories per level,
+    which is plenty for a million entries with the default depth of 2. Since the hash is uniform, the directories fill up evenly.
+    """
+
+    name = 'blake2b'
+
+    def __init__(self, fan_out_depth=2, digest_size=16):
+        self.fan_out_depth = fan_out_depth
+        self.digest_size = digest_size
+
+    def compute(self, method, url, body, cache_key_salt=None):
+        _check_blake2()
+        hasher = blake2b(digest_size=self.digest_size)
+        for part in (method, url, body, cache_key_salt):
+            _update_with_part(hasher, part)
+        hexdigest = text_type(hasher.hexdigest())
+        split = 2 * self.fan_out_depth
+        return tuple(hexdigest[i:i+2] for i in range(0, split, 2)) + (hexdigest[split:],)
+
+
+class FallbackKeyScheme(CacheKeyScheme):
+    """
+    Computes keys with `scheme`, but also looks up the keys of the `fallbacks` schemes when a key isn't found. This is how a cache
+    can be switched to a new scheme without losing its contents: entries that were cached under the old keys are still found, and
+    entries cached from then on get the new keys.
+    """
+
+    def __init__(self, scheme, fallbacks):
+        self.scheme = scheme
+        self.fallbacks = fallbacks
+
+    @property
+    def name(self):
+        return '+'.join(scheme.name for scheme in [self.scheme] + list(self.fallbacks))
+
+    def compute(self, method, url, body, cache_key_salt=None):
+        return self.scheme.compute(method, url, body, cache_key_salt)
+
+    def legacy_keys(self, method, url, body, cache_key_salt=None):
+        return [
+            fallback.compute(method, url, body, cache_key_salt)
+            for fallback in self.fallbacks
+        ]
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+def build_cache_key_scheme(scheme):
+    """
+    Returns the `CacheKeyScheme` for the given `cache_key_scheme` config value, which is either a `CacheKeyScheme` instance, or the
+    name of one: "md5", "blake2b", or "blake2b+md5" for BLAKE2b keys that fall back to looking up MD5 keys.
+    """
+    if isinstance(scheme, CacheKeyScheme):
+        return scheme
+    if scheme == Md5KeyScheme.name:
+        return Md5KeyScheme()
+    if scheme == Blake2KeyScheme.name:
+        return Blake2KeyScheme()
+    if scheme == '%s+%s' % (Blake2KeyScheme.name, Md5KeyScheme.name):
+        return FallbackKeyScheme(Blake2KeyScheme(), [Md5KeyScheme()])
+    raise ValueError("Unknown cache key scheme: %r" % (scheme,))
+
+
+def _update_with_part(hasher, part):
+    if part is None:
+        hasher.update(b'-')
+        return
+    if isinstance(part, bytes):
+        data = part
+    elif isinstance(part, text_type):
+        data = part.encode('UTF-8')
+    else:
+        # NB e.g. a salt that's not a string
+        data = repr(part).encode('UTF-8')
+    # NB each part is prefixed with its length, else moving bytes from the end of one part to the start of the next would give the
+    # same hash
+    hasher.update(('%d:' % len(data)).encode('ascii'))
+    hasher.update(data)
+
+
+def _check_blake2():
+    if blake2b is NotImplemented:
+        raise NotImplementedError("BLAKE2 cache keys require Python 3.6 or above")
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,629 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# We access a lot of properties whose name starts with an underscore in here, e.g. ._fp -- pylint: disable=protected-access
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import email.message
+from functools import partial
+from hashlib import md5, sha256
+import json
+from os import path, makedirs, rename, rmdir, sep, unlink, utime, walk
+import shelve
+from shutil import copyfileobj
+
+# 3rd parties
+try:
+    from requests.packages import urllib3
+except ImportError:
+    import urllib3
+
+# alcazar
+from ..utils.compatibility import native_string, text_type
+from .storage_codecs import RawCodec, ZstdCodec, build_storage_codecs
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# storages
+
+class FlatFileStorage(object):
+    """
+    Stores response body content data to disk. The data that gets written to disk is pre-decoding, so if the server gzips data for
+    transport (as most web servers do), we'll store that gzipped data to disk. Bodies that were not encoded for transport are
+    encoded with the storage `codec` (see `storage_codecs.py`), which by default gzips them.
+    """
+
+    def __init__(self, cache_root_path, codec='gzip', read_only=False):
+        self.cache_root_path = cache_root_path
+        self.read_only = read_only
+        self.codec, self.codecs_by_extension = build_storage_codecs(codec, cache_root_path)
+        self.dictionaries = self.codecs_by_extension[ZstdCodec.extension].dictionaries
+
+    def _base_path(self, key):
+        if not (
+                isinstance(key, tuple)
+                and all(isinstance(e, text_type) for e in key)
+                ):
+            raise ValueError("Invalid cache key: %r" % key)
+        return path.join(self.cache_root_path, *key)
+
+    def _part_file_path(self, key, codec):
+        return self._base_path(key) + codec.extension + '.part'
+
+    def _find_file(self, base_path):
+        """
+        Returns the path to the file that holds the data saved under `base_path`, whichever codec it was written with.
+        """
+        for extension in [self.codec.extension] + sorted(self.codecs_by_extension):
+            if path.isfile(base_path + extension):
+                return base_path + extension
+        # NB if there is no file, opening the default path will raise the appropriate error
+        return base_path + self.codec.extension
+
+    def _remove_files(self, base_path, except_file_path=None):
+        num_bytes_freed = 0
+        for extension in self.codecs_by_extension:
+            file_path = base_path + extension
+            if file_path != except_file_path and path.isfile(file_path):
+                num_bytes_freed += path.getsize(file_path)
+                unlink(file_path)
+        return num_bytes_freed
+
+    @staticmethod
+    def _is_transport_encoded(response):
+        content_encoding = response.headers.get('Content-Encoding')
+        return content_encoding is not None and content_encoding != 'identity'
+
+    def _writing_codec(self, response):
+        if self._is_transport_encoded(response):
+            return self.codecs_by_extension[RawCodec.extension]
+        return self.codec
+
+    def _open_for_reading(self, response, file_path):
+        if self._is_transport_encoded(response):
+            # NB the data of transport-encoded responses is always saved as is, even in files that have a codec's extension, as
+            # was done by earlier versions
+            return open(file_path, 'rb')
+        return self.codecs_by_extension[path.splitext(file_path)[1]].open_reader(file_path)
+
+    def load(self, key, entry):
+        self._load_file(self._find_file(self._base_path(key)), entry)
+
+    def stored_file_path(self, key):
+        """
+        Returns the path to the file that holds the data stored under `key`, as encoded by its codec, or None if there is none.
+        """
+        file_path = self._find_file(self._base_path(key))
+        return file_path if path.isfile(file_path) else None
+
+    def _load_file(self, file_path, entry):
+        try:
+            # NB we bump the file's mtime, so that purging can tell which entries were least recently used
+            if not self.read_only:
+                utime(file_path, None)
+        except OSError:
+            pass # the file's missing, opening it will raise
+        response = entry.response
+        response.raw = urllib3.HTTPResponse(
+            # The data that we write to disk is pre-decoding, which is good because it means in most cases we can have a gzipped
+            # cache without expanding CPU cycles for it. However it means that in order to provide the user with decoded data, we
+            # need to recreate an HTTPResponse object, since that's the object doing the decoding. Trying to pickle that got messy,
+            # so we reconstruct it like this, which isn't pretty, but works.
+            headers=urllib3._collections.HTTPHeaderDict(entry.raw_headers if entry.raw_headers is not None else response.headers),
+            status=response.status_code,
+            reason=response.reason,
+            request_method=response.request.method,
+            preload_content=False,
+            decode_content=False,
+            body=AutoClosingFile(self._open_for_reading(response, file_path)),
+        )
+        response.raw._original_response = MockedHttplibResponse(response.raw)
+        response._content_consumed = False
+        response._content = False
+
+    def store(self, key, response, on_completion):
+        """
+        Arranges for the body of `response` to be saved under `key` as it gets read. Once it's all been written to a temporary
+        file, `on_completion` is called with a function that moves that file into place, which it must call while holding the
+        cache's lock, as it modifies the storage.
+        """
+        assert not response._content_consumed, response._content
+        codec = self._writing_codec(response)
+        part_file_path = self._part_file_path(key, codec)
+        if not path.isdir(path.dirname(part_file_path)):
+            makedirs(path.dirname(part_file_path))
+        sink = self._open_sink(codec, part_file_path)
+        def complete():
+            # NB the codec may only write out its last bytes when closed, and the file must be whole before it's moved into place
+            sink.close()
+            on_completion(partial(self._save_part_file, key, codec, part_file_path, sink))
+        tee_response_body(response, sink, complete)
+
+    def write_encoded_file(self, key, extension, file_in):
+        """
+        Writes data read from `file_in`, which is already encoded with the codec that has the given file extension (e.g. data
+        copied from another cache's `stored_file_path`), to a temporary file. Returns a function that must then be called to
+        store that data under `key`. Only that second step modifies the storage, so only it needs to hold the cache's lock.
+        """
+        codec = self.codecs_by_extension[extension]
+        part_file_path = self._part_file_path(key, codec)
+        if not path.isdir(path.dirname(part_file_path)):
+            try:
+                makedirs(path.dirname(part_file_path))
+            except OSError:
+                # another thread might have just created it
+                if not path.isdir(path.dirname(part_file_path)):
+                    raise
+        with self._open_sink(codec, part_file_path, is_encoded=True) as sink:
+            copyfileobj(file_in, sink)
+        return lambda: self._save_part_file(key, codec, part_file_path, sink)
+
+    def _open_sink(self, codec, part_file_path, is_encoded=False): # pylint: disable=no-self-use
+        if is_encoded:
+            return open(part_file_path, 'wb')
+        return codec.open_writer(part_file_path)
+
+    def _save_part_file(self, key, codec, part_file_path, sink): # pylint: disable=unused-argument
+        """
+        Called once all of the body data has been written to `sink`, moves the data to its final location, and returns its path.
+        """
+        base_path = self._base_path(key)
+        file_path = base_path + codec.extension
+        rename(part_file_path, file_path)
+        # If the key was previously stored with another codec, that file must go, else it might get read instead of this one
+        self._remove_files(base_path, except_file_path=file_path)
+        return file_path
+
+    def remove(self, key):
+        """
+        Removes the data stored under `key`, if any, and returns the number of bytes freed.
+        """
+        base_path = self._base_path(key)
+        num_bytes_freed = self._remove_files(base_path)
+        self._remove_empty_directories(path.dirname(base_path))
+        return num_bytes_freed
+
+    def _remove_empty_directories(self, dir_path):
+        while dir_path != self.cache_root_path:
+            try:
+                rmdir(dir_path)
+            except OSError:
+                break # we'll assume it wasn't empty
+            dir_path = path.dirname(dir_path)
+
+    # Subdirectories of the cache root that don't contain flat files
+    reserved_dir_names = ('bodies', 'dictionaries')
+
+    def iter_usage(self):
+        """
+        Yields a `(key, file_path)` pair for every stored body.
+        """
+        for dir_path, dir_names, file_names in walk(self.cache_root_path):
+            if dir_path == self.cache_root_path:
+                dir_names[:] = [name for name in dir_names if name not in self.reserved_dir_names]
+                key_prefix = ()
+            else:
+                key_prefix = tuple(path.relpath(dir_path, self.cache_root_path).split(sep))
+            for file_name in file_names:
+                base_name, extension = path.splitext(file_name)
+                if extension in self.codecs_by_extension:
+                    yield key_prefix + (base_name,), path.join(dir_path, file_name)
+
+    def collect_garbage(self):
+        """
+        Deletes any stored data that is no longer needed. Flat files are deleted as soon as their key is removed, so there's never
+        anything to do here.
+        """
+
+    def close(self):
+        pass
+
+
+class ContentAddressedStorage(FlatFileStorage):
+    """
+    Storage that saves every distinct response body only once, in a file named after a hash of its contents, so that URLs that
+    return byte-identical bodies (error pages, URLs that only differ by some tracking parameter, mirrored listings) all share a
+    single file on disk. A `BodyRefCounts` shelf records which body each cache key points to, and how many keys point to each body.
+    A body file is deleted as soon as no key points to it anymore.
+
+    Bodies saved by a `FlatFileStorage` in the same directory remain readable, so an existing cache can be switched to this
+    storage without being emptied first. Flat files are replaced by shared ones as their keys get stored anew.
+    """
+
+    def __init__(self, cache_root_path, codec='gzip', read_only=False):
+        super(ContentAddressedStorage, self).__init__(cache_root_path, codec, read_only)
+        self.bodies_root_path = path.join(cache_root_path, 'bodies')
+        self.refs = BodyRefCounts(path.join(cache_root_path, 'bodies.shelf'), read_only)
+
+    def _body_base_path(self, digest):
+        return path.join(self.bodies_root_path, digest[:2], digest[2:])
+
+    def _part_file_path(self, key, codec):
+        # NB we don't know where the body is going to be stored until we've seen all of it
+        key_digest = md5(BodyRefCounts.key_to_string(key).encode('UTF-8')).hexdigest()
+        return path.join(self.bodies_root_path, key_digest + codec.extension + '.part')
+
+    def load(self, key, entry):
+        digest = self.refs.digest(key)
+        if digest is None:
+            super(ContentAddressedStorage, self).load(key, entry)
+        else:
+            self._load_file(self._find_file(self._body_base_path(digest)), entry)
+
+    def stored_file_path(self, key):
+        digest = self.refs.digest(key)
+        if digest is None:
+            return super(ContentAddressedStorage, self).stored_file_path(key)
+        file_path = self._find_file(self._body_base_path(digest))
+        return file_path if path.isfile(file_path) else None
+
+    def _open_sink(self, codec, part_file_path, is_encoded=False):
+        # The same bytes make for a different file depending on the codec, so that's part of the hash. Data that we receive
+        # already encoded is hashed as is, and so must never share a hash with data that we encode.
+        hasher = sha256(codec.name.encode('UTF-8') + (b':encoded:' if is_encoded else b':'))
+        return HashingFile(
+            super(ContentAddressedStorage, self)._open_sink(codec, part_file_path, is_encoded),
+            hasher,
+        )
+
+    def _save_part_file(self, key, codec, part_file_path, sink):
+        digest = text_type(sink.hexdigest())
+        file_path = self._body_base_path(digest) + codec.extension
+        if path.isfile(file_path):
+            unlink(part_file_path)
+        else:
+            if not path.isdir(path.dirname(file_path)):
+                makedirs(path.dirname(file_path))
+            rename(part_file_path, file_path)
+        previous_digest = self.refs.link(key, digest)
+        if previous_digest is not None:
+            self._release(previous_digest)
+        # If the key had a body stored by a FlatFileStorage, we don't need it anymore
+        super(ContentAddressedStorage, self).remove(key)
+        return file_path
+
+    def remove(self, key):
+        num_bytes_freed = 0
+        digest = self.refs.unlink(key)
+        if digest is not None:
+            num_bytes_freed += self._release(digest)
+        num_bytes_freed += super(ContentAddressedStorage, self).remove(key)
+        return num_bytes_freed
+
+    def _release(self, digest):
+        num_bytes_freed = 0
+        if self.refs.release(digest) == 0:
+            base_path = self._body_base_path(digest)
+            num_bytes_freed = self._remove_files(base_path)
+            self._remove_empty_directories(path.dirname(base_path))
+        return num_bytes_freed
+
+    def iter_usage(self):
+        for item in super(ContentAddressedStorage, self).iter_usage():
+            yield item
+        for key, digest in self.refs.iter_digests():
+            yield key, self._find_file(self._body_base_path(digest))
+
+    def collect_garbage(self):
+        """
+        Deletes the body files that no key points to. These are normally deleted as soon as their last key is removed, but orphans
+        can be left behind if the process is killed while storing a response.
+        """
+        for dir_path, _, file_names in walk(self.bodies_root_path):
+            for file_name in file_names:
+                base_name, extension = path.splitext(file_name)
+                # NB `.part` files are left alone, they might be in the process of being written to
+                if extension in self.codecs_by_extension:
+                    digest = path.relpath(path.join(dir_path, base_name), self.bodies_root_path).replace(sep, '')
+                    if self.refs.count(digest) == 0:
+                        unlink(path.join(dir_path, file_name))
+        for dir_path, _, _ in tuple(walk(self.bodies_root_path, topdown=False)):
+            self._remove_empty_directories(dir_path)
+
+    def close(self):
+        self.refs.close()
+
+
+class BodyRefCounts(object):
+    """
+    Shelf database used by the `ContentAddressedStorage` to map each cache key to the digest of its body, and each digest to the
+    number of keys that point to it.
+    """
+
+    def __init__(self, file_path, read_only=False):
+        self.file_path = file_path
+        self.read_only = read_only
+        # NB only open DB file on demand, as it opens it exclusively, unless it's read-only
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            # NB the values are just strings and ints, so we use a protocol that both Python 2 and 3 can read, since unlike the
+            # index, this file is shared between them
+            self._db = shelve.open(self.file_path, 'r' if self.read_only else 'c', protocol=2)
+        return self._db
+
+    @staticmethod
+    def key_to_string(key):
+        return 'key:' + json.dumps(key)
+
+    @staticmethod
+    def _string_to_key(text):
+        return tuple(json.loads(text))
+
+    @staticmethod
+    def _digest_to_string(digest):
+        return 'body:' + digest
+
+    def digest(self, key):
+        return self.db.get(native_string(self.key_to_string(key)))
+
+    def count(self, digest):
+        return self.db.get(native_string(self._digest_to_string(digest)), 0)
+
+    def iter_digests(self):
+        """
+        Yields a `(key, digest)` pair for every key.
+        """
+        for key_string in list(self.db.keys()):
+            if key_string.startswith('key:'):
+                digest = self.db.get(key_string)
+                if digest is not None:
+                    yield self._string_to_key(key_string[len('key:'):]), digest
+
+    def link(self, key, digest):
+        """
+        Makes `key` point to `digest`. Returns the digest that `key` pointed to before, if it's one that needs released, else None.
+        """
+        previous_digest = self.digest(key)
+        if previous_digest == digest:
+            return None
+        self.db[native_string(self._digest_to_string(digest))] = self.count(digest) + 1
+        self.db[native_string(self.key_to_string(key))] = digest
+        return previous_digest
+
+    def unlink(self, key):
+        """
+        Removes `key`, and returns the digest that it pointed to, which needs released, or None if the key wasn't present.
+        """
+        return self.db.pop(native_string(self.key_to_string(key)), None)
+
+    def release(self, digest):
+        """
+        Decrements the reference count of `digest`, and returns the new count.
+        """
+        remaining = max(self.count(digest) - 1, 0)
+        if remaining:
+            self.db[native_string(self._digest_to_string(digest))] = remaining
+        else:
+            self.db.pop(native_string(self._digest_to_string(digest)), None)
+        return remaining
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+class HashingFile(object):
+    """
+    Writable file-like object that wraps around another one, and computes the hash of all the data that gets written through it.
+    """
+
+    def __init__(self, wrapped, hasher):
+        self.wrapped = wrapped
+        self.hasher = hasher
+
+    def write(self, data):
+        self.hasher.update(data)
+        return self.wrapped.write(data)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+    def flush(self):
+        self.wrapped.flush()
+
+    def close(self):
+        self.wrapped.close()
+
+    @property
+    def closed(self):
+        return self.wrapped.closed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# response body streams
+
+class MockedHttplibResponse(object):
+    """
+    Wherein we realise that under the requests library's respectable and elegant interface is a matryoshka of HTTP libraries,
+    several layers deep, peppered with a generous amount of backwards compatibility and other hacks.
+
+    We need this for requests' `extract_cookies_to_jar` to work.
+    """
+
+    def __init__(self, urllib3_response):
+        self.msg = email.message.Message()
+        self.msg._headers = list(urllib3_response.headers.items())
+        self.msg.getheaders = partial(self.msg.get_all, failobj=[])
+
+    def isclosed(self):
+        return True
+
+
+def tee_response_body(response, sink, on_completion):
+    """
+    Arranges for the body of `response`, as it gets read by whoever consumes the response, to also be written to `sink`, as it
+    was before any content decoding, and for `on_completion` to be called once it's all been read. Nothing is read here, so the
+    body is only read once, off the network, whether the response is chunked or not.
+    """
+    raw = response.raw
+    if not raw.chunked:
+        raw._fp.fp = StreamTee(
+            source=raw._fp.fp,
+            sink=sink,
+            length=raw._fp.length,
+            on_completion=on_completion,
+        )
+        return
+    # urllib3 reads the chunk headers straight off the socket, so there's no stream of body data for us to wrap. Instead, the
+    # original response de-chunks the data, which we tee, and hand over to the consumer through a new HTTPResponse object, which
+    # takes care of the content decoding.
+    headers = urllib3._collections.HTTPHeaderDict(raw.headers)
+    del headers['Transfer-Encoding']
+    response.raw = urllib3.HTTPResponse(
+        headers=headers,
+        status=raw.status,
+        reason=raw.reason,
+        version=raw.version,
+        request_method=response.request.method,
+        preload_content=False,
+        decode_content=False,
+        body=StreamTee(
+            source=RawStreamReader(raw),
+            sink=sink,
+            length=None,
+            on_completion=on_completion,
+        ),
+    )
+    response.raw._original_response = raw._original_response
+
+
+class RawStreamReader(object):
+    """
+    Readable file-like object that reads the body of a urllib3 HTTPResponse with its `stream` method, so that the data comes out
+    de-chunked, but not decoded.
+    """
+
+    # What we ask `stream` for. Chunks can come out smaller, but not bigger
+    chunk_size = 64 * 1024
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.closed = False
+        self._chunks = raw.stream(self.chunk_size, decode_content=False)
+        self._buffer = b''
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            data = self._buffer + b''.join(self._chunks)
+            self._buffer = b''
+            self.closed = True
+            return data
+        if not self._buffer:
+            self._buffer = next(self._chunks, b'')
+            if not self._buffer:
+                self.closed = True
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return data
+
+    def close(self):
+        if not self.closed:
+            # NB the body wasn't read to the end, so the connection can't be reused
+            self.raw.close()
+            self.closed = True
+
+
+class StreamTee(object):
+    """
+    Readable file-like object that simply wraps around another file object (the "source") and pipes its data through, unmodified;
+    every time some data is read, however, we also write it so a separate file (the "sink"). This allows us to save to cache
+    streamed HTTP responses, without having to load the data to memory.
+    """
+
+    def __init__(self, source, sink, length, on_completion):
+        self.source = source
+        self.sink = sink
+        self.remaining = length
+        self.on_completion = on_completion
+
+    def read(self, *args):
+        chunk = self.source.read(*args)
+        self.sink.write(chunk)
+        want_everything = not args or (args[0] in (-1, None))
+        if self.remaining is not None:
+            self.remaining -= len(chunk)
+        if want_everything or not chunk or self.remaining == 0:
+            self._complete()
+        return chunk
+
+    def readinto(self, b):
+        n = self.source.readinto(b)
+        self.sink.write(b[:n])
+        if self.remaining is not None:
+            self.remaining -= n
+        if n == 0 or self.remaining == 0:
+            self._complete()
+        return n
+
+    # def readline(self, size=-1):
+    #     line = self.source.readline(size)
+    #     self.sink.write(line)
+    #     if self.remaining is not None:
+    #         self.remaining -= len(line)
+    #         if self.remaining == 0:
+    #             self._complete()
+    #     return line
+
+    def flush(self):
+        self.source.flush()
+        if not self.sink.closed:
+            self.sink.flush()
+
+    def close(self):
+        self.source.close()
+        self.sink.close()
+
+    @property
+    def closed(self):
+        return self.source.closed
+
+    def _complete(self):
+        if self.on_completion is not None:
+            self.on_completion()
+            self.on_completion = None
+
+
+class AutoClosingFile(object):
+    """
+    Readable file-like object that closes automatically once its data is exhausted.
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+
+    def read(self, *args):
+        chunk = self.wrapped.read(*args)
+        want_everything = not args or (args[0] in (-1, None))
+        if want_everything or not chunk:
+            self.close()
+        return chunk
+
+    def stream(self, *args, **kwargs):
+        for chunk in self.wrapped.stream(*args, **kwargs):
+            yield chunk
+        self.close()
+
+    def close(self):
+        if not self.wrapped.closed:
+            self.wrapped.close()
+
+    @property
+    def closed(self):
+        return self.wrapped.closed
+
+#----------------------------------------------------------------------------------------------------------------------------------
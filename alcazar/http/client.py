@@ -11,11 +11,13 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import requests
 
 # alcazar
-from ..config import DEFAULT_CONFIG
+from ..config import DEFAULT_CONFIG, ScraperConfig
 from ..exceptions import HttpError, HttpRedirect
 from .cache import CacheAdapterMixin
 from .courtesy import CourtesySleepAdapterMixin
 from .log import LogEntry, LoggingAdapterMixin
+from .metrics import MetricsAdapterMixin, NullMetricsSink, RequestMetrics
+from .pool import ConnectionPoolAdapterMixin
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
@@ -34,10 +36,13 @@ class AdapterBaseMixin(object):
         return super(AdapterBaseMixin, self).send(prepared_request, **kwargs)
 
 
-class AlcazarHttpAdapter(
+# NB each of the mixins below adds one independent feature, and they're meant to be stacked like this
+class AlcazarHttpAdapter( # so many ancestors are expected, pylint: disable=too-many-ancestors
         CacheAdapterMixin,
         CourtesySleepAdapterMixin,
         LoggingAdapterMixin,
+        MetricsAdapterMixin,
+        ConnectionPoolAdapterMixin,
         AdapterBaseMixin,
         requests.adapters.HTTPAdapter,
         ):
@@ -64,25 +69,47 @@ class AlcazarSession(requests.Session):
         # NB this calls itself via indirect recursion (in requests.Session) to handle redirects
         kwargs['redirect_count'] = kwargs.get('redirect_count', -1) + 1
         kwargs['log'] = LogEntry(is_redirect=(kwargs['redirect_count'] > 0))
+        kwargs.setdefault('metrics', RequestMetrics(prepared_request.method, prepared_request.url))
         return super(AlcazarSession, self).send(prepared_request, config=config, **kwargs)
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class HttpClient(object):
+    """
+    Sends requests through an `AlcazarSession`. Every request's timings and counts are collected in a `RequestMetrics` record,
+    which is attached to the response as `response.metrics`, and handed to the `MetricsSink` given as the `metrics` kwarg, if any.
+    """
 
     def __init__(self, base_config=DEFAULT_CONFIG, **kwargs):
+        # Config values can also be given as kwargs, e.g. `HttpClient(pool_size=20)`
+        base_config = ScraperConfig.from_kwargs(kwargs, defaults=base_config)
         kwargs.setdefault('headers', {}) \
             .setdefault('User-Agent', base_config.user_agent)
-        self.session = AlcazarSession(base_config, **kwargs)
-
-    def submit(self, request, config):
+        self.metrics = kwargs.pop('metrics', None) or NullMetricsSink()
+        self.session = AlcazarSession(base_config, metrics_sink=self.metrics, **kwargs)
+
+    def submit(self, request, config, metrics=None):
+        """
+        Sends the request and returns the response. If `metrics` is given, it's the `RequestMetrics` to fill in, and it's up to the
+        caller to record it once it's added its own timings (this is how the Fetcher times the parsing). Otherwise a new one is
+        created, and recorded as soon as the response headers are in, or the request has failed.
+        """
+        owns_metrics = metrics is None
+        if owns_metrics:
+            metrics = RequestMetrics()
         try:
             prepared = self.session.prepare_request(request.to_requests_request())
+            metrics.method = prepared.method
+            metrics.url = prepared.url
             response = self.session.send(
                 prepared,
                 config,
+                metrics=metrics,
                 **self._requests_kwargs_from_config(config)
             )
+            response.metrics = metrics
+            metrics.status = response.status_code
+            metrics.num_redirects = len(response.history)
             if config.auto_raise_for_status:
                 response.raise_for_status()
             if config.auto_raise_for_redirect and 300 <= response.status_code < 400:
@@ -90,9 +117,17 @@ class HttpClient(object):
             return response
         except requests.HTTPError as error:
             error_class = getattr(HttpError, 'Http%d' % error.response.status_code, HttpError)
+            metrics.error = error_class.__name__
             raise error_class(str(error), reason=error)
         except requests.RequestException as exception:
+            metrics.error = exception.__class__.__name__
             raise HttpError(str(exception), reason=exception)
+        except Exception as exception:
+            metrics.error = exception.__class__.__name__
+            raise
+        finally:
+            if owns_metrics:
+                self.metrics.record(metrics)
 
     @staticmethod
     def _requests_kwargs_from_config(config):
@@ -117,6 +152,14 @@ class HttpClient(object):
 
     def close(self):
         self.session.close() # this will call close on the AlcazarHttpAdapter instance
+        self.metrics.close()
+
+    @property
+    def pool_stats(self):
+        """
+        Returns a dict that maps "host:port" strings to `HostPoolStats` tuples, which say how often connections were reused.
+        """
+        return self.session.get_adapter('http://').pool_stats.snapshot()
 
     @property
     def default_headers(self):
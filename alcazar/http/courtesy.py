@@ -34,7 +34,9 @@ class CourtesySleepAdapterMixin(object):
         courtesy_seconds = 0 if kwargs.get('redirect_count', 0) > 0 else config.courtesy_seconds
         if courtesy_seconds:
             key = self._key(prepared_request)
+            time_before = time()
             self._courtesy_sleep(key, courtesy_seconds, kwargs['log'])
+            kwargs['metrics'].add_time('courtesy_wait', time() - time_before)
         try:
             return super(CourtesySleepAdapterMixin, self).send(prepared_request, config, **kwargs)
         finally:
@@ -0,0 +1,504 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from array import array
+from collections import namedtuple
+from contextlib import contextmanager
+import io
+import json
+from os import rename
+from threading import Lock
+from time import time
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# globals
+
+# The phases of a request that get timed, in the order in which they happen
+PHASES = (
+    'courtesy_wait', # sleeping so as not to hammer the server
+    'cache_lookup',  # looking the request up in the cache
+    'connect',       # opening a new connection to the server, including the DNS lookup and the TLS handshake
+    'ttfb',          # from sending the request to receiving the response headers, not counting `connect`
+    'download',      # waiting on the network while reading the response body
+    'decode',        # decoding the body bytes to text
+    'parse',         # parsing the text to a tree or a JSON object
+    'husk',          # building the husker around the parsed document
+)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# per-request record
+
+class RequestMetrics(object): # a plain record of fields, pylint: disable=too-many-instance-attributes
+    """
+    Timings and counts for one request, i.e. one call to `HttpClient.submit`, with all the redirects it followed. `timings` maps
+    names from `PHASES` to the seconds spent in that phase; phases that didn't happen, e.g. `connect` when a pooled connection was
+    reused, or everything but `cache_lookup` on a cache hit, are left out.
+    """
+
+    __slots__ = (
+        'method',
+        'url',
+        'status',
+        'cache',
+        'attempt',
+        'num_redirects',
+        'bytes_in',
+        'error',
+        'timestamp',
+        'timings',
+    )
+
+    def __init__(self, method=None, url=None):
+        self.method = method
+        self.url = url
+        self.status = None
+        # One of 'hit', 'miss' or 'stale' (a stale entry that was revalidated), or None if the cache wasn't used
+        self.cache = None
+        # 0 for the first attempt at scraping a query, 1 for the first retry, etc
+        self.attempt = 0
+        self.num_redirects = 0
+        # Body bytes read off the network, before any content decoding
+        self.bytes_in = 0
+        # The class name of the exception the request failed with, if any
+        self.error = None
+        self.timestamp = time()
+        self.timings = {}
+
+    def add_time(self, phase, seconds):
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def timing(self, phase):
+        time_before = time()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time() - time_before)
+
+    @property
+    def total_seconds(self):
+        return sum(self.timings.values())
+
+    def to_dict(self):
+        return {
+            key: getattr(self, key)
+            for key in self.__slots__
+        }
+
+    def __repr__(self):
+        return 'RequestMetrics(%s)' % ', '.join(
+            '%s=%r' % (key, getattr(self, key))
+            for key in self.__slots__
+        )
+
+
+def response_metrics(response):
+    """
+    Returns the `RequestMetrics` that the HTTP client attached to `response`, or a throwaway one if it has none, e.g. if the
+    response was built by hand.
+    """
+    metrics = getattr(response, 'metrics', None)
+    return metrics if metrics is not None else RequestMetrics()
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# sinks
+
+class MetricsSink(object):
+    """
+    Receives a `RequestMetrics` record for every request once it's complete. `record` can be called from any thread that sends
+    requests, so implementations that keep state must lock.
+    """
+
+    def record(self, metrics):
+        raise NotImplementedError
+
+    def record_pool_stats(self, stats):
+        """
+        Called when the HTTP client is closed, with a dict that maps "host:port" strings to `HostPoolStats` tuples. Does nothing by
+        default.
+        """
+
+    def record_cache_purge(self, report):
+        """
+        Called with a `CachePurgeReport` when the purge of the cache that starts with the first request is done. Note that this may
+        be called from a background thread. Does nothing by default.
+        """
+
+    def close(self):
+        """
+        Called when the HTTP client is closed. Does nothing by default.
+        """
+
+
+class NullMetricsSink(MetricsSink):
+
+    def record(self, metrics):
+        pass
+
+
+class MultiMetricsSink(MetricsSink):
+    """
+    Hands every record to each of the given sinks in turn.
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def record(self, metrics):
+        for sink in self.sinks:
+            sink.record(metrics)
+
+    def record_pool_stats(self, stats):
+        for sink in self.sinks:
+            sink.record_pool_stats(stats)
+
+    def record_cache_purge(self, report):
+        for sink in self.sinks:
+            sink.record_cache_purge(report)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+PhaseSummary = namedtuple('PhaseSummary', (
+    'count',
+    'total',
+    'mean',
+    'p50',
+    'p90',
+    'p99',
+    'max',
+))
+
+
+class MetricsAggregator(MetricsSink): # one attribute per counter, pylint: disable=too-many-instance-attributes
+    """
+    Keeps, in memory, every timing recorded for every phase, so that their distribution can be summarized. The values are stored in
+    compact arrays of doubles, i.e. at most 8 bytes per phase per request. The connection pool stats of every client that used the
+    aggregator are added up in `pool_stats`, and the cache purge reports are kept in `cache_purges`.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._timings = {phase: array('d') for phase in PHASES}
+        self.num_requests = 0
+        self.num_errors = 0
+        self.num_retries = 0
+        self.bytes_in = 0
+        self.cache_counts = {}
+        self.status_counts = {}
+        self.pool_stats = {}
+        self.cache_purges = []
+
+    def record(self, metrics):
+        with self._lock:
+            for phase, seconds in metrics.timings.items():
+                self._timings.setdefault(phase, array('d')).append(seconds)
+            self.num_requests += 1
+            if metrics.error is not None:
+                self.num_errors += 1
+            if metrics.attempt > 0:
+                self.num_retries += 1
+            self.bytes_in += metrics.bytes_in
+            if metrics.cache is not None:
+                self.cache_counts[metrics.cache] = self.cache_counts.get(metrics.cache, 0) + 1
+            if metrics.status is not None:
+                self.status_counts[metrics.status] = self.status_counts.get(metrics.status, 0) + 1
+
+    def record_pool_stats(self, stats):
+        with self._lock:
+            for host, host_stats in stats.items():
+                previous = self.pool_stats.get(host)
+                if previous is not None:
+                    host_stats = host_stats._make(a + b for a, b in zip(previous, host_stats))
+                self.pool_stats[host] = host_stats
+
+    def record_cache_purge(self, report):
+        with self._lock:
+            self.cache_purges.append(report)
+
+    def percentile(self, phase, percent):
+        """
+        Returns the given percentile, using the nearest-rank method, of the times recorded for `phase`, or None if there are none.
+        """
+        with self._lock:
+            values = sorted(self._timings.get(phase, ()))
+        return _nearest_rank(values, percent)
+
+    def summary(self):
+        """
+        Returns a dict that maps the name of every phase for which anything was recorded to a `PhaseSummary`.
+        """
+        with self._lock:
+            all_values = {
+                phase: sorted(values)
+                for phase, values in self._timings.items()
+                if values
+            }
+        return {
+            phase: PhaseSummary(
+                count=len(values),
+                total=sum(values),
+                mean=sum(values) / len(values),
+                p50=_nearest_rank(values, 50),
+                p90=_nearest_rank(values, 90),
+                p99=_nearest_rank(values, 99),
+                max=values[-1],
+            )
+            for phase, values in all_values.items()
+        }
+
+    def format_summary(self):
+        lines = ['{} requests, {} errors, {} retries, {} bytes in, cache: {}'.format(
+            self.num_requests,
+            self.num_errors,
+            self.num_retries,
+            self.bytes_in,
+            ', '.join('%s=%d' % item for item in sorted(self.cache_counts.items())) or '-',
+        )]
+        summary = self.summary()
+        for phase in sorted(summary, key=_phase_sort_key):
+            phase_summary = summary[phase]
+            lines.append('{:<14} n={:<7} mean={:.3f}s p50={:.3f}s p90={:.3f}s p99={:.3f}s max={:.3f}s'.format(
+                phase,
+                phase_summary.count,
+                phase_summary.mean,
+                phase_summary.p50,
+                phase_summary.p90,
+                phase_summary.p99,
+                phase_summary.max,
+            ))
+        for host in sorted(self.pool_stats):
+            host_stats = self.pool_stats[host]
+            lines.append('[pool] {}: {} requests, {} new connections, {:.0%} reused'.format(
+                host,
+                host_stats.num_requests,
+                host_stats.num_new_connections,
+                host_stats.reuse_ratio,
+            ))
+        for report in self.cache_purges:
+            lines.append('[cache] purge {}: removed {} of {} entries scanned, freed {} bytes'.format(
+                'done' if report.completed else 'interrupted',
+                report.num_entries_removed,
+                report.num_entries_scanned,
+                report.num_bytes_freed,
+            ))
+        return '\n'.join(lines)
+
+
+class JsonLinesMetricsSink(MetricsSink):
+    """
+    Appends every record, as a JSON object on a line of its own, to the file at `file_path`.
+    """
+
+    def __init__(self, file_path):
+        self._lock = Lock()
+        self.file = io.open(file_path, 'at', encoding='UTF-8')
+
+    def record(self, metrics):
+        line = json.dumps(metrics.to_dict(), sort_keys=True)
+        with self._lock:
+            self.file.write(line + '\n')
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+
+
+class PrometheusMetricsSink(MetricsSink): # one attribute per metric, pylint: disable=too-many-instance-attributes
+    """
+    Keeps a histogram of the time spent in each phase, along with a few counters, and writes them in the Prometheus text format to
+    `file_path`, for the node exporter's textfile collector to pick up. The file is rewritten at most every `write_interval`
+    seconds as records come in, and once more when the sink is closed. It's written to a temporary file that's then renamed over
+    it, so the collector never sees half a file.
+    """
+
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, file_path, buckets=default_buckets, write_interval=15):
+        self.file_path = file_path
+        self.buckets = tuple(sorted(buckets))
+        self.write_interval = write_interval
+        self._lock = Lock()
+        self._last_write_time = None
+        # Maps phase names to `[bucket_counts, count, sum]`, where `bucket_counts[i]` is the number of values that fell in the
+        # i-th bucket (not cumulative, unlike in the output)
+        self._histograms = {}
+        self._requests = {}
+        self._bytes_in = 0
+        self._retries = 0
+        self._errors = 0
+
+    def record(self, metrics):
+        with self._lock:
+            for phase, seconds in metrics.timings.items():
+                histogram = self._histograms.get(phase)
+                if histogram is None:
+                    histogram = self._histograms[phase] = [[0] * len(self.buckets), 0, 0.0]
+                for bucket_i, upper_bound in enumerate(self.buckets):
+                    if seconds <= upper_bound:
+                        histogram[0][bucket_i] += 1
+                        break
+                histogram[1] += 1
+                histogram[2] += seconds
+            cache = metrics.cache or 'none'
+            self._requests[cache] = self._requests.get(cache, 0) + 1
+            self._bytes_in += metrics.bytes_in
+            if metrics.attempt > 0:
+                self._retries += 1
+            if metrics.error is not None:
+                self._errors += 1
+            now = time()
+            if self._last_write_time is None or now - self._last_write_time >= self.write_interval:
+                self._write()
+                self._last_write_time = now
+
+    def close(self):
+        with self._lock:
+            self._write()
+
+    def format(self):
+        lines = [
+            '# HELP alcazar_request_phase_seconds Time spent in each phase of a request',
+            '# TYPE alcazar_request_phase_seconds histogram',
+        ]
+        for phase in sorted(self._histograms, key=_phase_sort_key):
+            bucket_counts, count, total = self._histograms[phase]
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative_count += bucket_count
+                lines.append('alcazar_request_phase_seconds_bucket{phase="%s",le="%s"} %d' % (
+                    phase,
+                    _format_float(upper_bound),
+                    cumulative_count,
+                ))
+            lines.append('alcazar_request_phase_seconds_bucket{phase="%s",le="+Inf"} %d' % (phase, count))
+            lines.append('alcazar_request_phase_seconds_sum{phase="%s"} %s' % (phase, _format_float(total)))
+            lines.append('alcazar_request_phase_seconds_count{phase="%s"} %d' % (phase, count))
+        lines.extend([
+            '# HELP alcazar_requests_total Requests completed, by cache outcome',
+            '# TYPE alcazar_requests_total counter',
+        ])
+        for cache in sorted(self._requests):
+            lines.append('alcazar_requests_total{cache="%s"} %d' % (cache, self._requests[cache]))
+        for name, help_text, value in (
+                ('alcazar_response_bytes_total', 'Response body bytes read off the network', self._bytes_in),
+                ('alcazar_request_retries_total', 'Requests that were retries of a failed scrape', self._retries),
+                ('alcazar_request_errors_total', 'Requests that failed with an exception', self._errors),
+                ):
+            lines.extend([
+                '# HELP %s %s' % (name, help_text),
+                '# TYPE %s counter' % name,
+                '%s %d' % (name, value),
+            ])
+        return '\n'.join(lines) + '\n'
+
+    def _write(self):
+        part_file_path = self.file_path + '.part'
+        with io.open(part_file_path, 'wt', encoding='UTF-8') as file_out:
+            file_out.write(self.format())
+        rename(part_file_path, self.file_path)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# network instrumentation
+
+class MeteredReader(object):
+    """
+    Wraps around the socket file that `http.client` reads the response body from, and adds the time spent waiting in each read,
+    and the number of bytes read, to the given `RequestMetrics`. Because it sits below urllib3's content decoding, what it counts
+    is the bytes as they came over the wire.
+    """
+
+    def __init__(self, source, metrics):
+        self.source = source
+        self.metrics = metrics
+
+    def read(self, *args):
+        time_before = time()
+        chunk = self.source.read(*args)
+        self._account(time_before, len(chunk))
+        return chunk
+
+    def readinto(self, b):
+        time_before = time()
+        num_bytes = self.source.readinto(b)
+        self._account(time_before, num_bytes or 0)
+        return num_bytes
+
+    def readline(self, *args):
+        time_before = time()
+        line = self.source.readline(*args)
+        self._account(time_before, len(line))
+        return line
+
+    def _account(self, time_before, num_bytes):
+        self.metrics.add_time('download', time() - time_before)
+        self.metrics.bytes_in += num_bytes
+
+    def flush(self):
+        self.source.flush()
+
+    def close(self):
+        self.source.close()
+
+    @property
+    def closed(self):
+        return self.source.closed
+
+    def __getattr__(self, attr):
+        return getattr(self.source, attr)
+
+
+class MetricsAdapterMixin(object):
+    """
+    Mixin for the AlcazarHttpAdapter that fills in the `RequestMetrics` passed down by the session with the connect time, the
+    time to first byte, and the time and bytes spent downloading the body of every response that actually went over the network.
+    It also holds the client's `MetricsSink`, as `self.metrics_sink`, for the other mixins to report their stats to.
+    """
+
+    def __init__(self, base_config, **kwargs):
+        self.metrics_sink = kwargs.pop('metrics_sink', None) or NullMetricsSink()
+        super(MetricsAdapterMixin, self).__init__(base_config, **kwargs)
+
+    def send(self, prepared_request, config, metrics, **kwargs):
+        time_before = time()
+        response = super(MetricsAdapterMixin, self).send(prepared_request, config, **kwargs)
+        elapsed = time() - time_before
+        connection = getattr(response.raw, '_connection', None)
+        connect_seconds = getattr(connection, 'alcazar_connect_seconds', None)
+        if connect_seconds is not None:
+            connection.alcazar_connect_seconds = None
+            metrics.add_time('connect', connect_seconds)
+            elapsed -= connect_seconds
+        metrics.add_time('ttfb', max(elapsed, 0.0))
+        http_response = getattr(response.raw, '_fp', None)
+        if getattr(http_response, 'fp', None) is not None:
+            http_response.fp = MeteredReader(http_response.fp, metrics)
+        return response
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# utils
+
+def _nearest_rank(sorted_values, percent):
+    if not sorted_values:
+        return None
+    rank = int(-(-percent * len(sorted_values) // 100)) # i.e. ceil()
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _phase_sort_key(phase):
+    return (PHASES.index(phase) if phase in PHASES else len(PHASES), phase)
+
+
+def _format_float(value):
+    return repr(float(value))
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from collections import namedtuple
+import socket
+from threading import Lock
+from time import time
+
+# 3rd parties
+try:
+    from requests.packages import urllib3
+except ImportError:
+    import urllib3
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# data structures
+
+class HostPoolStats(namedtuple('HostPoolStats', (
+        'num_requests',
+        'num_new_connections',
+        ))):
+
+    @property
+    def num_reused_connections(self):
+        return self.num_requests - self.num_new_connections
+
+    @property
+    def reuse_ratio(self):
+        return self.num_reused_connections / self.num_requests if self.num_requests else 0.0
+
+
+class PoolStats(object):
+    """
+    Counts, for every host, how many requests were sent, and how many of them had to open a new connection rather than reuse one
+    from the pool. This is updated from whichever thread sends the request, hence the lock.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._counts = {}
+
+    def record(self, host, is_new_connection):
+        with self._lock:
+            counts = self._counts.get(host)
+            if counts is None:
+                counts = self._counts[host] = [0, 0]
+            counts[0] += 1
+            if is_new_connection:
+                counts[1] += 1
+
+    def snapshot(self, reset=False):
+        """
+        Returns a dict that maps "host:port" strings to `HostPoolStats` tuples. If `reset` is true, the counters are then zeroed.
+        """
+        with self._lock:
+            snapshot = {
+                host: HostPoolStats(*counts)
+                for host, counts in self._counts.items()
+            }
+            if reset:
+                self._counts.clear()
+        return snapshot
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ConnectionPoolAdapterMixin(object):
+    """
+    Mixin for the AlcazarHttpAdapter that configures the underlying urllib3 connection pools from the base config:
+
+      * `max_pools` is the number of per-host pools to keep around
+      * `pool_size` is the number of connections kept open to any one host
+      * `pool_block`, if true, makes threads wait for a free connection once `pool_size` are in use, rather than opening extra
+        connections that are then discarded
+      * `tcp_keep_alive` enables TCP keep-alive probes on all sockets
+      * `pool_idle_timeout`, if not None, is the number of seconds after which a connection that's been sitting idle in the pool
+        is closed rather than reused, since by then the server has likely dropped it anyway
+
+    Since the pools are shared by all requests, these settings are read from the base config, and changing them in the config of
+    an individual query has no effect.
+
+    Connection reuse is tallied in `self.pool_stats`, which is handed to the metrics sink when the adapter is closed.
+    """
+
+    def __init__(self, base_config, **kwargs):
+        # NB these must be set before calling the parent constructor, which is where requests calls `init_poolmanager`
+        self.pool_stats = PoolStats()
+        self.pool_config = base_config
+        super(ConnectionPoolAdapterMixin, self).__init__(base_config, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs): # pylint: disable=unused-argument
+        # NB we ignore the values that requests passes us, which are just its defaults
+        self._pool_connections = self.pool_config.max_pools
+        self._pool_maxsize = self.pool_config.pool_size
+        self._pool_block = self.pool_config.pool_block
+        self.poolmanager = AlcazarPoolManager(
+            pool_stats=self.pool_stats,
+            idle_timeout=self.pool_config.pool_idle_timeout,
+            num_pools=self.pool_config.max_pools,
+            maxsize=self.pool_config.pool_size,
+            block=self.pool_config.pool_block,
+            **self._socket_kwargs(pool_kwargs)
+        )
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        return super(ConnectionPoolAdapterMixin, self).proxy_manager_for(proxy, **self._socket_kwargs(proxy_kwargs))
+
+    def _socket_kwargs(self, pool_kwargs):
+        if self.pool_config.tcp_keep_alive:
+            pool_kwargs = dict(pool_kwargs)
+            pool_kwargs['socket_options'] = list(urllib3.connection.HTTPConnection.default_socket_options) + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+            ]
+        return pool_kwargs
+
+    def close(self):
+        # NB this gets called once for every prefix the adapter is mounted on, but the stats are reset after the first time
+        stats = self.pool_stats.snapshot(reset=True)
+        if stats:
+            self.metrics_sink.record_pool_stats(stats)
+        super(ConnectionPoolAdapterMixin, self).close()
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# urllib3 subclasses
+
+class AlcazarPoolManager(urllib3.PoolManager):
+
+    def __init__(self, pool_stats, idle_timeout, **kwargs):
+        super(AlcazarPoolManager, self).__init__(**kwargs)
+        self.pool_stats = pool_stats
+        self.idle_timeout = idle_timeout
+        self.pool_classes_by_scheme = {
+            'http': AlcazarHTTPConnectionPool,
+            'https': AlcazarHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super(AlcazarPoolManager, self)._new_pool(scheme, host, port, request_context=request_context)
+        pool.pool_stats = self.pool_stats
+        pool.idle_timeout = self.idle_timeout
+        return pool
+
+
+class ConnectionPoolMixin(object):
+
+    pool_stats = None
+    idle_timeout = None
+
+    def _get_conn(self, timeout=None):
+        conn = super(ConnectionPoolMixin, self)._get_conn(timeout=timeout)
+        if conn.sock is not None and self.idle_timeout is not None:
+            released_at = getattr(conn, 'alcazar_released_at', None)
+            if released_at is not None and time() - released_at > self.idle_timeout:
+                conn.close()
+        if self.pool_stats is not None:
+            # NB a connection without a socket, whether it's brand new or it's been closed, will connect when it's first used
+            self.pool_stats.record('%s:%s' % (self.host, self.port), is_new_connection=(conn.sock is None))
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.alcazar_released_at = time()
+        super(ConnectionPoolMixin, self)._put_conn(conn)
+
+
+class TimedConnectionMixin(object):
+    """
+    Records how long it took to open the connection, DNS lookup and TLS handshake included, so that the `MetricsAdapterMixin` can
+    pick it up from the response. It's reset to None once it's been read, since the connection may then be reused.
+    """
+
+    alcazar_connect_seconds = None
+
+    def connect(self):
+        time_before = time()
+        super(TimedConnectionMixin, self).connect()
+        self.alcazar_connect_seconds = time() - time_before
+
+
+class AlcazarHTTPConnection(TimedConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class AlcazarHTTPSConnection(TimedConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class AlcazarHTTPConnectionPool(ConnectionPoolMixin, urllib3.HTTPConnectionPool):
+    ConnectionCls = AlcazarHTTPConnection
+
+
+class AlcazarHTTPSConnectionPool(ConnectionPoolMixin, urllib3.HTTPSConnectionPool):
+    ConnectionCls = AlcazarHTTPSConnection
+
+#----------------------------------------------------------------------------------------------------------------------------------
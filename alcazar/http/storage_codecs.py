@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import gzip
+from os import listdir, makedirs, path, rename
+
+# 3rd parties
+try:
+    import zstandard
+except ImportError:
+    zstandard = NotImplemented # pylint: disable=invalid-name
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# codecs
+
+class StorageCodec(object):
+    """
+    Encodes the body data that the cache storage writes to disk. Each codec has its own file name extension, which is how the
+    storage knows which codec to read a file back with, so the codec used for writing can be changed without making the data that
+    is already in the cache unreadable.
+    """
+
+    name = None
+    extension = None
+
+    def open_writer(self, file_path):
+        """
+        Returns a writable file object that encodes the data written to it, and saves it to `file_path`.
+        """
+        raise NotImplementedError
+
+    def open_reader(self, file_path):
+        """
+        Returns a readable file object that decodes the data saved to `file_path`.
+        """
+        raise NotImplementedError
+
+
+class RawCodec(StorageCodec):
+    """
+    Stores the data as is. This is what is always used for bodies that the server encoded for transport, since those are usually
+    compressed already.
+    """
+
+    name = 'none'
+    extension = '.raw'
+
+    def open_writer(self, file_path):
+        return open(file_path, 'wb')
+
+    def open_reader(self, file_path):
+        return open(file_path, 'rb')
+
+
+class GzipCodec(StorageCodec):
+
+    name = 'gzip'
+    extension = '.gz'
+
+    def __init__(self, level=9):
+        self.level = level
+
+    def open_writer(self, file_path):
+        return gzip.open(file_path, 'wb', compresslevel=self.level)
+
+    def open_reader(self, file_path):
+        return gzip.open(file_path, 'rb')
+
+
+class ZstdCodec(StorageCodec):
+    """
+    Compresses with Zstandard, which is both faster and tighter than gzip. If `use_dictionary` is true, the data is compressed
+    with the current dictionary in `dictionaries`, which for a cache of pages that share the same HTML templates makes for much
+    smaller files (until a dictionary is trained, it compresses without one). Every zstd file records the ID of the dictionary it
+    was compressed with, if any, so files compressed with an older dictionary can still be read after a new one has been trained,
+    as long as the older one is kept.
+    """
+
+    extension = '.zst'
+
+    # Zstandard frame headers are at most this long, so that's how much we need to read to find the dictionary ID
+    max_frame_header_size = 18
+
+    def __init__(self, dictionaries, level=3, use_dictionary=False):
+        self.dictionaries = dictionaries
+        self.level = level
+        self.use_dictionary = use_dictionary
+
+    @property
+    def name(self):
+        return 'zstd+dict' if self.use_dictionary else 'zstd'
+
+    def open_writer(self, file_path):
+        _check_zstandard()
+        dictionary = self.dictionaries.current() if self.use_dictionary else None
+        compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dictionary)
+        return compressor.stream_writer(open(file_path, 'wb'))
+
+    def open_reader(self, file_path):
+        _check_zstandard()
+        file_in = open(file_path, 'rb')
+        dict_id = zstandard.get_frame_parameters(file_in.read(self.max_frame_header_size)).dict_id
+        file_in.seek(0)
+        dictionary = self.dictionaries.get(dict_id) if dict_id else None
+        return zstandard.ZstdDecompressor(dict_data=dictionary).stream_reader(file_in)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# dictionaries
+
+class ZstdDictionaries(object):
+    """
+    The Zstandard dictionaries trained for a cache, stored as one file per dictionary, named after the dictionary's ID. The most
+    recently trained one is the one used for compressing new data. Older ones are kept, as they're needed to read the data they
+    compressed.
+    """
+
+    file_extension = '.zdict'
+
+    def __init__(self, dir_path):
+        self.dir_path = dir_path
+        self._loaded = {}
+        self._current_id = None
+
+    def _file_path(self, dict_id):
+        return path.join(self.dir_path, '%d%s' % (dict_id, self.file_extension))
+
+    def get(self, dict_id):
+        dictionary = self._loaded.get(dict_id)
+        if dictionary is None:
+            file_path = self._file_path(dict_id)
+            if not path.isfile(file_path):
+                raise ValueError("Zstandard dictionary %d not found in %s" % (dict_id, self.dir_path))
+            with open(file_path, 'rb') as file_in:
+                dictionary = self._loaded[dict_id] = zstandard.ZstdCompressionDict(file_in.read())
+        return dictionary
+
+    def current(self):
+        """
+        Returns the most recently trained dictionary, or None if none has been trained yet.
+        """
+        if self._current_id is None:
+            file_paths = [
+                path.join(self.dir_path, file_name)
+                for file_name in (listdir(self.dir_path) if path.isdir(self.dir_path) else ())
+                if file_name.endswith(self.file_extension)
+            ]
+            if not file_paths:
+                return None
+            latest_path = max(file_paths, key=path.getmtime)
+            self._current_id = int(path.basename(latest_path)[:-len(self.file_extension)])
+        return self.get(self._current_id)
+
+    def add(self, dictionary):
+        """
+        Saves the given `zstandard.ZstdCompressionDict`, which then becomes the current dictionary.
+        """
+        if not path.isdir(self.dir_path):
+            makedirs(self.dir_path)
+        dict_id = dictionary.dict_id()
+        file_path = self._file_path(dict_id)
+        with open(file_path + '.part', 'wb') as file_out:
+            file_out.write(dictionary.as_bytes())
+        rename(file_path + '.part', file_path)
+        self._loaded[dict_id] = dictionary
+        self._current_id = dict_id
+        return dict_id
+
+    def train(self, samples, dict_size=112640):
+        """
+        Trains a new dictionary on the given list of sample bodies, saves it, and makes it the current one. Returns its ID.
+        """
+        _check_zstandard()
+        return self.add(zstandard.train_dictionary(dict_size, samples))
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# building
+
+STORAGE_CODEC_NAMES = ('gzip', 'none', 'zstd', 'zstd+dict')
+
+
+def build_storage_codecs(name, cache_root_path):
+    """
+    Returns the codec to write with, given its name, and a dict that maps file name extensions to the codecs to read with.
+    """
+    dictionaries = ZstdDictionaries(path.join(cache_root_path, 'dictionaries'))
+    zstd_codec = ZstdCodec(dictionaries, use_dictionary=(name == 'zstd+dict'))
+    readers = {
+        codec.extension: codec
+        for codec in (RawCodec(), GzipCodec(), zstd_codec)
+    }
+    if name not in STORAGE_CODEC_NAMES:
+        raise ValueError("Unknown cache codec: %r" % (name,))
+    if name.startswith('zstd'):
+        _check_zstandard()
+    writer = zstd_codec if name.startswith('zstd') else readers['.gz' if name == 'gzip' else '.raw']
+    return writer, readers
+
+
+def _check_zstandard():
+    if zstandard is NotImplemented:
+        raise NotImplementedError("zstandard module not found")
+
+#----------------------------------------------------------------------------------------------------------------------------------
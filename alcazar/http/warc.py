@@ -0,0 +1,605 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from calendar import timegm
+from collections import namedtuple
+import gzip
+from io import BytesIO
+import json
+from os import getpid, path, rename, unlink
+import re
+from time import gmtime, strftime
+from uuid import uuid4
+import zlib
+
+# alcazar
+from ..version import ALCAZAR_VERSION
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# globals
+
+WARC_FILE_EXTENSIONS = ('.warc', '.warc.gz')
+
+# Non-standard WARC header fields that we add to the records we write, so that the index can be rebuilt from the WARC files alone
+CACHE_KEY_FIELD = 'Alcazar-Cache-Key'
+REQUEST_METHOD_FIELD = 'Alcazar-Request-Method'
+
+# Content type of the metadata records that hold a pickled exception, for requests that failed without a response
+EXCEPTION_CONTENT_TYPE = 'application/x-python-pickle; alcazar=exception'
+
+# When scanning WARC files to index them, this is how much of each record we look at. It needs to cover the record's WARC headers
+# and the status line of its HTTP response.
+RECORD_HEAD_SIZE = 64 * 1024
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# CDX index
+
+class CdxLine(namedtuple('CdxLine', (
+        'key',
+        'timestamp',
+        'method',
+        'status',
+        'url',
+        'file_name',
+        'offset',
+        ))):
+    """
+    One line of a `CdxIndex`. Says which record of which WARC file holds the entry stored under a given cache key. A `status` of
+    None means the record holds a pickled exception rather than an HTTP response, and a `file_name` of None marks a key that has
+    been deleted.
+    """
+
+    @property
+    def is_deleted(self):
+        return self.file_name is None
+
+    @property
+    def key_field(self):
+        return key_to_field(self.key)
+
+    def to_bytes(self):
+        return ' '.join((
+            self.key_field,
+            '%.6f' % self.timestamp,
+            _optional_field(self.method),
+            _optional_field(self.status),
+            _optional_field(self.url and self.url.replace(' ', '%20')),
+            _optional_field(self.file_name),
+            _optional_field(self.offset),
+        )).encode('UTF-8') + b'\n'
+
+    @classmethod
+    def from_bytes(cls, line):
+        key, timestamp, method, status, url, file_name, offset = line.decode('UTF-8').rstrip('\n').split(' ')
+        return cls(
+            key=field_to_key(key),
+            timestamp=float(timestamp),
+            method=_parse_optional_field(method),
+            status=_parse_optional_field(status, int),
+            url=_parse_optional_field(url),
+            file_name=_parse_optional_field(file_name),
+            offset=_parse_optional_field(offset, int),
+        )
+
+
+def key_to_field(key):
+    assert isinstance(key, tuple), repr(key)
+    # NB the index is space-separated, so spaces are escaped. JSON-encoded keys contain no other whitespace.
+    return json.dumps(list(key), separators=(',', ':')).replace(' ', '\\u0020')
+
+
+def field_to_key(field):
+    return tuple(json.loads(field))
+
+
+def _optional_field(value):
+    return '-' if value is None else '%s' % value
+
+
+def _parse_optional_field(text, parse=lambda text: text):
+    return None if text == '-' else parse(text)
+
+
+class CdxIndex(object):
+    """
+    Maps cache keys to WARC records. This is a text file in the spirit of the CDX files used by web archives, with one line per
+    key, sorted by key, so that lookups are a binary search over the file, which is never loaded to memory.
+
+    Since inserting into a sorted file is expensive, new lines are first appended to a journal file, which is kept in memory, and
+    only merged into the sorted file when the index is closed. A journal left behind by a process that didn't close the index is
+    picked up the next time it's opened.
+
+    The index also keeps track, in a separate file, of the WARC files that it covers.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.journal_path = file_path + '.journal'
+        self.file_names_path = file_path + '.files'
+        self._journal = self._load_journal()
+        self._journal_file = None
+        self._sorted_file = None
+        self._sorted_size = 0
+        self._file_names = self._load_file_names()
+
+    def _load_journal(self):
+        journal = {}
+        if path.isfile(self.journal_path):
+            with open(self.journal_path, 'rb') as file_in:
+                for line in file_in:
+                    if line.endswith(b'\n'): # else the process writing it died halfway through the line
+                        cdx_line = CdxLine.from_bytes(line)
+                        journal[cdx_line.key_field] = cdx_line
+        return journal
+
+    def _load_file_names(self):
+        if not path.isfile(self.file_names_path):
+            return set()
+        with open(self.file_names_path, 'rb') as file_in:
+            return set(line.decode('UTF-8').rstrip('\n') for line in file_in if line.endswith(b'\n'))
+
+    def covers_file(self, file_name):
+        return file_name in self._file_names
+
+    def add_file(self, file_name):
+        """
+        Records that the given WARC file is covered by the index, so that it doesn't get scanned again.
+        """
+        with open(self.file_names_path, 'ab') as file_out:
+            file_out.write(file_name.encode('UTF-8') + b'\n')
+        self._file_names.add(file_name)
+
+    def lookup(self, key):
+        key_field = key_to_field(key)
+        cdx_line = self._journal.get(key_field)
+        if cdx_line is None:
+            cdx_line = self._search(key_field.encode('UTF-8'))
+        if cdx_line is None or cdx_line.is_deleted:
+            return None
+        return cdx_line
+
+    def insert(self, cdx_line):
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, 'ab')
+        self._journal_file.write(cdx_line.to_bytes())
+        self._journal_file.flush()
+        self._journal[cdx_line.key_field] = cdx_line
+
+    def delete(self, key, timestamp):
+        was_present = self.lookup(key) is not None
+        if was_present:
+            self.insert(CdxLine(key, timestamp, None, None, None, None, None))
+        return was_present
+
+    def _search(self, key_field):
+        sorted_file = self._open_sorted_file()
+        if sorted_file is None:
+            return None
+        # Find the first line whose key is not less than the one we're after. Positions are byte offsets into the file.
+        low, high = 0, self._sorted_size
+        while low < high:
+            middle = (low + high) // 2
+            line = self._first_line_from(sorted_file, middle)
+            if line and line[:line.index(b' ')] < key_field:
+                low = middle + 1
+            else:
+                high = middle
+        line = self._first_line_from(sorted_file, low)
+        if line and line[:line.index(b' ')] == key_field:
+            return CdxLine.from_bytes(line)
+        return None
+
+    @staticmethod
+    def _first_line_from(sorted_file, position):
+        """
+        Returns the first line of the file that starts at or after the given position.
+        """
+        if position == 0:
+            sorted_file.seek(0)
+        else:
+            sorted_file.seek(position - 1)
+            sorted_file.readline()
+        return sorted_file.readline()
+
+    def _open_sorted_file(self):
+        if self._sorted_file is None and path.isfile(self.file_path):
+            self._sorted_file = open(self.file_path, 'rb')
+            self._sorted_size = path.getsize(self.file_path)
+        return self._sorted_file
+
+    def merge(self, new_lines=()):
+        """
+        Merges the journal, and the given CDX lines, if any, into the sorted file. Where there are several lines for the same key,
+        the most recent one wins.
+        """
+        latest = {}
+        for cdx_line in list(self._journal.values()) + list(new_lines):
+            key_field = cdx_line.key_field
+            previous = latest.get(key_field)
+            if previous is None or cdx_line.timestamp >= previous.timestamp:
+                latest[key_field] = cdx_line
+        if latest:
+            self._close_files()
+            part_file_path = self.file_path + '.part'
+            with open(part_file_path, 'wb') as file_out:
+                self._write_merged(file_out, sorted(latest.items()))
+            rename(part_file_path, self.file_path)
+        if path.isfile(self.journal_path):
+            self._close_files()
+            unlink(self.journal_path)
+        self._journal = {}
+
+    def _write_merged(self, file_out, new_items):
+        new_items = iter(new_items)
+        new_key, new_line = next(new_items, (None, None))
+        for old_line in self._iter_sorted_lines():
+            old_key = old_line[:old_line.index(b' ')].decode('UTF-8')
+            while new_key is not None and new_key < old_key:
+                if not new_line.is_deleted:
+                    file_out.write(new_line.to_bytes())
+                new_key, new_line = next(new_items, (None, None))
+            if new_key == old_key:
+                if new_line.timestamp >= CdxLine.from_bytes(old_line).timestamp:
+                    old_line = None if new_line.is_deleted else new_line.to_bytes()
+                new_key, new_line = next(new_items, (None, None))
+            if old_line is not None:
+                file_out.write(old_line)
+        while new_key is not None:
+            if not new_line.is_deleted:
+                file_out.write(new_line.to_bytes())
+            new_key, new_line = next(new_items, (None, None))
+
+    def _iter_sorted_lines(self):
+        if path.isfile(self.file_path):
+            with open(self.file_path, 'rb') as file_in:
+                for line in file_in:
+                    yield line
+
+    def _close_files(self):
+        for file_obj in (self._journal_file, self._sorted_file):
+            if file_obj is not None:
+                file_obj.close()
+        self._journal_file = self._sorted_file = None
+
+    def close(self):
+        self.merge()
+        self._close_files()
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# writing
+
+class WarcWriter(object):
+    """
+    Appends records to a WARC file in `dir_path`, each compressed as a separate gzip member, as the WARC spec recommends, so that
+    any record can be read by seeking straight to its offset. The file is only created when the first record is written.
+    `on_new_file` is called with the file's name when it is created.
+    """
+
+    def __init__(self, dir_path, on_new_file=None):
+        self.dir_path = dir_path
+        self.on_new_file = on_new_file
+        self.file_name = None
+        self._file = None
+
+    def write_record(self, warc_type, fields, block_parts, block_length, timestamp):
+        """
+        Writes a record, whose block is made up of the given byte strings and readable file objects, and returns a
+        `(file_name, offset)` pair that tells where the record was written.
+        """
+        if self._file is None:
+            self._open_new_file(timestamp)
+        return self._write_record(warc_type, fields, block_parts, block_length, timestamp)
+
+    def _write_record(self, warc_type, fields, block_parts, block_length, timestamp):
+        offset = self._file.tell()
+        header = [
+            ('WARC-Type', warc_type),
+            ('WARC-Record-ID', '<urn:uuid:%s>' % uuid4()),
+            ('WARC-Date', format_warc_date(timestamp)),
+        ] + list(fields) + [
+            ('Content-Length', '%d' % block_length),
+        ]
+        member = gzip.GzipFile(filename='', mode='wb', fileobj=self._file, mtime=int(timestamp))
+        member.write(b'WARC/1.1\r\n')
+        member.write(format_header_fields(header, 'UTF-8'))
+        for part in block_parts:
+            if isinstance(part, bytes):
+                member.write(part)
+            else:
+                for chunk in iter(lambda: part.read(64 * 1024), b''): # pylint: disable=cell-var-from-loop
+                    member.write(chunk)
+        member.write(b'\r\n\r\n')
+        member.close() # NB this ends the gzip member, but leaves the underlying file open
+        self._file.flush()
+        return self.file_name, offset
+
+    def _open_new_file(self, timestamp):
+        file_name = 'alcazar-%s-%d.warc.gz' % (strftime('%Y%m%d%H%M%S', gmtime(timestamp)), getpid())
+        serial = 0
+        while path.exists(path.join(self.dir_path, file_name)):
+            serial += 1
+            file_name = 'alcazar-%s-%d-%d.warc.gz' % (strftime('%Y%m%d%H%M%S', gmtime(timestamp)), getpid(), serial)
+        self.file_name = file_name
+        self._file = open(path.join(self.dir_path, file_name), 'ab')
+        if self.on_new_file is not None:
+            self.on_new_file(file_name)
+        info = format_header_fields([
+            ('software', 'Alcazar/%s' % ALCAZAR_VERSION),
+            ('format', 'WARC File Format 1.1'),
+        ], 'UTF-8')
+        self._write_record(
+            'warcinfo',
+            [('WARC-Filename', file_name), ('Content-Type', 'application/warc-fields')],
+            [info],
+            len(info),
+            timestamp,
+        )
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def format_http_response_head(status, reason, version, headers):
+    """
+    Formats the status line and headers of an HTTP response, as found at the start of the block of a WARC response record.
+    """
+    status_line = 'HTTP/%s %d %s\r\n' % ('1.0' if version == 10 else '1.1', status, reason or '')
+    return status_line.encode('iso-8859-1') + format_header_fields(headers, 'iso-8859-1')
+
+
+def format_header_fields(fields, encoding):
+    return b''.join(
+        ('%s: %s\r\n' % (name, value)).encode(encoding, 'replace')
+        for name, value in fields
+    ) + b'\r\n'
+
+
+def format_warc_date(timestamp):
+    return '%s.%06dZ' % (strftime('%Y-%m-%dT%H:%M:%S', gmtime(timestamp)), round(timestamp % 1 * 1e6) % 1000000)
+
+
+_RE_WARC_DATE = re.compile(r'^(\d{4})-?(\d\d)-?(\d\d)T(\d\d):?(\d\d):?(\d\d)(\.\d+)?Z$')
+
+
+def parse_warc_date(text):
+    match = _RE_WARC_DATE.match(text.strip())
+    if not match:
+        raise ValueError("Invalid WARC-Date: %r" % (text,))
+    fraction = float(match.group(7)) if match.group(7) else 0.0
+    return timegm(tuple(int(group) for group in match.groups()[:6])) + fraction
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# reading
+
+class WarcRecord(object):
+    """
+    A record read from a WARC file. `fields` are its WARC header fields, and `block` is a readable file object over its content
+    block, which reads no further than the end of the record.
+    """
+
+    def __init__(self, fields, block):
+        self.fields = fields
+        self.block = block
+
+    def field(self, name, default=None):
+        name = name.lower()
+        for field_name, value in self.fields:
+            if field_name.lower() == name:
+                return value
+        return default
+
+    def close(self):
+        self.block.close()
+
+
+def open_warc_record(file_path, offset):
+    """
+    Opens the record that starts at `offset` in the given WARC file. The record's block is then streamed from disk as it is read.
+    """
+    file_in = open(file_path, 'rb')
+    try:
+        file_in.seek(offset)
+        stream = gzip.GzipFile(fileobj=file_in, mode='rb') if file_path.endswith('.gz') else file_in
+        version = stream.readline()
+        if not version.startswith(b'WARC/'):
+            raise ValueError("No WARC record at offset %d of %s" % (offset, file_path))
+        fields = read_header_fields(stream, 'UTF-8')
+        length = int(dict((name.lower(), value) for name, value in fields)['content-length'])
+    except Exception:
+        file_in.close()
+        raise
+    return WarcRecord(fields, BoundedReader(stream, length, closeables=(stream, file_in)))
+
+
+def iter_warc_records(file_path):
+    """
+    Scans the given WARC file, and yields an `(offset, record)` pair for every record in it. The records' blocks are truncated to
+    their first `RECORD_HEAD_SIZE` bytes. In compressed WARC files, records must each be compressed as a separate gzip member,
+    else only the first record of every member is seen.
+    """
+    with open(file_path, 'rb') as file_in:
+        iter_heads = _iter_gzip_member_heads if file_path.endswith('.gz') else _iter_plain_record_heads
+        for offset, head in iter_heads(file_in):
+            stream = BytesIO(head)
+            if not stream.readline().startswith(b'WARC/'):
+                continue
+            fields = read_header_fields(stream, 'UTF-8')
+            yield offset, WarcRecord(fields, stream)
+
+
+def _iter_gzip_member_heads(file_in):
+    offset = 0
+    pending = b'' # compressed data that's been read from the file, but not yet decompressed
+    while True:
+        if not pending:
+            pending = file_in.read(64 * 1024)
+            if not pending:
+                return
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        head = b''
+        member_size = 0
+        while True:
+            head += decompressor.decompress(pending)[:RECORD_HEAD_SIZE - len(head)]
+            if decompressor.unused_data:
+                # NB once the end of the member has been reached, any further input ends up here
+                member_size += len(pending) - len(decompressor.unused_data)
+                pending = decompressor.unused_data
+                break
+            member_size += len(pending)
+            pending = file_in.read(64 * 1024)
+            if not pending:
+                break
+        yield offset, head
+        offset += member_size
+
+
+def _iter_plain_record_heads(file_in):
+    while True:
+        offset = file_in.tell()
+        version = file_in.readline()
+        if not version:
+            break
+        if not version.strip():
+            continue # there's supposed to be exactly two blank lines between records, but let's be lenient
+        header = version
+        length = 0
+        while True:
+            line = file_in.readline()
+            header += line
+            if not line.strip():
+                break
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value.strip())
+        yield offset, header + file_in.read(min(length, RECORD_HEAD_SIZE))
+        file_in.seek(offset + len(header) + length)
+
+
+def read_header_fields(stream, encoding):
+    """
+    Reads "Name: value" lines from `stream` up to and including the next blank line, and returns them as a list of pairs.
+    """
+    fields = []
+    while True:
+        line = stream.readline()
+        if not line.strip():
+            return fields
+        line = line.decode(encoding, 'replace').rstrip('\r\n')
+        if line[:1] in (' ', '\t') and fields:
+            # obsolete line folding
+            fields[-1] = (fields[-1][0], fields[-1][1] + ' ' + line.strip())
+        else:
+            name, _, value = line.partition(':')
+            fields.append((name.strip(), value.strip()))
+
+
+_RE_STATUS_LINE = re.compile(r'^HTTP/(\d)\.(\d)\s+(\d{3})(?:\s+(.*))?$')
+
+
+def read_http_response_head(stream):
+    """
+    Reads the status line and headers of the HTTP response at the start of a WARC response record's block. Returns a tuple of the
+    status code, reason, version (as in `httplib`, e.g. 11 for HTTP/1.1) and a list of headers.
+    """
+    status_line = stream.readline().decode('iso-8859-1').rstrip('\r\n')
+    match = _RE_STATUS_LINE.match(status_line)
+    if not match:
+        raise ValueError("Invalid HTTP status line: %r" % (status_line,))
+    major, minor, status, reason = match.groups()
+    headers = read_header_fields(stream, 'iso-8859-1')
+    return int(status), reason or '', int(major) * 10 + int(minor), headers
+
+
+class BoundedReader(object):
+    """
+    Readable file-like object that reads at most `length` bytes from `stream`. Closing it closes the given `closeables`.
+    """
+
+    def __init__(self, stream, length, closeables=()):
+        self.stream = stream
+        self.remaining = length
+        self.closeables = closeables
+        self.closed = False
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.stream.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        line = self.stream.readline(size) if size else b''
+        self.remaining -= len(line)
+        return line
+
+    def close(self):
+        for closeable in self.closeables:
+            closeable.close()
+        self.closed = True
+
+
+class DechunkingReader(object):
+    """
+    Readable file-like object that decodes the chunked transfer encoding. Crawlers that write WARC files usually store bodies as
+    they came over the wire, chunked encoding included. If the data turns out not to be chunked after all (some tools decode it
+    but leave the header in), it is passed through as is.
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+        self._buffer = b''
+        self._done = False
+        self._passthrough = False
+        self._first_chunk = True
+
+    def read(self, size=-1):
+        while not self._done and (size is None or size < 0 or len(self._buffer) < size):
+            self._read_chunk()
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_chunk(self):
+        if self._passthrough:
+            data = self.wrapped.read(64 * 1024)
+            self._buffer += data
+            self._done = not data
+            return
+        line = self.wrapped.readline()
+        try:
+            size = int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            if not self._first_chunk:
+                raise ValueError("Invalid chunk size line: %r" % (line,))
+            self._buffer += line
+            self._passthrough = True
+            return
+        self._first_chunk = False
+        if size == 0:
+            self._done = True
+        else:
+            self._buffer += self.wrapped.read(size)
+            self.wrapped.readline() # the CRLF that ends the chunk
+
+    def close(self):
+        self.wrapped.close()
+
+    @property
+    def closed(self):
+        return self.wrapped.closed
+
+#----------------------------------------------------------------------------------------------------------------------------------
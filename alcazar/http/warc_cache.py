@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# We access a lot of properties whose name starts with an underscore in here, e.g. ._fp -- pylint: disable=protected-access
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from contextlib import closing
+import logging
+from os import listdir, path, makedirs
+from tempfile import TemporaryFile
+from threading import RLock
+from time import time
+
+# 3rd parties
+import requests
+try:
+    from requests.packages import urllib3
+except ImportError:
+    import urllib3
+
+# alcazar
+from ..utils.compatibility import pickle
+from .cache_base import Cache, CacheEntry
+from .cache_keys import Md5KeyScheme
+from .cache_storage import AutoClosingFile, MockedHttplibResponse, tee_response_body
+from .warc import (
+    CACHE_KEY_FIELD, EXCEPTION_CONTENT_TYPE, REQUEST_METHOD_FIELD, WARC_FILE_EXTENSIONS,
+    CdxIndex, CdxLine, DechunkingReader, WarcWriter,
+    field_to_key, format_http_response_head, iter_warc_records, key_to_field, open_warc_record, parse_warc_date,
+    read_http_response_head,
+)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class WarcCache(Cache):
+    """
+    Cache that stores its entries as records in standard WARC files, the format used by web archives, rather than in a shelf and
+    one file per body. New entries are appended to a WARC file of their own, and a `CdxIndex` maps cache keys to records.
+
+    WARC files produced by other tools, e.g. an archival crawler, can be dropped into the cache directory: they get indexed when
+    the cache is next built, after which their responses are served straight from the WARC files, without any conversion. Since
+    those files don't say what cache key their records were saved under, each response record is assumed to be for a GET request
+    of its target URI, and `key_for_archived_url` computes its key with `key_scheme`, which should be the HttpClient's.
+
+    Bodies are never loaded to memory: a record is read by seeking to its offset in the WARC file, and then streaming its block.
+    Entries that are overwritten or discarded are dropped from the index, but remain in the WARC files, which are append-only.
+    For the same reason, this cache can't be purged: `purge` does nothing.
+    """
+
+    index_file_name = 'index.cdx'
+
+    def __init__(self, cache_root_path, index, key_scheme=None):
+        self.cache_root_path = cache_root_path
+        self.index = index
+        self.key_scheme = key_scheme if key_scheme is not None else Md5KeyScheme()
+        self.writer = WarcWriter(cache_root_path, on_new_file=index.add_file)
+        self.lock = RLock()
+
+    @classmethod
+    def build(cls, cache_root_path, key_scheme=None):
+        """
+        Builds a cache in the given directory, and indexes any WARC files in it that aren't indexed yet.
+        """
+        if not path.isdir(cache_root_path):
+            makedirs(cache_root_path)
+        cache = cls(cache_root_path, CdxIndex(path.join(cache_root_path, cls.index_file_name)), key_scheme)
+        cache.index_new_files()
+        return cache
+
+    def index_new_files(self):
+        """
+        Adds to the index the records of the WARC files in the cache directory that it doesn't cover yet. Returns how many records
+        were indexed.
+        """
+        cdx_lines = []
+        with self.lock:
+            for file_name in sorted(listdir(self.cache_root_path)):
+                if file_name.endswith(WARC_FILE_EXTENSIONS) and not self.index.covers_file(file_name):
+                    num_indexed = len(cdx_lines)
+                    cdx_lines.extend(self._index_file(file_name))
+                    self.index.add_file(file_name)
+                    logging.info("%s: indexed %d records", file_name, len(cdx_lines) - num_indexed)
+            self.index.merge(cdx_lines)
+        return len(cdx_lines)
+
+    def _index_file(self, file_name):
+        for offset, record in iter_warc_records(path.join(self.cache_root_path, file_name)):
+            warc_type = record.field('WARC-Type')
+            content_type = record.field('Content-Type', '')
+            url = record.field('WARC-Target-URI')
+            key = record.field(CACHE_KEY_FIELD)
+            if warc_type == 'metadata' and content_type == EXCEPTION_CONTENT_TYPE and key is not None:
+                status = None
+            elif warc_type == 'response' and content_type.startswith('application/http') and url is not None:
+                try:
+                    status = read_http_response_head(record.block)[0]
+                except ValueError:
+                    logging.warning("%s: skipping response record at offset %d, invalid HTTP response", file_name, offset)
+                    continue
+            else:
+                continue
+            yield CdxLine(
+                key=field_to_key(key) if key is not None else self.key_for_archived_url(url),
+                timestamp=parse_warc_date(record.field('WARC-Date')),
+                method=record.field(REQUEST_METHOD_FIELD, 'GET' if url is not None else None),
+                status=status,
+                url=url,
+                file_name=file_name,
+                offset=offset,
+            )
+
+    def key_for_archived_url(self, url):
+        """
+        Returns the cache key for a response record, found in a WARC file written by another tool, for the given URL.
+        """
+        prepared_request = requests.PreparedRequest()
+        prepared_request.prepare_url(url, None)
+        return self.key_scheme.compute('GET', prepared_request.url, None)
+
+    def get(self, key, min_timestamp):
+        with self.lock:
+            cdx_line = self.index.lookup(key)
+        if cdx_line is None or cdx_line.timestamp < (min_timestamp or 0):
+            return None
+        record = open_warc_record(path.join(self.cache_root_path, cdx_line.file_name), cdx_line.offset)
+        if cdx_line.status is None:
+            with closing(record):
+                exception = pickle.loads(record.block.read())
+            return CacheEntry(response=None, exception=exception, timestamp=cdx_line.timestamp)
+        try:
+            response, raw_headers = self._load_response(cdx_line, record)
+        except Exception:
+            record.close()
+            raise
+        return CacheEntry(response=response, exception=None, timestamp=cdx_line.timestamp, raw_headers=raw_headers)
+
+    @staticmethod
+    def _load_response(cdx_line, record):
+        status, reason, version, header_list = read_http_response_head(record.block)
+        headers = urllib3._collections.HTTPHeaderDict()
+        for name, value in header_list:
+            headers.add(name, value)
+        body = record.block
+        if 'chunked' in headers.get('Transfer-Encoding', '').lower():
+            # NB we decode the chunks here, so urllib3 mustn't try to
+            del headers['Transfer-Encoding']
+            body = DechunkingReader(body)
+        request = requests.PreparedRequest()
+        request.prepare_method(cdx_line.method or 'GET')
+        request.url = cdx_line.url
+        request.prepare_headers({})
+        raw = urllib3.HTTPResponse(
+            headers=headers,
+            status=status,
+            reason=reason,
+            version=version,
+            request_method=request.method,
+            preload_content=False,
+            decode_content=False,
+            body=AutoClosingFile(body),
+        )
+        raw._original_response = MockedHttplibResponse(raw)
+        # NB this does the same as requests.adapters.HTTPAdapter.build_response
+        response = requests.Response()
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.raw = raw
+        response.reason = reason
+        response.url = cdx_line.url
+        response.request = request
+        requests.cookies.extract_cookies_to_jar(response.cookies, request, raw)
+        return response, headers
+
+    def put(self, key, entry):
+        if entry.response is None:
+            block = pickle.dumps(entry.exception, protocol=pickle.HIGHEST_PROTOCOL)
+            request = getattr(entry.exception, 'request', None)
+            self._write_record(key, entry, 'metadata', request, None, [
+                ('Content-Type', EXCEPTION_CONTENT_TYPE),
+            ], [block], len(block))
+            return
+        response = entry.response
+        # NB we can't write the record until we know the body's length, so the body is first spooled to a temporary file
+        spool = TemporaryFile(dir=self.cache_root_path)
+        def complete():
+            spool.flush()
+            body_length = spool.tell()
+            spool.seek(0)
+            headers = entry.raw_headers if entry.raw_headers is not None else response.headers
+            head = format_http_response_head(
+                response.status_code,
+                response.reason,
+                getattr(response.raw, 'version', 11),
+                [
+                    # NB the body is saved de-chunked, so the header must go
+                    (name, value)
+                    for name, value in getattr(headers, 'iteritems', headers.items)()
+                    if name.lower() != 'transfer-encoding'
+                ],
+            )
+            self._write_record(key, entry, 'response', response.request, response.status_code, [
+                ('Content-Type', 'application/http; msgtype=response'),
+            ], [head, spool], len(head) + body_length)
+        tee_response_body(response, spool, complete)
+
+    def _write_record(self, key, entry, warc_type, request, status, fields, block_parts, block_length):
+        url = request.url if request is not None else None
+        method = request.method if request is not None else None
+        fields = list(fields) + [
+            (CACHE_KEY_FIELD, key_to_field(key)),
+        ]
+        if url is not None:
+            fields += [
+                ('WARC-Target-URI', url),
+                (REQUEST_METHOD_FIELD, method),
+            ]
+        with self.lock:
+            file_name, offset = self.writer.write_record(warc_type, fields, block_parts, block_length, entry.timestamp)
+            self.index.insert(CdxLine(key, entry.timestamp, method, status, url, file_name, offset))
+
+    def refresh(self, key, entry):
+        # NB the record is left as it is, so the updated headers are lost, but the timestamp, which is what matters, is updated
+        with self.lock:
+            cdx_line = self.index.lookup(key)
+            if cdx_line is not None:
+                self.index.insert(cdx_line._replace(timestamp=entry.timestamp))
+
+    def discard(self, key):
+        with self.lock:
+            return self.index.delete(key, time())
+
+    def close(self):
+        with self.lock:
+            self.writer.close()
+            self.index.close()
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -19,6 +19,7 @@ from .exceptions import (
     HuskerValueError,
 )
 from .jmespath import JmesPathHusker
+from .plan import ExtractionPlan, Field, Scope
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
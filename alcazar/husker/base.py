@@ -14,11 +14,13 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 from datetime import datetime
 from decimal import Decimal, InvalidOperation
 from functools import reduce, wraps
+from itertools import islice
 import operator
 import re
 
 # alcazar
 from ..utils.compatibility import PY2, string_types, text_type
+from ..utils.lru import LruCache
 from ..utils.text import normalize_spaces
 from .exceptions import HuskerLookupError, HuskerMismatch, HuskerMultipleSpecMatch, HuskerNotUnique, HuskerValueError
 
@@ -28,6 +30,9 @@ from .exceptions import HuskerLookupError, HuskerMismatch, HuskerMultipleSpecMat
 _builtin_int = int # pylint: disable=invalid-name
 _unspecified = object() # pylint: disable=invalid-name
 
+# Used by `TextHusker.repr_spec` to show regexes between slashes rather than quotes
+_RE_QUOTED_SPEC = re.compile(r'^u?[\'\"](.*)[\'\"]$')
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class SelectorMixin(object):
@@ -40,9 +45,10 @@ class SelectorMixin(object):
     def __call__(self, *args, **kwargs):
         return self.one(*args, **kwargs)
 
-    def selection(self, *spec):
+    def selection(self, *spec, **kwargs):
         """
-        Runs a search for the given spec, and returns the results, as a ListHusker
+        Runs a search for the given spec, and returns the results, as a ListHusker. If a `limit` kwarg is given, the search stops
+        after that many results have been found, which implementations should push down to the underlying engine where possible.
         """
         raise NotImplementedError
 
@@ -52,26 +58,38 @@ class SelectorMixin(object):
                 husker = self.one(husker)
             yield key, husker
 
+    # NB `one` and `some` only need to know whether there's 0, 1 or more matches, so they ask for at most 2, and `first` and `any`
+    # only ever need the first one. `last` and `all` need the whole selection.
+
     def one(self, *spec):
-        selected = self.selection(*spec)
+        selected = self.selection(*spec, limit=2)
         if len(selected) == 0:
             raise HuskerMismatch('%s found no matches for %s in %s' % (self.id, self.repr_spec(*spec), self.repr_value()))
         elif len(selected) > 1:
-            raise HuskerNotUnique('%s expected 1 match for %s, found %d' % (self.id, self.repr_spec(*spec), len(selected)))
+            raise self._not_unique(spec)
         else:
             return selected[0]
 
     def some(self, *spec):
-        selected = self.selection(*spec)
+        selected = self.selection(*spec, limit=2)
         if len(selected) == 0:
             return NULL_HUSKER
         elif len(selected) > 1:
-            raise HuskerNotUnique('%s expected 1 match for %s, found %d' % (self.id, self.repr_spec(*spec), len(selected)))
+            raise self._not_unique(spec)
         else:
             return selected[0]
 
+    def _not_unique(self, spec):
+        # We've stopped looking after the 2nd match, so re-run the full selection to report the actual count. This only happens on
+        # the error path, so we don't mind the cost.
+        return HuskerNotUnique('%s expected 1 match for %s, found %d' % (
+            self.id,
+            self.repr_spec(*spec),
+            len(self.selection(*spec)),
+        ))
+
     def first(self, *spec):
-        selected = self.selection(*spec)
+        selected = self.selection(*spec, limit=1)
         if len(selected) == 0:
             raise HuskerMismatch('%s found no matches for %s in %s' % (self.id, self.repr_spec(*spec), self.repr_value()))
         else:
@@ -85,7 +103,7 @@ class SelectorMixin(object):
             return selected[-1]
 
     def any(self, *spec):
-        selected = self.selection(*spec)
+        selected = self.selection(*spec, limit=1)
         if len(selected) == 0:
             return NULL_HUSKER
         else:
@@ -318,15 +336,18 @@ class ListHusker(Husker):
     def __add__(self, other):
         return ListHusker(self._value + other._value)
 
-    def selection(self, test=None):
+    def selection(self, test=None, limit=None):
         if test is not None and not callable(test):
             spec = test
             test = lambda child: child.selection(spec)
-        return ListHusker(
-            child
-            for child in self._value
-            if test is None or test(child)
-        )
+        return ListHusker(islice(
+            (
+                child
+                for child in self._value
+                if test is None or test(child)
+            ),
+            limit,
+        ))
 
     def dedup(self, key=None):
         seen = set()
@@ -357,6 +378,8 @@ class ListHusker(Husker):
     multiline = _mapped_property('multiline')
     js = _mapped_operation('js')
     json = _mapped_operation('json')
+    search = _mapped_operation('search')
+    findall = _mapped_operation('findall', cls=list)
     sub = _mapped_operation('sub')
     attrib = _mapped_operation('attrib')
     raw = _mapped_property('raw', cls=list)
@@ -397,7 +420,7 @@ class ScalarHusker(Husker):
         assert value is not None
         super(ScalarHusker, self).__init__(value)
 
-    def selection(self, *spec):
+    def selection(self, *spec, **kwargs):
         return EMPTY_LIST_HUSKER
 
     def repr_spec(self, regex, flags=''):
@@ -422,9 +445,14 @@ class TextHusker(Husker):
         assert value is not None
         super(TextHusker, self).__init__(value)
 
-    def selection(self, regex, flags=''):
+    # Compiled regexes, keyed by (pattern, flags). The `re` module keeps its own cache, but it's small enough that scrapers with
+    # hundreds of distinct patterns will keep evicting from it, so we keep our own, larger one.
+    regex_cache = LruCache(max_size=2048)
+
+    def selection(self, regex, flags='', limit=None):
         regex = self._compile(regex, flags)
-        selected = regex.finditer(self._value)
+        # NB `finditer` is lazy, so with a limit we stop scanning the text as soon as we've got enough matches
+        selected = islice(regex.finditer(self._value), limit)
         if regex.groups < 2:
             return ListHusker(map(_husk, (
                 m.group(regex.groups)
@@ -436,6 +464,27 @@ class TextHusker(Husker):
                 for m in selected
             )
 
+    def search(self, regex, flags=''):
+        """
+        Like `any`, but stops at the first match rather than building a list of all matches. Returns the same value as
+        `selection(regex, flags)[0]` would, or NULL_HUSKER if there's no match.
+        """
+        regex = self._compile(regex, flags)
+        match = regex.search(self._value)
+        if match is None:
+            return NULL_HUSKER
+        elif regex.groups < 2:
+            return _husk(match.group(regex.groups))
+        else:
+            return ListHusker(map(_husk, match.groups()))
+
+    def findall(self, regex, flags=''):
+        """
+        Returns a plain list of raw strings (or tuples of strings, if the regex has more than one group), exactly like
+        `re.findall` does. This skips building a Husker for every match, for when you only need the raw values.
+        """
+        return self._compile(regex, flags).findall(self._value)
+
     def sub(self, regex, replacement, flags=''):
         return TextHusker(
             self._compile(regex, flags).sub(
@@ -467,8 +516,10 @@ class TextHusker(Husker):
         return TextHusker(self._value.upper())
 
     def repr_spec(self, regex, flags=''):
+        if not isinstance(regex, string_types):
+            regex = regex.pattern
         return "%s%s" % (
-            re.sub(r'^u?[\'\"](.*)[\'\"]$', r'/\1/', regex),
+            _RE_QUOTED_SPEC.sub(r'/\1/', regex),
             flags,
         )
 
@@ -481,17 +532,10 @@ class TextHusker(Husker):
     def __str__(self):
         return self._value
 
-    @staticmethod
-    def _compile(regex, flags):
+    @classmethod
+    def _compile(cls, regex, flags):
         if isinstance(regex, string_types):
-            return re.compile(
-                regex,
-                reduce(
-                    operator.or_,
-                    (getattr(re, f.upper()) for f in flags),
-                    0,
-                ),
-            )
+            return cls.regex_cache.get((regex, flags), _compile_regex)
         elif flags == '':
             return regex
         else:
@@ -525,6 +569,7 @@ class NullHusker(Husker):
     multiline = property(_returns_null)
     join = _returns_null
     list = _returns_null
+    search = _returns_null
     sub = _returns_null
     lower = _returns_null
     upper = _returns_null
@@ -534,6 +579,7 @@ class NullHusker(Husker):
 
     form = _returns_none
     json = _returns_null
+    js_var = _returns_null
     str = property(_returns_none)
     int = property(_returns_none)
     float = property(_returns_none)
@@ -544,6 +590,7 @@ class NullHusker(Husker):
 
     map = _returns_null
     map_raw = _returns_none
+    findall = _returns_none
     filter = _returns_null
     lookup = _returns_none
 
@@ -564,6 +611,18 @@ NULL_HUSKER = NullHusker()
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
+def _compile_regex(key):
+    regex, flags = key
+    return re.compile(
+        regex,
+        reduce(
+            operator.or_,
+            (getattr(re, f.upper()) for f in flags),
+            0,
+        ),
+    )
+
+
 def _husk(value):
     if isinstance(value, text_type):
         return TextHusker(value)
@@ -10,6 +10,7 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # standards
+from itertools import islice
 import re
 
 # 3rd parties
@@ -24,19 +25,29 @@ except ImportError:
 from ..forms import Form
 from ..utils.compatibility import bytes_type, text_type, unescape_html
 from ..utils.etree import detach_node, extract_multiline_text, extract_single_line_text
-from ..utils.jsonutils import strip_js_comments
+from ..utils.jsonutils import iter_js_assignments, strip_js_comments
+from ..utils.lru import LruCache
 from .base import Husker, ListHusker, NULL_HUSKER, TextHusker
-from .exceptions import HuskerAttributeNotFound
+from .exceptions import HuskerAttributeNotFound, HuskerMismatch
+from .jmespath import JmesPathHusker
 
 #----------------------------------------------------------------------------------------------------------------------------------
 # globals
 
 _unspecified = object() # pylint: disable=invalid-name
 
+# Compiled paths that just select elements by tag name, and that `selection` can therefore evaluate without XPath
+_RE_SIMPLE_XPATH = re.compile(r'^(//|\.//|\./)([a-zA-Z_][\w\-\.]*)$')
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class ElementHusker(Husker):
 
+    # Translating paths to XPath (esp. from CSS selectors) and compiling the XPath expressions often costs more than evaluating
+    # them, so we cache both steps. NB lxml's XPath objects hold a lock during evaluation, so they're safe to share across threads.
+    path_cache = LruCache(max_size=2048)
+    xpath_cache = LruCache(max_size=2048)
+
     def __init__(self, value, is_full_document=False):
         assert value is not None
         super(ElementHusker, self).__init__(value)
@@ -72,30 +83,59 @@ class ElementHusker(Husker):
         for descendant in self._value.iter():
             yield ElementHusker(descendant)
 
-    def selection(self, path):
+    def selection(self, path, limit=None):
         xpath = self._compile_xpath(path)
-        selected = ET.XPath(
-            xpath,
-            # you can use regexes in your paths, e.g. '//a[re:test(text(),"reg(?:ular)?","i")]'
-            namespaces={'re':'http://exslt.org/regular-expressions'},
-        )(self._value)
+        if limit is None:
+            selected = self._evaluate_xpath(xpath)
+        else:
+            selected = self._evaluate_xpath_with_limit(xpath, limit)
         return ListHusker(
             _husk(self._ensure_decoded(v))
             for v in selected
         )
 
+    def _evaluate_xpath(self, xpath):
+        return self.xpath_cache.get(xpath, _build_xpath_evaluator)(self._value)
+
+    def _evaluate_xpath_with_limit(self, xpath, limit):
+        # Paths that simply name a tag are walked lazily using lxml's iterators, so that we can stop at the first few matches
+        # rather than visit the whole tree
+        simple = _RE_SIMPLE_XPATH.match(xpath)
+        if simple:
+            axis, tag = simple.groups()
+            if axis == '//':
+                elements = self._value.getroottree().getroot().iter(tag)
+            elif axis == './/':
+                elements = self._value.iterdescendants(tag)
+            else:
+                elements = self._value.iterchildren(tag)
+            return islice(elements, limit)
+        # Else we wrap the path in a positional predicate. It saves us building Python objects for every node in the result set,
+        # and libxml2 further optimises `[1]` so that it stops at the first match.
+        predicate = '1' if limit == 1 else 'position() <= %d' % limit
+        try:
+            return self._evaluate_xpath('(%s)[%s]' % (xpath, predicate))
+        except ET.XPathError:
+            # The path doesn't evaluate to a node set (e.g. it calls `string()`), so it can't take a predicate
+            return self._evaluate_xpath(xpath)[:limit]
+
     def _compile_xpath(self, path):
+        return self.path_cache.get((path, self.is_full_document), self._path_to_xpath)
+
+    @classmethod
+    def _path_to_xpath(cls, key):
+        path, is_full_document = key
         if re.search(r'(?:^\.(?=/)|/|@|^\w+$)', path):
             return re.sub(
                 r'^(\.?)(/{,2})',
                 lambda m: '%s%s' % (
-                    m.group(1) if self.is_full_document else '.',
+                    m.group(1) if is_full_document else '.',
                     m.group(2) or '//',
                 ),
                 path
             )
         else:
-            return self._css_path_to_xpath(path)
+            return cls._css_path_to_xpath(path)
 
     @staticmethod
     def _ensure_decoded(value):
@@ -148,6 +188,36 @@ class ElementHusker(Husker):
             js = strip_js_comments(js)
         return TextHusker(js)
 
+    def js_assignments(self):
+        """
+        Iterates over the literal values (objects, arrays, strings, numbers, etc) assigned to variables or properties in the
+        <script> tags under this element, e.g. `var config = {...}` or `window.__INITIAL_STATE__ = {...}`, and yields (name,
+        husker) pairs, where the husker is a `JmesPathHusker` over the parsed value. Values that can't be parsed as JSON are
+        skipped. Scripts are scanned one at a time, as the iteration proceeds.
+        """
+        for name, value in self._iter_js_assignments():
+            yield name, JmesPathHusker(value)
+
+    def js_var(self, name, default=_unspecified):
+        """
+        Returns a `JmesPathHusker` over the literal value first assigned to `name` in one of the <script> tags under this element.
+        `name` is as yielded by `js_assignments`, e.g. 'config' or '__INITIAL_STATE__' or 'App.settings'. Scanning stops as soon as
+        the assignment is found, and no other value gets parsed.
+
+        Raises HuskerMismatch if there's no such assignment, unless a `default` is given, in which case that is returned.
+        """
+        for _, value in self._iter_js_assignments(names=(name,)):
+            return JmesPathHusker(value)
+        if default is _unspecified:
+            raise HuskerMismatch('%s found no assignment to JS variable %s' % (self.id, name))
+        return default
+
+    def _iter_js_assignments(self, names=None):
+        for script in self._value.iter('script'):
+            if script.text:
+                for assignment in iter_js_assignments(self._ensure_decoded(script.text), names):
+                    yield assignment
+
     def detach(self, reattach_tail=True):
         detach_node(self._value, reattach_tail=reattach_tail)
         return self
@@ -190,6 +260,14 @@ class ElementHusker(Husker):
 #----------------------------------------------------------------------------------------------------------------------------------
 # utils
 
+def _build_xpath_evaluator(xpath):
+    return ET.XPath(
+        xpath,
+        # you can use regexes in your paths, e.g. '//a[re:test(text(),"reg(?:ular)?","i")]'
+        namespaces={'re':'http://exslt.org/regular-expressions'},
+    )
+
+
 def _husk(value):
     if isinstance(value, text_type):
         # NB this includes _ElementStringResult objects that lxml returns when your xpath ends in "/text()"
@@ -16,8 +16,9 @@ import json
 import jmespath
 
 # alcazar
-from ..utils.compatibility import native_string, text_type
+from ..utils.compatibility import integer_types, native_string, text_type
 from ..utils.jsonutils import lenient_json_loads
+from ..utils.lru import LruCache
 from .base import Husker, ListHusker, NULL_HUSKER, ScalarHusker, TextHusker
 from .exceptions import HuskerValueError
 
@@ -92,16 +93,29 @@ class JmesPathHusker(Husker):
 
     parser = jmespath.parser.Parser()
 
-    def selection(self, path):
-        selected = self.visitor.visit(
-            self.parser.parse(path).parsed,
-            self._value,
-        )
+    # Compiled expressions, keyed by path. jmespath's Parser has a cache of its own, but it's small and evicts at random, so with
+    # many expressions it keeps re-parsing.
+    expression_cache = LruCache(max_size=2048)
+
+    def selection(self, path, limit=None):
+        lookup_steps, parsed = self.expression_cache.get(path, self._compile_expression)
+        if lookup_steps is not None:
+            selected = _follow_lookup_steps(self._value, lookup_steps)
+        else:
+            selected = self.visitor.visit(parsed, self._value)
         if isinstance(selected, ProjectedList):
-            return ListHusker(map(_husk, selected))
+            # NB JMESPath evaluates the whole expression regardless, but at least we only husk what we need
+            return ListHusker(map(_husk, selected[:limit]))
         else:
             return _husk([selected])
 
+    @classmethod
+    def _compile_expression(cls, path):
+        parsed = cls.parser.parse(path).parsed
+        # Expressions that are just a chain of field names and indices, e.g. "items[0].name", are by far the most common. These
+        # can't produce projections, so we can evaluate them without going through the tree interpreter at all.
+        return _flatten_lookup_steps(parsed), parsed
+
     @property
     def str(self):
         return json.dumps(self._value)
@@ -112,6 +126,48 @@ class JmesPathHusker(Husker):
 #----------------------------------------------------------------------------------------------------------------------------------
 # utils
 
+def _flatten_lookup_steps(node):
+    """
+    Returns the sequence of keys (text) and indices (ints) that the given JMESPath AST node looks up, or None if the expression
+    does anything else than looking up keys and indices.
+    """
+    node_type = node['type']
+    if node_type in ('field', 'index'):
+        return (node['value'],)
+    elif node_type in ('identity', 'current'):
+        return ()
+    elif node_type in ('subexpression', 'index_expression'):
+        steps = ()
+        for child in node['children']:
+            child_steps = _flatten_lookup_steps(child)
+            if child_steps is None:
+                return None
+            steps += child_steps
+        return steps
+    else:
+        return None
+
+
+def _follow_lookup_steps(value, steps):
+    # NB this mimics how jmespath's TreeInterpreter handles mismatched types and missing keys, i.e. it evaluates to null
+    for step in steps:
+        if isinstance(step, integer_types):
+            if not isinstance(value, list):
+                return None
+            try:
+                value = value[step]
+            except IndexError:
+                return None
+        else:
+            try:
+                value = value.get(step)
+            except AttributeError:
+                return None
+        if value is None:
+            return None
+    return value
+
+
 def _husk(value):
     if value is None:
         return NULL_HUSKER
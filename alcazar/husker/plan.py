@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import re
+
+# alcazar
+from ..utils.compatibility import string_types
+from .base import NullHusker
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# Field specs
+
+class Field(object):
+    """
+    Describes how to extract one field from a document: which `select` method to call (one, some, first, any, last or all), with
+    which path, and then what to do with the selected husker. `then` is either a callable that receives the husker, or a string of
+    dotted attribute names, where names ending in "()" are called without arguments, e.g. 'text.normalized' or 'text.lower()'. If
+    the selection is null (e.g. `some` found nothing), a string `then` gives None.
+    """
+
+    select_methods = frozenset(('one', 'some', 'first', 'any', 'last', 'all'))
+
+    def __init__(self, path, select='one', then=None):
+        if select not in self.select_methods:
+            raise ValueError("Invalid select method: %r" % (select,))
+        self.path = path
+        self.select = select
+        self.then = then if then is None or callable(then) else _compile_attribute_chain(then)
+
+    def convert(self, husker):
+        if self.then is None:
+            return husker
+        return self.then(husker)
+
+    def __repr__(self):
+        return 'Field(%r, %r)' % (self.path, self.select)
+
+
+class Scope(object):
+    """
+    A group of fields that are all looked up relative to the node selected by `path`. The node is selected only once per document,
+    so this is how fields that share a common path prefix avoid re-evaluating it. Scopes can be nested.
+    """
+
+    def __init__(self, path, fields, select='one'):
+        if select not in Field.select_methods - {'all'}:
+            raise ValueError("Invalid select method for a scope: %r" % (select,))
+        self.path = path
+        self.select = select
+        self.fields = _compile_fields(fields)
+
+    def __repr__(self):
+        return 'Scope(%r, %r)' % (self.path, self.select)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ExtractionPlan(object):
+    """
+    A declarative description of the data to be extracted from a page, as a dict that maps field names to specs. A spec is either
+    a path string (same as `Field(path)`, which returns the husker matched by `one(path)`), a `Field`, or a `Scope`, whose fields
+    are returned as a nested dict.
+
+    The plan is compiled once, and can then be applied to any number of documents. Within a given scope, identical selections are
+    only run once, even when several fields use them, and the usual `HuskerMismatch` / `HuskerNotUnique` errors are raised as soon
+    as a field fails to match.
+
+        PRODUCT_PLAN = ExtractionPlan({
+            'name': Field('h1', then='text.normalized'),
+            'price': Field('span.price', then='decimal'),
+            'tags': Field('ul.tags li', select='all', then='str'),
+            'seller': Scope('div#seller', {
+                'name': Field('a.name', then='str'),
+                'rating': Field('span.rating', select='some', then='float'),
+            }),
+        })
+
+        record = PRODUCT_PLAN.extract(page)
+    """
+
+    def __init__(self, fields):
+        self.fields = _compile_fields(fields)
+
+    def extract(self, husker):
+        # NB `Page` objects carry their husker in `.husker`, but they forward attribute lookups to it anyway
+        husker = getattr(husker, 'husker', husker)
+        return _extract_fields(husker, self.fields)
+
+    __call__ = extract
+
+    def __repr__(self):
+        return 'ExtractionPlan(%s)' % ', '.join(key for key, _ in self.fields)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# utils
+
+_RE_ATTRIBUTE = re.compile(r'^(\w+)(\(\))?$')
+
+
+def _compile_attribute_chain(chain):
+    steps = []
+    for name in chain.split('.'):
+        match = _RE_ATTRIBUTE.match(name)
+        if not match:
+            raise ValueError("Invalid attribute chain: %r" % (chain,))
+        steps.append((match.group(1), bool(match.group(2))))
+    steps = tuple(steps)
+    def follow(value):
+        for name, is_call in steps:
+            if isinstance(value, NullHusker):
+                return None
+            value = getattr(value, name)
+            if is_call:
+                value = value()
+        return value
+    return follow
+
+
+def _compile_fields(fields):
+    compiled = []
+    for key in sorted(fields):
+        spec = fields[key]
+        if isinstance(spec, string_types):
+            spec = Field(spec)
+        elif not isinstance(spec, (Field, Scope)):
+            raise ValueError("Invalid spec for field %r: %r" % (key, spec))
+        compiled.append((key, spec))
+    return tuple(compiled)
+
+
+def _extract_fields(husker, fields):
+    selections = {}
+    extracted = {}
+    for key, spec in fields:
+        selection_key = (spec.select, spec.path)
+        selected = selections.get(selection_key)
+        if selected is None:
+            selected = selections[selection_key] = getattr(husker, spec.select)(spec.path)
+        if isinstance(spec, Scope):
+            extracted[key] = _extract_fields(selected, spec.fields)
+        else:
+            extracted[key] = spec.convert(selected)
+    return extracted
+
+#----------------------------------------------------------------------------------------------------------------------------------
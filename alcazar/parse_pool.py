@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from collections import deque, namedtuple
+from multiprocessing import Pool
+from types import GeneratorType
+
+# 3rd parties
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# alcazar
+from .datastructures import Query, QueryMethods
+from .exceptions import ScraperError, SkipThisPage
+from .http.metrics import NullMetricsSink
+from .utils.compatibility import string_types
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# globals
+
+# What a worker process sends back for every page it parsed. `error` is the SkipThisPage or ScraperError that the parsing raised,
+# if any, else `payload` is what `parse` returned. `queries` are the queries that `parse` enqueued, in the order in which the
+# worker's scheduler would've popped them.
+ParseResult = namedtuple('ParseResult', (
+    'payload',
+    'error',
+    'queries',
+))
+
+# The scraper that parses pages in this worker process. Only ever set in worker processes, by `_init_worker`.
+_worker_scraper = None # pylint: disable=invalid-name
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ParsePool(object):
+    """
+    Parses pages in a pool of `num_processes` worker processes, so that a crawl can use more than one core for the CPU-bound work
+    of building the parse tree and running the `parse` method, while the main process keeps fetching.
+
+    Each worker builds its own instance of the scraper's class, passing it the kwargs returned by the scraper's
+    `parse_worker_kwargs`. What goes through the pipes is pickled: the query, with its methods sent by name, and the response's
+    status, headers and body bytes on the way in, and the payload and any follow-up queries on the way out. Parse trees never
+    leave the worker, so neither the payload nor the queries' extras may contain huskers or anything else that can't be pickled.
+
+    Results are handed back in the order in which the pages were submitted.
+    """
+
+    def __init__(self, scraper, num_processes):
+        self.scraper = scraper
+        self.max_pending = 2 * num_processes
+        self._pool = Pool(
+            num_processes,
+            initializer=_init_worker,
+            initargs=(type(scraper), scraper.parse_worker_kwargs()),
+        )
+        self._pending = deque()
+
+    @property
+    def num_pending(self):
+        return len(self._pending)
+
+    @property
+    def is_full(self):
+        return len(self._pending) >= self.max_pending
+
+    def submit(self, query, page):
+        async_result = self._pool.apply_async(_parse_in_worker, (
+            query_to_spec(self.scraper, query),
+            response_to_spec(page.response),
+        ))
+        self._pending.append((query, page, async_result))
+
+    def pop_parsed(self, block=True):
+        """
+        Returns a `(query, page, parse_result)` tuple for the page submitted first, or None if its parsing isn't done and `block`
+        is False. The queries in `parse_result` are bound to this process's scraper. Errors other than the ones caught by
+        `_parse_in_worker` are re-raised here.
+        """
+        if not self._pending:
+            return None
+        query, page, async_result = self._pending[0]
+        if not block and not async_result.ready():
+            return None
+        self._pending.popleft()
+        result = async_result.get()
+        return query, page, result._replace(queries=[
+            query_from_spec(self.scraper, spec)
+            for spec in result.queries
+        ])
+
+    def close(self):
+        # NB whatever is still pending is abandoned, which only happens if the crawl was interrupted
+        self._pool.terminate()
+        self._pool.join()
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# worker process
+
+class OfflineHttpClient(object):
+    """
+    Takes the place of the `HttpClient` in the workers' scrapers, since workers only parse.
+    """
+
+    metrics = NullMetricsSink()
+    default_headers = {}
+
+    def submit(self, request, config, metrics=None):
+        raise NotImplementedError("Can't fetch %s from a parse worker process" % request)
+
+    def close(self):
+        pass
+
+
+def _init_worker(scraper_class, scraper_kwargs):
+    global _worker_scraper # pylint: disable=global-statement,invalid-name
+    _worker_scraper = scraper_class(http_client=OfflineHttpClient(), **scraper_kwargs)
+
+
+def _parse_in_worker(query_spec, response_spec):
+    scraper = _worker_scraper
+    query = query_from_spec(scraper, query_spec)
+    payload = error = None
+    try:
+        page = scraper.fetcher.build_page(query, response_from_spec(response_spec))
+        payload = query.methods.parse(page)
+        if isinstance(payload, GeneratorType):
+            payload = tuple(payload)
+    except (SkipThisPage, ScraperError) as parse_error:
+        error = parse_error
+    queries = []
+    scheduler = scraper.scheduler
+    while not scheduler.empty:
+        queries.append(query_to_spec(scraper, scheduler.pop()))
+    return ParseResult(payload, error, queries)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# serialization
+
+def query_to_spec(scraper, query):
+    """
+    Returns a picklable tuple that describes `query`. Methods that are bound to `scraper` are sent by name, and bound again to the
+    scraper at the other end, as the comment in `Query` foresaw; any other callables must be picklable.
+    """
+    methods = {}
+    for name in QueryMethods.method_names:
+        method = getattr(query.methods, name)
+        if getattr(method, '__self__', None) is scraper:
+            method = method.__name__
+        methods[name] = method
+    return (query.request, methods, query.config, query.extras, query.depth, query.attempt, query.not_before)
+
+
+def query_from_spec(scraper, spec):
+    request, methods, config, extras, depth, attempt, not_before = spec
+    methods = QueryMethods({
+        name: getattr(scraper, method) if isinstance(method, string_types) else method
+        for name, method in methods.items()
+    })
+    return Query(request, methods, config, extras, depth, attempt, not_before)
+
+
+def response_to_spec(response):
+    return (
+        response.status_code,
+        response.reason,
+        response.url,
+        list(response.headers.items()),
+        response.encoding,
+        response.content,
+    )
+
+
+def response_from_spec(spec):
+    response = requests.Response()
+    response.status_code, response.reason, response.url, headers, response.encoding, content = spec
+    response.headers = CaseInsensitiveDict(headers)
+    response._content = content # pylint: disable=protected-access
+    return response
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from collections import namedtuple
+from contextlib import contextmanager
+import cProfile
+import io
+import logging
+from os import makedirs, path
+import pstats
+from threading import Lock
+from time import time
+try:
+    from time import thread_time as cpu_time
+except ImportError:
+    from time import clock as cpu_time # NB on Python 2 this is the CPU time of the whole process
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = NotImplemented # pylint: disable=invalid-name
+
+# alcazar
+from .utils.compatibility import PY2
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# globals
+
+# The stages of the scraping of a query that get profiled. Note that they nest: `fetch` includes `decode`, `parse` and `husk`,
+# which the Fetcher runs before returning the page.
+STAGES = (
+    'fetch',          # `Scraper.fetch`, i.e. download and build the page
+    'decode',         # decode the body bytes to text
+    'parse',          # parse the text to a tree or a JSON object
+    'husk',           # build the husker around the parsed document
+    'parse_callback', # `Scraper.parse`, i.e. the user code that extracts the payload
+    'record_payload', # `Scraper.record_payload`
+    'handle_error',   # `Scraper.handle_error`, called when a query failed and will be re-attempted
+    'backoff',        # waiting for the time of the next attempt, or for the host to be unpaused
+)
+
+StageTiming = namedtuple('StageTiming', (
+    'wall_seconds',
+    'cpu_seconds',
+))
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# profiler
+
+class Profiler(object):
+    """
+    Runs the given `StageHook`s around every stage of the scraping of a query, on behalf of the scraper whose ID is `scraper_id`.
+    With no hooks, the stages aren't even timed.
+    """
+
+    def __init__(self, scraper_id=None, hooks=()):
+        self.scraper_id = scraper_id
+        self.hooks = tuple(hooks)
+
+    @contextmanager
+    def stage(self, stage):
+        if not self.hooks:
+            yield
+            return
+        states = [hook.enter_stage(self.scraper_id, stage) for hook in self.hooks]
+        wall_before = time()
+        cpu_before = cpu_time()
+        try:
+            yield
+        finally:
+            timing = StageTiming(time() - wall_before, cpu_time() - cpu_before)
+            for hook, state in reversed(list(zip(self.hooks, states))):
+                hook.exit_stage(self.scraper_id, stage, state, timing)
+
+    def report(self):
+        for hook in self.hooks:
+            hook.report(self.scraper_id)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# hooks
+
+class StageHook(object):
+    """
+    Called around every stage of the scraping of every query. The same hook can be given to several scrapers, so everything is
+    keyed by scraper ID, and since scrapers can run in separate threads, implementations that keep state must lock.
+    """
+
+    def enter_stage(self, scraper_id, stage):
+        """
+        Called as the stage starts. Whatever this returns is passed back to `exit_stage`.
+        """
+
+    def exit_stage(self, scraper_id, stage, state, timing):
+        """
+        Called as the stage ends, whether or not it raised, with the `StageTiming` it took.
+        """
+
+    def report(self, scraper_id):
+        """
+        Called at the end of a crawl, to report on what was collected for the given scraper. Does nothing by default.
+        """
+
+
+StageStats = namedtuple('StageStats', (
+    'count',
+    'wall_seconds',
+    'cpu_seconds',
+    'max_wall_seconds',
+))
+
+
+class StageTimer(StageHook):
+    """
+    Totals, per scraper and per stage, how many times the stage ran, and how much wall clock and CPU time it took. A stage whose
+    CPU time is close to its wall time is CPU-bound; one that spends most of its time waiting is I/O-bound.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._totals = {}
+
+    def exit_stage(self, scraper_id, stage, state, timing):
+        with self._lock:
+            totals = self._totals.setdefault(scraper_id, {}).get(stage)
+            if totals is None:
+                totals = self._totals[scraper_id][stage] = [0, 0.0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += timing.wall_seconds
+            totals[2] += timing.cpu_seconds
+            totals[3] = max(totals[3], timing.wall_seconds)
+
+    def stats(self, scraper_id):
+        """
+        Returns a dict that maps the name of every stage that ran for the given scraper to a `StageStats` tuple.
+        """
+        with self._lock:
+            return {
+                stage: StageStats(*totals)
+                for stage, totals in self._totals.get(scraper_id, {}).items()
+            }
+
+    def format_report(self, scraper_id):
+        stats = self.stats(scraper_id)
+        lines = ['[profile] %s' % (scraper_id or '(no id)')]
+        for stage in sorted(stats, key=_stage_sort_key):
+            stage_stats = stats[stage]
+            lines.append('  {:<14} n={:<7} wall={:.3f}s cpu={:.3f}s ({:.0%} cpu) mean={:.4f}s max={:.4f}s'.format(
+                stage,
+                stage_stats.count,
+                stage_stats.wall_seconds,
+                stage_stats.cpu_seconds,
+                stage_stats.cpu_seconds / stage_stats.wall_seconds if stage_stats.wall_seconds else 0.0,
+                stage_stats.wall_seconds / stage_stats.count,
+                stage_stats.max_wall_seconds,
+            ))
+        return '\n'.join(lines)
+
+    def report(self, scraper_id):
+        logging.info(self.format_report(scraper_id))
+
+
+class SamplingHook(StageHook):
+    """
+    Base class for the hooks that are too expensive to run every time: only every `sample_every`-th run of each stage, per scraper,
+    is sampled, and only for the stages in `stages` (all of them if None).
+    """
+
+    def __init__(self, sample_every=100, stages=None):
+        self.sample_every = sample_every
+        self.stages = None if stages is None else frozenset(stages)
+        self._lock = Lock()
+        self._counters = {}
+
+    def _should_sample(self, scraper_id, stage):
+        if self.stages is not None and stage not in self.stages:
+            return False
+        with self._lock:
+            count = self._counters.get((scraper_id, stage), 0)
+            self._counters[(scraper_id, stage)] = count + 1
+        return count % self.sample_every == 0
+
+
+class CProfileSampler(SamplingHook):
+    """
+    Runs the sampled stages under cProfile, and accumulates the results per scraper and per stage. Recent Pythons only allow one
+    profiler to be active at a time in the whole process, so a stage that starts while another is being profiled, whether it's
+    nested in it or running in another thread, is never sampled.
+    """
+
+    def __init__(self, sample_every=100, stages=None, num_report_lines=20):
+        super(CProfileSampler, self).__init__(sample_every, stages)
+        self.num_report_lines = num_report_lines
+        self._is_profiling = False
+        self._stats = {}
+
+    def enter_stage(self, scraper_id, stage):
+        if self._is_profiling or not self._should_sample(scraper_id, stage):
+            return None
+        with self._lock:
+            if self._is_profiling:
+                return None
+            self._is_profiling = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError: # some other profiler is active
+            self._is_profiling = False
+            return None
+        return profile
+
+    def exit_stage(self, scraper_id, stage, state, timing):
+        if state is None:
+            return
+        state.disable()
+        self._is_profiling = False
+        with self._lock:
+            stats = self._stats.get((scraper_id, stage))
+            if stats is None:
+                self._stats[(scraper_id, stage)] = pstats.Stats(state)
+            else:
+                stats.add(state)
+
+    def stats(self, scraper_id, stage):
+        """
+        Returns the `pstats.Stats` accumulated for the given scraper and stage, or None if that stage was never sampled.
+        """
+        with self._lock:
+            return self._stats.get((scraper_id, stage))
+
+    def dump_stats(self, dir_path):
+        """
+        Saves the stats for every scraper and stage to `dir_path`, as `<scraper_id>.<stage>.prof` files that can be loaded with
+        `pstats` or any of the tools that read its format.
+        """
+        if not path.isdir(dir_path):
+            makedirs(dir_path)
+        with self._lock:
+            for (scraper_id, stage), stats in self._stats.items():
+                stats.dump_stats(path.join(dir_path, '%s.%s.prof' % (scraper_id or 'scraper', stage)))
+
+    def report(self, scraper_id):
+        with self._lock:
+            stages = sorted(
+                (stage for other_id, stage in self._stats if other_id == scraper_id),
+                key=_stage_sort_key,
+            )
+        for stage in stages:
+            stream = io.BytesIO() if PY2 else io.StringIO()
+            with self._lock:
+                stats = self._stats[(scraper_id, stage)]
+                stats.stream = stream
+                stats.sort_stats('cumulative').print_stats(self.num_report_lines)
+            logging.info('[profile] %s %s\n%s', scraper_id or '(no id)', stage, stream.getvalue())
+
+
+class TracemallocSampler(SamplingHook):
+    """
+    Takes a tracemalloc snapshot before and after the sampled stages, and totals, per scraper and per stage, the memory allocated
+    from every line of code that was still allocated at the end of the stage. Tracing is started when the first stage is sampled,
+    if it's not on already, and it slows down every allocation from then on, so sample sparingly.
+    """
+
+    def __init__(self, sample_every=100, stages=None, num_frames=1, num_report_lines=10):
+        if tracemalloc is NotImplemented:
+            raise NotImplementedError("tracemalloc module not found")
+        super(TracemallocSampler, self).__init__(sample_every, stages)
+        self.num_frames = num_frames
+        self.num_report_lines = num_report_lines
+        self._sizes = {}
+
+    def enter_stage(self, scraper_id, stage):
+        if not self._should_sample(scraper_id, stage):
+            return None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.num_frames)
+        return self._take_snapshot()
+
+    def exit_stage(self, scraper_id, stage, state, timing):
+        if state is None:
+            return
+        differences = self._take_snapshot().compare_to(state, 'traceback')
+        with self._lock:
+            sizes = self._sizes.setdefault((scraper_id, stage), {})
+            for difference in differences:
+                if difference.size_diff > 0:
+                    sizes[difference.traceback] = sizes.get(difference.traceback, 0) + difference.size_diff
+
+    def top_allocations(self, scraper_id, stage):
+        """
+        Returns a list of `(traceback, num_bytes)` pairs, largest first.
+        """
+        with self._lock:
+            sizes = dict(self._sizes.get((scraper_id, stage), {}))
+        return sorted(sizes.items(), key=lambda item: -item[1])
+
+    def report(self, scraper_id):
+        with self._lock:
+            stages = sorted(
+                (stage for other_id, stage in self._sizes if other_id == scraper_id),
+                key=_stage_sort_key,
+            )
+        for stage in stages:
+            logging.info('[profile] %s %s allocations\n%s', scraper_id or '(no id)', stage, '\n'.join(
+                '  %10d B  %s' % (num_bytes, traceback)
+                for traceback, num_bytes in self.top_allocations(scraper_id, stage)[:self.num_report_lines]
+            ))
+
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# utils
+
+def _stage_sort_key(stage):
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage)
+
+#----------------------------------------------------------------------------------------------------------------------------------
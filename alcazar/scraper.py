@@ -8,20 +8,43 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # standards
+from collections import namedtuple
+import hashlib
 import logging
-from os import path, rename
-from sys import exc_info
-from time import sleep
+from multiprocessing.pool import ThreadPool
+from os import path, remove, rename
+import re
+from shutil import copyfileobj
+from time import sleep, time
 from traceback import format_exc
 from types import GeneratorType
 
+# 3rd parties
+import requests
+
 # alcazar
+from .backoff import ExponentialBackoff
 from .config import ScraperConfig
 from .datastructures import Page, Query, QueryMethods, Request
-from .exceptions import HttpError, ScraperError, SkipThisPage
+from .exceptions import CacheMiss, HttpError, ScraperError, SkipThisPage
 from .fetcher import Fetcher
+from .profiling import Profiler
+from .utils.compatibility import raise_from
 from .utils.urls import join_urls
 
+#----------------------------------------------------------------------------------------------------------------------------------
+# globals
+
+_RE_CONTENT_RANGE = re.compile(r'bytes\s+(\d+)-\d+/(\d+|\*)', re.I)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class Retry(namedtuple('Retry', ('query',))):
+    """
+    Returned by `Scraper.scrape_attempt` when the attempt failed and the query is to be re-attempted. `query` is the query for the
+    next attempt, and its `not_before` says when that attempt is to be made.
+    """
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class Scraper(object):
@@ -30,14 +53,31 @@ class Scraper(object):
     cache_id = None
     num_attempts_per_scrape = 5
 
+    # `StageHook` instances to run around every stage of every scrape, e.g. a `StageTimer`
+    profiling_hooks = ()
+
+    # The `BackoffPolicy` that decides how long to wait before re-attempting a query that failed
+    backoff_policy = ExponentialBackoff()
+
+    # If set, a `CircuitBreaker` that pauses requests to hosts that keep failing. Since it's a class attribute, it's shared by all
+    # instances, which is usually what's wanted.
+    circuit_breaker = None
+
+    # How many bytes at a time `download` reads off the network and writes to disk. Also the smallest segment it'll split a file
+    # into.
+    download_chunk_size = 1024 * 1024
+
     def __init__(self, **kwargs):
         super(Scraper, self).__init__()
         self.id = kwargs.pop('id', self.id)
         if not self.id and self.__class__.__name__ != 'Scraper':
             self.id = self.__class__.__name__
         self.cache_id = kwargs.pop('cache_id', self.cache_id) or self.id
+        self.profiler = Profiler(self.id, kwargs.pop('profiling_hooks', self.profiling_hooks))
+        self.backoff_policy = kwargs.pop('backoff_policy', self.backoff_policy)
+        self.circuit_breaker = kwargs.pop('circuit_breaker', self.circuit_breaker)
         self.base_config = ScraperConfig.from_kwargs(kwargs, self)
-        self.fetcher = Fetcher(self.base_config, **_extract_fetcher_kwargs(kwargs, self))
+        self.fetcher = Fetcher(self.base_config, profiler=self.profiler, **_extract_fetcher_kwargs(kwargs, self))
         if kwargs:
             raise TypeError("Unknown kwargs: %s" % ','.join(sorted(kwargs)))
 
@@ -62,68 +102,291 @@ class Scraper(object):
         else:
             logging.error(format_exc())
 
-    def handle_error(self, _query_unused, _error_unused, attempt_i):
+    def handle_error(self, query, error, attempt_i):
         """
         Called when an error has been encountered but the request will be re-attempted.
+
+        NB this used to sleep before the next attempt, and no longer does. The wait is now done by whoever makes the next attempt
+        (`scrape`, or a `Crawler`, which gets on with other queries in the meantime), for as long as `backoff_policy` says. If this
+        returns a number of seconds, that's waited instead. Overrides written for earlier versions return None, so they still get
+        re-attempted after the policy's delay; if they sleep themselves, that sleep comes on top of the policy's delay, so they
+        should stop sleeping, or use a `backoff_policy` of `ExponentialBackoff(initial=0)`.
         """
-        delay = 5 ** attempt_i
-        _, exc_value, _ = exc_info()
-        logging.info("%s - sleeping %d sec%s", exc_value, delay, '' if delay == 1 else 's')
-        sleep(delay)
+        logging.info("%s - attempt %d of %d failed", error, attempt_i + 1, query.config.num_attempts_per_scrape)
+
+    def retry_delay(self, query, error):
+        """
+        Returns how many seconds to wait before re-attempting `query` after it failed with `error`, or None if it's not to be
+        re-attempted.
+        """
+        if query.attempt + 1 >= query.config.num_attempts_per_scrape:
+            return None
+        if isinstance(error, CacheMiss):
+            # NB the cache is offline, so trying again won't get the page any more than this time
+            return None
+        return self.backoff_policy.delay(error, query.attempt)
 
     def record_skipped_page(self, query, reason):
         logging.info("Skipped %s (%s)", query.request, reason)
         return None
 
     def scrape(self, request_or_query, **kwargs):
+        """
+        Scrapes the query, re-attempting it if it fails, and waiting before each new attempt. A `Crawler` doesn't use this, it
+        calls `scrape_attempt` directly, so that it can scrape other queries while a failed one is waiting to be re-attempted.
+        """
         query = self.query(request_or_query, **kwargs)
+        while True:
+            self._sleep_until(self._not_before(query))
+            result = self.scrape_attempt(query)
+            if not isinstance(result, Retry):
+                return result
+            query = result.query
+
+    def scrape_attempt(self, query):
+        """
+        Makes a single attempt at scraping `query`, and returns whatever `record_payload` or `record_skipped_page` returns. If the
+        attempt fails and the query is to be re-attempted, returns a `Retry` instead. If it fails for good, the error is raised,
+        unless `record_error` returns a substitute value.
+        """
         methods = query.methods
-        for attempt_i in range(query.config.num_attempts_per_scrape):
-            if attempt_i > 0:
-                query = query.replace_config(force_cache_stale=True)
-            try:
-                page = methods.fetch(query)
+        try:
+            page = self._attempt_fetch(query, methods.fetch)
+            with self.profiler.stage('parse_callback'):
                 payload = methods.parse(page)
                 if isinstance(payload, GeneratorType):
                     # consume the generator here so that we can catch any exceptions it might raise
                     payload = tuple(payload)
-            except SkipThisPage as reason:
-                return methods.record_skipped_page(query, reason)
-            except ScraperError as error:
-                if attempt_i + 1 < query.config.num_attempts_per_scrape:
-                    methods.handle_error(query, error, attempt_i)
-                else:
-                    substitute = methods.record_error(query, error)
-                    if substitute is not None:
-                        return substitute
-                    else:
-                        raise
-            else:
+        except SkipThisPage as reason:
+            return methods.record_skipped_page(query, reason)
+        except ScraperError as error:
+            return self._failed_attempt(query, error)
+        else:
+            with self.profiler.stage('record_payload'):
                 return methods.record_payload(page, payload)
 
+    def _attempt_fetch(self, query, fetch):
+        with self.profiler.stage('fetch'):
+            page = fetch(query)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record_success(query.url)
+        return page
+
+    def _failed_attempt(self, query, error):
+        """
+        Deals with an attempt at scraping `query` that failed with `error`, and returns what `scrape_attempt` is to return. This
+        must be called from the `except` block that caught `error`, since that's what's re-raised if the query fails for good.
+        """
+        methods = query.methods
+        circuit_breaker = self.circuit_breaker
+        if circuit_breaker is not None and circuit_breaker.is_failure(error):
+            circuit_breaker.record_failure(query.url)
+        delay = self.retry_delay(query, error)
+        if delay is not None:
+            with self.profiler.stage('handle_error'):
+                handler_delay = methods.handle_error(query, error, query.attempt)
+            if handler_delay is not None:
+                delay = handler_delay
+            return Retry(query.replace(
+                config=query.config._replace(force_cache_stale=True),
+                attempt=query.attempt + 1,
+                not_before=time() + delay,
+            ))
+        substitute = methods.record_error(query, error)
+        if substitute is not None:
+            return substitute
+        else:
+            # NB a bare raise, rather than `raise error`, so that the original traceback is kept on Python 2 too
+            raise # pylint: disable=misplaced-bare-raise
+
+    def _not_before(self, query):
+        """
+        Returns the time before which `query` must not be attempted, which is the later of its own `not_before` and the end of the
+        circuit breaker's pause for its host, or None if it can be attempted straight away.
+        """
+        paused_until = self.circuit_breaker.paused_until(query.url) if self.circuit_breaker is not None else None
+        if paused_until is None or (query.not_before is not None and query.not_before > paused_until):
+            return query.not_before
+        return paused_until
+
+    def _sleep_until(self, not_before):
+        if not_before is not None:
+            delay = not_before - time()
+            if delay > 0:
+                with self.profiler.stage('backoff'):
+                    self._sleep(delay)
+
+    def _sleep(self, delay):
+        # This is in its own method so that tests can override it
+        sleep(delay)
+
     def download(self, request_or_query, local_file_path, overwrite=False, **kwargs):
-        query = self.query(
-            request_or_query,
-            stream=True,
-            **kwargs
+        """
+        Saves the response body to `local_file_path`. The data is written to `<local_file_path>.part`, which is renamed once it's
+        complete, and if an attempt fails, the next one resumes from where it left off, using a `Range` request, unless the server
+        doesn't support them. A `.part` file left over from a previous run is resumed too.
+
+        The size of the file is checked against what the server announced, and against `expected_size` if given. `checksum`, if
+        given, is an `(algorithm, hexdigest)` pair, e.g. `('sha256', '9f86d0...')`, and is checked once the file is complete. If
+        either check fails, the `.part` file is deleted and a ScraperError is raised.
+
+        If `num_segments` is more than 1, and the server supports ranges, the file is split into that many segments, of at least
+        `download_chunk_size` bytes each, which are downloaded in parallel threads. Note that the courtesy sleep still applies
+        between the start of each segment.
+
+        `expected_size`, `checksum` and `num_segments` can only be given as keyword arguments. Other kwargs are as for `query`.
+        """
+        expected_size = kwargs.pop('expected_size', None)
+        checksum = kwargs.pop('checksum', None)
+        num_segments = kwargs.pop('num_segments', 1)
+        if not overwrite and path.exists(local_file_path):
+            logging.info('%s already exists', local_file_path)
+            return
+        query = self.query(request_or_query, **kwargs)
+        query = query.replace(
+            # NB byte ranges are offsets into the encoded body, so we don't want it encoded
+            request=query.request.add_header('Accept-Encoding', 'identity'),
+            extras=dict(query.extras, local_file_path=local_file_path),
         )
-        if overwrite or not path.exists(local_file_path):
-            self.scrape(
-                query,
-                record_payload=lambda page, _payload_unused: self._save_to_disk(local_file_path, page),
-                extras={'local_file_path': local_file_path},
-            )
-            logging.info('%s saved', local_file_path)
+        part_file_path = local_file_path + '.part'
+        segments = self._download_segments(query, num_segments) if num_segments > 1 else None
+        if segments is None:
+            self._download_range(query, part_file_path, 0, None)
         else:
-            logging.info('%s already exists', local_file_path)
+            self._download_segments_in_parallel(query, part_file_path, segments)
+        self._verify_download(part_file_path, expected_size, checksum)
+        rename(part_file_path, local_file_path)
+        logging.info('%s saved', local_file_path)
 
-    @staticmethod
-    def _save_to_disk(local_file_path, page):
-        part_file_path = local_file_path + '.part'
+    def _download_segments_in_parallel(self, query, part_file_path, segments):
+        """
+        Downloads each of the `(start, end)` segments to a file of its own, in parallel threads, and then joins them up into
+        `part_file_path`.
+        """
+        segment_file_paths = ['%s%d' % (part_file_path, segment_i) for segment_i in range(len(segments))]
+        pool = ThreadPool(len(segments))
+        try:
+            pool.map(
+                lambda args: self._download_range(query, *args),
+                [
+                    (segment_file_path, start, end)
+                    for segment_file_path, (start, end) in zip(segment_file_paths, segments)
+                ],
+            )
+        finally:
+            pool.close()
+            pool.join()
         with open(part_file_path, 'wb') as file_out:
-            for chunk in page.response.iter_content():
-                file_out.write(chunk)
-        rename(part_file_path, local_file_path)
+            for segment_file_path in segment_file_paths:
+                with open(segment_file_path, 'rb') as file_in:
+                    copyfileobj(file_in, file_out, self.download_chunk_size)
+        for segment_file_path in segment_file_paths:
+            remove(segment_file_path)
+
+    def _download_segments(self, query, num_segments):
+        """
+        Asks the server for the first byte of the file, which tells us whether it supports ranges, and the size of the file, and
+        returns a list of `(start, end)` offsets, or None if the file can't or needn't be split.
+        """
+        probe = query.replace(
+            request=query.request.add_header('Range', 'bytes=0-0'),
+            config=query.config._replace(use_cache=False),
+        )
+        try:
+            with self.fetcher.fetch_stream(probe) as response:
+                match = _RE_CONTENT_RANGE.match(response.headers.get('Content-Range') or '')
+        except ScraperError as error:
+            logging.info("%s - not splitting the download (%s)", query.url, error)
+            return None
+        if response.status_code != 206 or match is None or match.group(2) == '*':
+            return None
+        total_size = int(match.group(2))
+        num_segments = min(num_segments, total_size // self.download_chunk_size)
+        if num_segments <= 1:
+            return None
+        bounds = [total_size * segment_i // num_segments for segment_i in range(num_segments + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _download_range(self, query, part_file_path, start, end):
+        """
+        Scrapes bytes `start` to `end` (or to the end of the file if None) to `part_file_path`, re-attempting as `scrape` does.
+        """
+        def fetch(query):
+            self._fetch_range(query, part_file_path, start, end)
+            return Page(query, None, None)
+        methods = {name: getattr(query.methods, name) for name in QueryMethods.method_names}
+        methods.update(
+            fetch=fetch,
+            parse=lambda page: None,
+            record_payload=lambda page, payload: None,
+        )
+        self.scrape(query.replace(methods=QueryMethods(methods)))
+
+    def _fetch_range(self, query, part_file_path, start, end):
+        num_saved = path.getsize(part_file_path) if path.exists(part_file_path) else 0
+        offset = start + num_saved
+        if end is not None and offset >= end:
+            return
+        if offset > 0 or end is not None:
+            query = query.replace(
+                request=query.request.add_header('Range', 'bytes=%d-%s' % (offset, '' if end is None else end - 1)),
+                # NB the cache key doesn't include the headers, so partial responses mustn't go through the cache
+                config=query.config._replace(use_cache=False),
+            )
+        try:
+            with self.fetcher.fetch_stream(query) as response:
+                match = self._check_range_response(query, response, offset, start, end)
+                if match is None:
+                    num_saved = 0 # the server ignored the Range header, so we start over
+                expected_size = _expected_range_size(response, match, start, end, num_saved)
+                with open(part_file_path, 'ab' if num_saved else 'wb') as file_out:
+                    for chunk in response.iter_content(chunk_size=self.download_chunk_size):
+                        file_out.write(chunk)
+        except HttpError.Http416:
+            if offset > 0 and end is None:
+                return # we've already got the whole file, we just didn't know it
+            raise
+        except requests.RequestException as exception:
+            raise_from(HttpError(str(exception), reason=exception), exception)
+        size = path.getsize(part_file_path)
+        if expected_size is not None and size != expected_size:
+            raise ScraperError("%s: got %d bytes of %d" % (query.url, size, expected_size))
+
+    @staticmethod
+    def _check_range_response(query, response, offset, start, end):
+        """
+        Checks the status of the response to a request for the bytes from `offset` on. Returns the match of its Content-Range
+        header if it's the partial content that was asked for, or None if the server ignored the Range header, and sent the whole
+        file, which is only of use if that's what we're after. A 416 means there's nothing from `offset` on, and is raised as
+        `HttpError.Http416` even if the config doesn't raise for status, so that the caller can tell whether the file is complete.
+        """
+        status_code = response.status_code
+        content_range = response.headers.get('Content-Range')
+        if status_code == 416:
+            raise HttpError.Http416("%s: range not satisfiable (%r)" % (query.url, content_range), reason=response)
+        elif status_code == 206:
+            match = _RE_CONTENT_RANGE.match(content_range or '')
+            if match is None or int(match.group(1)) != offset:
+                raise ScraperError("%s: unexpected Content-Range %r" % (query.url, content_range))
+            return match
+        elif start > 0 or end is not None:
+            raise ScraperError("%s: the server doesn't support ranges" % query.url)
+        return None
+
+    def _verify_download(self, part_file_path, expected_size, checksum):
+        size = path.getsize(part_file_path)
+        if expected_size is not None and size != expected_size:
+            remove(part_file_path)
+            raise ScraperError("%s: expected %d bytes, got %d" % (part_file_path, expected_size, size))
+        if checksum is not None:
+            algorithm, expected_hexdigest = checksum
+            digest = hashlib.new(algorithm)
+            with open(part_file_path, 'rb') as file_in:
+                for chunk in iter(lambda: file_in.read(self.download_chunk_size), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != expected_hexdigest.lower():
+                remove(part_file_path)
+                raise ScraperError("%s: %s checksum mismatch" % (part_file_path, algorithm))
 
     def query(self, request_or_query, **kwargs):
         if isinstance(request_or_query, Query):
@@ -166,6 +429,24 @@ class Scraper(object):
     def release_resources(self):
         self.fetcher.release_resources()
 
+#----------------------------------------------------------------------------------------------------------------------------------
+# download utils
+
+def _expected_range_size(response, content_range_match, start, end, num_saved):
+    """
+    Returns the size the file downloaded from `start` to `end` should have once `response` has been written to it, on top of the
+    `num_saved` bytes already there, or None if that can't be known, e.g. because the response's body is encoded.
+    """
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    elif end is not None:
+        return end - start
+    elif content_range_match is not None and content_range_match.group(2) != '*':
+        return int(content_range_match.group(2))
+    elif response.headers.get('Content-Length', '').isdigit():
+        return num_saved + int(response.headers['Content-Length'])
+    return None
+
 #----------------------------------------------------------------------------------------------------------------------------------
 # config utils
 
@@ -175,6 +456,7 @@ FETCHER_KWARGS = (
     'cache_root_path',
     'headers',
     'http_client',
+    'metrics',
 )
 
 def _extract_fetcher_kwargs(kwargs, host=None):
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from contextlib import contextmanager
+import logging
+from multiprocessing import Process
+from os import getpid, path
+import sqlite3
+from time import sleep
+from zlib import crc32
+
+# alcazar
+from .crawler import Scheduler
+from .exceptions import AlcazarException
+from .parse_pool import OfflineHttpClient, query_from_spec, query_to_spec
+from .utils.compatibility import pickle, urlparse
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+def shard_for_url(url, num_shards):
+    """
+    Returns the index of the shard that crawls `url`. All the URLs of any one host go to the same shard, so that the courtesy
+    sleeps between requests to a host are all taken care of by the one process. NB this doesn't use `hash`, which isn't stable
+    across processes.
+    """
+    host = urlparse(url).hostname or ''
+    return crc32(host.encode('UTF-8')) % num_shards
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# broker
+
+class SqliteBroker(object):
+    """
+    Holds the frontier of a sharded crawl, i.e. the queries waiting to be crawled, each tagged with its shard, in an SQLite file
+    that all the processes on the machine open. Queries are pickled bytes, and a popped query is deleted, so it's not redone if
+    the process that popped it dies.
+
+    The broker also knows which shards are idle, which is how the crawl knows it's over: when all shards are idle and none has
+    anything queued, nobody can add any more.
+    """
+
+    def __init__(self, file_path, timeout=60):
+        self.file_path = file_path
+        self.timeout = timeout
+        self._db = None
+        self._db_pid = None
+
+    @property
+    def db(self):
+        # NB an SQLite connection can't be carried over a fork, so each process opens its own
+        if self._db_pid != getpid():
+            self._db = sqlite3.connect(self.file_path, timeout=self.timeout, isolation_level=None)
+            self._db_pid = getpid()
+            with self._transaction() as db:
+                db.execute(
+                    'CREATE TABLE IF NOT EXISTS queries (id INTEGER PRIMARY KEY, shard INTEGER NOT NULL, spec BLOB NOT NULL)'
+                )
+                db.execute('CREATE INDEX IF NOT EXISTS queries_by_shard ON queries (shard, id)')
+                db.execute('CREATE TABLE IF NOT EXISTS shards (shard INTEGER PRIMARY KEY, is_idle INTEGER NOT NULL)')
+        return self._db
+
+    @contextmanager
+    def _transaction(self):
+        db = self.db
+        # NB "immediate" takes the write lock straight away, so that reading then writing is atomic
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        else:
+            db.execute('COMMIT')
+
+    def reset_shards(self, num_shards):
+        """
+        Marks all `num_shards` shards as busy, which the coordinator does before starting them, so that none of them thinks the
+        crawl is over before the others have even started. The queries are left alone, so an interrupted crawl can be resumed.
+        """
+        with self._transaction() as db:
+            db.execute('DELETE FROM shards')
+            db.executemany('INSERT INTO shards (shard, is_idle) VALUES (?, 0)', [(shard,) for shard in range(num_shards)])
+
+    def push_many(self, shards_and_specs):
+        with self._transaction() as db:
+            db.executemany('INSERT INTO queries (shard, spec) VALUES (?, ?)', [
+                (shard, sqlite3.Binary(spec))
+                for shard, spec in shards_and_specs
+            ])
+
+    def pop(self, shard):
+        """
+        Removes and returns the bytes of the oldest query queued for `shard`, or None if there are none.
+        """
+        with self._transaction() as db:
+            row = db.execute('SELECT id, spec FROM queries WHERE shard = ? ORDER BY id LIMIT 1', (shard,)).fetchone()
+            if row is None:
+                return None
+            db.execute('DELETE FROM queries WHERE id = ?', (row[0],))
+        return bytes(row[1])
+
+    def count(self, shard=None):
+        if shard is None:
+            return self.db.execute('SELECT COUNT(*) FROM queries').fetchone()[0]
+        return self.db.execute('SELECT COUNT(*) FROM queries WHERE shard = ?', (shard,)).fetchone()[0]
+
+    def poll_idle(self, shard):
+        """
+        Called by a shard that has nothing left to do. Returns False if it's been given more queries meanwhile, True if every other
+        shard is idle too and nothing is queued, meaning the crawl is over, or None if it's to keep waiting. Until it returns False
+        the shard is counted as idle.
+        """
+        with self._transaction() as db:
+            if db.execute('SELECT 1 FROM queries WHERE shard = ? LIMIT 1', (shard,)).fetchone() is not None:
+                db.execute('UPDATE shards SET is_idle = 0 WHERE shard = ?', (shard,))
+                return False
+            db.execute('UPDATE shards SET is_idle = 1 WHERE shard = ?', (shard,))
+            num_busy = db.execute('SELECT COUNT(*) FROM shards WHERE is_idle = 0').fetchone()[0]
+            num_queued = db.execute('SELECT COUNT(*) FROM queries').fetchone()[0]
+        return True if num_busy == 0 and num_queued == 0 else None
+
+    def __getstate__(self):
+        # NB so that it can be sent to processes that aren't forked, which open their own connection anyway
+        return dict(self.__dict__, _db=None, _db_pid=None)
+
+    def close(self):
+        if self._db is not None and self._db_pid == getpid():
+            self._db.close()
+        self._db = self._db_pid = None
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# scheduler
+
+class ShardedScheduler(Scheduler):
+    """
+    The scheduler of each shard's crawler. Queries added to it are sent to the broker under the shard of their host, which might
+    be another one, and it pops queries off its own shard. When a shard has run out of queries, its crawler waits, polling every
+    `poll_seconds`, until either more queries come in, or all other shards have run out too.
+
+    Queries go through the broker pickled, with their methods sent by name, the same way as to a `ParsePool`, so `scraper` must be
+    set to the crawler before the scheduler is used.
+    """
+
+    def __init__(self, broker, shard, num_shards, poll_seconds=1.0):
+        self.broker = broker
+        self.shard = shard
+        self.num_shards = num_shards
+        self.poll_seconds = poll_seconds
+        self.scraper = None
+
+    def add(self, query):
+        self.add_many([query])
+
+    def add_many(self, queries):
+        self.broker.push_many(
+            (
+                shard_for_url(query.url, self.num_shards),
+                pickle.dumps(query_to_spec(self.scraper, query), protocol=pickle.HIGHEST_PROTOCOL),
+            )
+            for query in queries
+        )
+
+    def pop(self):
+        spec = self.broker.pop(self.shard)
+        if spec is None:
+            raise IndexError("pop from empty shard")
+        return query_from_spec(self.scraper, pickle.loads(spec))
+
+    def __len__(self):
+        return self.broker.count(self.shard)
+
+    def drained(self):
+        while True:
+            is_over = self.broker.poll_idle(self.shard)
+            if is_over is not None:
+                return is_over
+            sleep(self.poll_seconds)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# coordinator
+
+class ShardedCrawl(object):
+    """
+    Runs a crawl too large for one process as `num_shards` processes, each running its own instance of `crawler_class`, built
+    with `crawler_kwargs`, and crawling the hosts that `shard_for_url` assigns to it. The frontier is kept in a `SqliteBroker`
+    at `broker_path`, so an interrupted crawl can be resumed by running it again.
+
+    Since the crawlers run in other processes, their payloads aren't returned; they must be recorded by `record_payload`. If
+    `crawler_kwargs` has a `cache_root_path`, each shard gets its own cache in a `shard-<n>` subdirectory of it, since a
+    `DiskCache` can't be written to by several processes at once, unless `cache_read_only` is set too, in which case they all read
+    the same cache.
+    """
+
+    def __init__(self, crawler_class, num_shards, broker_path, crawler_kwargs=None, poll_seconds=1.0):
+        self.crawler_class = crawler_class
+        self.num_shards = num_shards
+        self.broker = SqliteBroker(broker_path)
+        self.crawler_kwargs = dict(crawler_kwargs or {})
+        self.poll_seconds = poll_seconds
+
+    def enqueue(self, request_or_query, **kwargs):
+        self.enqueue_many([request_or_query], **kwargs)
+
+    def enqueue_many(self, requests_or_queries, **kwargs):
+        scheduler = self._build_scheduler(None)
+        crawler = self.crawler_class(scheduler=scheduler, http_client=OfflineHttpClient(), **self.crawler_kwargs)
+        scheduler.scraper = crawler
+        crawler.enqueue_many(requests_or_queries, **kwargs)
+
+    def shard_crawler_kwargs(self, shard):
+        kwargs = dict(self.crawler_kwargs)
+        if kwargs.get('cache_root_path') is not None and not kwargs.get('cache_read_only'):
+            kwargs['cache_root_path'] = path.join(kwargs['cache_root_path'], 'shard-%d' % shard)
+        return kwargs
+
+    def run(self):
+        self.broker.reset_shards(self.num_shards)
+        processes = [
+            Process(target=self._run_shard, args=(shard,), name='shard-%d' % shard)
+            for shard in range(self.num_shards)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            while processes:
+                processes[0].join(self.poll_seconds)
+                for process in list(processes):
+                    if process.exitcode is None:
+                        continue
+                    processes.remove(process)
+                    if process.exitcode != 0:
+                        raise AlcazarException("%s exited with code %d" % (process.name, process.exitcode))
+        finally:
+            # NB if one shard failed, the others would wait for it forever
+            for process in processes:
+                process.terminate()
+                process.join()
+            self.broker.close()
+
+    def _run_shard(self, shard):
+        scheduler = self._build_scheduler(shard)
+        crawler = self.crawler_class(scheduler=scheduler, **self.shard_crawler_kwargs(shard))
+        scheduler.scraper = crawler
+        try:
+            crawler.crawl()
+            logging.info("shard-%d done", shard)
+        finally:
+            crawler.release_resources()
+            self.broker.close()
+
+    def _build_scheduler(self, shard):
+        return ShardedScheduler(self.broker, shard, self.num_shards, self.poll_seconds)
+
+#----------------------------------------------------------------------------------------------------------------------------------
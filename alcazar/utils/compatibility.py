@@ -94,4 +94,12 @@ else:
 
 native_string = str
 
+def raise_from(exception, cause):
+    """
+    Same as `raise exception from cause`, which is a syntax error in Python 2, where exceptions aren't chained.
+    """
+    if not PY2:
+        exception.__cause__ = cause
+    raise exception
+
 #----------------------------------------------------------------------------------------------------------------------------------
@@ -10,51 +10,28 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # standards
 import json
 import re
+from sys import version_info
 
-#----------------------------------------------------------------------------------------------------------------------------------
+# 3rd parties
+try:
+    import orjson
+except ImportError:
+    orjson = NotImplemented # pylint: disable=invalid-name
+try:
+    import ujson
+except ImportError:
+    ujson = NotImplemented # pylint: disable=invalid-name
 
-JSON_FIXES = (
-    ( # First of all, don't touch anything inside double quotes
-        r'\" (?:\\.|[^\\\"])* \"',
-        lambda s: s,
-    ),
-    ( # Replace single quotes with double quotes
-        r'\' (?:\\.|[^\\\'])* \'',
-        lambda s: '"%s"' % re.sub(
-            r'(?:\\.|\")',
-            lambda m: {
-                '"': '\\"',
-                "\\'": "'", # for some reason the json parser gets confused by a backslashed ' inside a " string
-            }.get(m.group(), m.group()),
-            s[1:-1]
-        ),
-    ),
-    ( # Ensure that all hash property names are quoted
-        r'(?<=[\{\,]) \s*\w+\s* (?=:)',
-        lambda s: json.dumps(s.strip()),
-    ),
-    ( # [,,1] becomes [null,null,1]
-        r'(?<=[\[\,]) (?=,)',
-        lambda s: 'null',
-    ),
-    ( # Remove commas before closing brackets
-        r'(?:,\s*)+ (?= \s*[\]\}])',
-        lambda s: '',
-    ),
-)
-
-RE_JSON_FIXES = re.compile(
-    r'|'.join('(%s)' % f[0] for f in JSON_FIXES),
-    re.X,
-)
+# alcazar
+from .compatibility import PY2, text_type
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
 def lenient_json_loads(json_text):
     """
-    Simply calls the standard library's json.loads, but applies a few simple fixes to the JSON code first, because the standard
-    json module is stricter than I like it. In particular, this should be able to take a JavaScript Object literal and parse it
-    like the JSON it almost is.
+    Parses JSON, but isn't as strict about it as the standard library's json.loads. In particular, this should be able to take a
+    JavaScript Object literal and parse it like the JSON it almost is: comments, single-quoted strings, unquoted property names,
+    JS-only string escapes, elisions (`[,,1]`) and trailing commas are all accepted.
 
     Escape mania! You need to escape this docstring, which contains an a string passed to `parse_json', which contains an
     escaped strings of Javascript.
@@ -62,23 +39,313 @@ def lenient_json_loads(json_text):
     1
     >>> lenient_json_loads("{a: 'a\\\\\\\\a'}")
     {'a': 'a\\\\a'}
+    >>> lenient_json_loads("[,'\\\\x41', /* comment */ {b: 2,},]")
+    [None, 'A', {'b': 2}]
+    """
+    # Most of what we're given is actually valid JSON, in which case the C parser is much faster than anything we could do here
+    try:
+        return json.loads(json_text)
+    except ValueError:
+        pass
+    return json.loads(js_literal_to_json(json_text), strict=False)
+
+
+def js_literal_to_json(js_text):
+    """
+    Rewrites a JavaScript Object literal into valid JSON, in a single pass over its tokens. Anything we don't know how to fix is
+    left as is, for the JSON parser to complain about.
+
+    >>> js_literal_to_json("{a: 'b', c: [1,,], // comment\\n}")
+    '{"a": "b", "c": [1,null] \\n}'
+    """
+    pieces = []
+    last_char = ''
+    pending_commas = 0
+    pending_space = []
+    for match in _RE_JS_LITERAL_TOKEN.finditer(js_text):
+        kind = match.lastgroup
+        token = match.group()
+        if kind == 'comment':
+            continue
+        if kind == 'comma':
+            # Commas are only written out once we know what follows them, so that we can handle elisions and trailing commas
+            pending_commas += 1
+            continue
+        if kind == 'key':
+            token = '"%s"' % token
+        elif kind == 'string':
+            token = '"%s"' % _RE_JS_STRING_ESCAPE.sub(_js_string_escape_to_json, token[1:-1])
+        elif kind == 'word' and token == 'undefined':
+            token = 'null'
+        stripped = token.strip()
+        if not stripped:
+            if pending_commas:
+                pending_space.append(token)
+            else:
+                pieces.append(token)
+            continue
+        if pending_commas:
+            pieces.append(_js_commas_to_json(pending_commas, last_char, stripped[0]))
+            pieces.extend(pending_space)
+            pending_commas = 0
+            del pending_space[:]
+        pieces.append(token)
+        last_char = stripped[-1]
+    pieces.append(',' * pending_commas)
+    pieces.extend(pending_space)
+    return ''.join(pieces)
+
+
+def _js_commas_to_json(count, last_char, next_char):
+    # Follows JS semantics, where `[,1]` and `[1,,2]` have holes that we fill with nulls, and one trailing comma is ignored, so
+    # `[1,]` has one element and `[1,,]` has two
+    is_closing = next_char in ']}'
+    if last_char == '[':
+        elision = 'null,' * count
+        return elision[:-1] if is_closing else elision
+    elif is_closing:
+        return ',null' * (count - 1)
+    else:
+        return ',' + 'null,' * (count - 1)
+
+
+def _js_string_escape_to_json(match):
+    escaped = match.group(1)
+    if escaped is None:
+        # a double quote or a control character, which need escaping in JSON
+        json_escaped = json.dumps(match.group())[1:-1]
+    elif len(escaped) > 1 and escaped[0] in 'ux':
+        # \uXXXX is the same in JSON, and \xXX is the same as \u00XX
+        json_escaped = '\\u' + escaped[1:].rjust(4, '0')
+    else:
+        json_escaped = _JS_STRING_ESCAPES_TO_JSON.get(escaped)
+        if json_escaped is None:
+            # JS ignores the backslash in unknown escape sequences, e.g. "\'" is just "'"
+            json_escaped = json.dumps(escaped)[1:-1]
+    return json_escaped
+
+
+_RE_JS_LITERAL_TOKEN = re.compile(
+    r'''
+      # Runs of tokens that are already valid JSON are copied over in one go. Everything else is handled one token at a time,
+      # including commas that might be an elision or a trailing comma
+      (?P<json> (?!\s*,) (?:
+          " (?:[^"\\]|\\["\\/bfnrtu])* "
+        | [^,'"/\w\$\[]
+        | , (?=\s*[^\s,\]\}/])
+        | \[ (?!\s*,)
+        | -?\d[\d\.eE\+\-]* (?![\w\.\+\-]|\s*:)
+        | (?:true|false|null|NaN|Infinity) (?![\w\$]|\s*:)
+      )+ )
+    | (?P<comma> , )
+    | (?P<comment> //[^\n]* | /\*.*?\*/ )
+    | (?P<key> [\w\$]+ (?=\s*:) )
+    | (?P<string> " (?:[^"\\]|\\.)* " | ' (?:[^'\\]|\\.)* ' )
+    | (?P<word> [\w\$]+ )
+    | (?P<other> . )
+    ''',
+    re.S | re.X,
+)
+
+_RE_JS_STRING_ESCAPE = re.compile(r'\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|\r\n|.)|["\x00-\x1f]', re.S)
+
+# What each JS escape sequence, minus its backslash, becomes in JSON, for those that aren't just the escaped char itself
+_JS_STRING_ESCAPES_TO_JSON = {
+    '"': '\\"',
+    '\\': '\\\\',
+    '/': '\\/',
+    'b': '\\b',
+    'f': '\\f',
+    'n': '\\n',
+    'r': '\\r',
+    't': '\\t',
+    'v': '\\u000b',
+    '0': '\\u0000',
+    # line continuations
+    '\n': '',
+    '\r': '',
+    '\r\n': '',
+    '\u2028': '',
+    '\u2029': '',
+}
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# JSON decoder backends
+
+def _bytes_to_text_loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('UTF-8')
+    return json.loads(data)
+
+# NB on Python 3 before 3.6, json.loads only takes text
+stdlib_json_loads = json.loads if PY2 or version_info >= (3, 6) else _bytes_to_text_loads # pylint: disable=invalid-name
+
+
+def _with_stdlib_fallback(accelerated_loads):
+    """
+    Wraps a faster decoder so that documents it wouldn't parse the way the standard library does are parsed by the standard
+    library instead: those it rejects (e.g. orjson refuses NaN and Infinity), and those with integers that might not fit in 64
+    bits, which orjson silently turns into floats.
+    """
+    def loads(data):
+        if isinstance(data, text_type):
+            data = data.encode('UTF-8')
+        # NB any integer beyond 64 bits has at least 19 digits. Looking for runs that long only takes a small fraction of the time
+        # the parse takes, and false positives (long decimals, digits in strings) merely get parsed a bit more slowly.
+        if data.translate(_DIGITS_TO_ZEROS).find(_NINETEEN_DIGITS) != -1:
+            return stdlib_json_loads(data)
+        try:
+            return accelerated_loads(data)
+        except ValueError:
+            return stdlib_json_loads(data)
+    return loads
+
+_DIGITS_TO_ZEROS = bytes(bytearray(
+    0x30 if 0x30 <= byte <= 0x39 else 0x20
+    for byte in range(256)
+))
+
+_NINETEEN_DIGITS = b'0' * 19
+
+
+JSON_DECODERS = {
+    'json': json.loads,
+    'orjson': NotImplemented if orjson is NotImplemented else orjson.loads,
+    'ujson': NotImplemented if ujson is NotImplemented else ujson.loads,
+}
+
+# The decoders that 'auto' picks from, in order of preference
+ACCELERATED_JSON_DECODERS = ('orjson', 'ujson')
+
+
+def pick_json_decoder(decoder='auto'):
+    """
+    Returns a function that parses a JSON document, given as either bytes or text. `decoder` can be the name of one of the
+    `JSON_DECODERS`, or "auto" (or None) for the first of the `ACCELERATED_JSON_DECODERS` that's installed, or a callable, which is
+    returned as is.
+
+    The faster decoders don't parse everything the way the standard library does, so they're wrapped to hand over whatever they
+    might get wrong to the standard library, which is also what's used if the requested decoder isn't installed.
     """
-    json_text = strip_js_comments(json_text)
-    json_text = re.sub(
-        r'(?:\\[^x]|\\x([0-9a-fA-F]{2}))',
-        lambda m: chr(int(m.group(1), 16)) if m.group(1) else m.group(),
-        json_text
-    )
-    json_text = RE_JSON_FIXES.sub(
-        lambda m: next(
-            f[1](g)
-            for f, g in zip(JSON_FIXES, m.groups())
-            if g is not None
-        ),
-        json_text
-    )
-    return json.loads(json_text)
+    if callable(decoder):
+        return decoder
+    if decoder is None or decoder == 'auto':
+        names = ACCELERATED_JSON_DECODERS
+    elif decoder in JSON_DECODERS:
+        names = (decoder,)
+    else:
+        raise ValueError("Unknown JSON decoder: %r" % (decoder,))
+    for name in names:
+        loads = JSON_DECODERS[name]
+        if loads is json.loads:
+            return stdlib_json_loads
+        elif loads is not NotImplemented:
+            return _with_stdlib_fallback(loads)
+    return stdlib_json_loads
+
 
+def iter_json_array(text_chunks):
+    """
+    Takes an iterable of text chunks that together make up a JSON array, and yields the array's elements one by one, as soon as
+    they've been fully read, so that huge arrays can be processed without holding the whole document in memory.
+
+    >>> list(iter_json_array(['[{"a": 1', '}, 2', '3, [4]', ']']))
+    [{'a': 1}, 23, [4]]
+    """
+    decoder = json.JSONDecoder()
+    chunks = _TextChunks(text_chunks)
+    if chunks.next_char() != '[':
+        raise ValueError("Expected a JSON array")
+    chunks.position += 1
+    if chunks.next_char() == ']':
+        chunks.position += 1
+    else:
+        while True:
+            yield _read_json_array_element(chunks, decoder)
+            char = chunks.next_char()
+            chunks.position += 1
+            if char == ']':
+                break
+            elif char != ',':
+                raise ValueError("Expected ',' or ']' after an element of a JSON array, found %r" % char)
+    if chunks.next_char():
+        raise ValueError("Unexpected data after the end of a JSON array")
+
+
+def _read_json_array_element(chunks, decoder):
+    char = chunks.next_char()
+    if not char:
+        raise ValueError("Truncated JSON array")
+    elif char in ',]':
+        raise ValueError("Expected an element of a JSON array, found %r" % char)
+    # NB when an element can't be decoded yet, we don't try again until the data from its start has at least doubled, else an
+    # element that spans many chunks would be parsed from its start once per chunk, which takes quadratic time
+    min_length = 0
+    while True:
+        if chunks.exhausted or chunks.num_pending_chars >= min_length:
+            try:
+                element, end = decoder.raw_decode(chunks.text, chunks.position)
+            except ValueError:
+                end = None
+            # NB an element that isn't followed by a delimiter might have been cut short (e.g. we've read "12" or "12." of
+            # "12.5"), so unless there's no more input we only accept it once we can see what comes after it
+            if end is not None and (chunks.exhausted or _RE_JSON_ARRAY_DELIMITER.match(chunks.text, end)):
+                chunks.position = end
+                return element
+            elif chunks.exhausted:
+                raise ValueError("Invalid or truncated JSON array")
+            min_length = 2 * chunks.num_pending_chars
+        chunks.read_more(min_length)
+
+
+class _TextChunks(object):
+    """
+    The text read so far from an iterable of text chunks, and our position in it.
+    """
+
+    def __init__(self, text_chunks):
+        self.chunks = iter(text_chunks)
+        self.text = ''
+        self.position = 0
+        self.exhausted = False
+
+    @property
+    def num_pending_chars(self):
+        return len(self.text) - self.position
+
+    def next_char(self):
+        """
+        Skips over any whitespace, reading more chunks if needed, and returns the next character, or '' if there's none left.
+        """
+        while True:
+            self.position = _RE_JSON_WHITESPACE.match(self.text, self.position).end()
+            if self.position < len(self.text) or self.exhausted:
+                return self.text[self.position:self.position+1]
+            self.read_more()
+
+    def read_more(self, min_length=0):
+        """
+        Drops the text before our position, and reads at least one more chunk, or as many as are needed for `min_length`
+        characters to be pending. The new chunks are joined in one go, rather than appended one by one.
+        """
+        self.text, self.position = self.text[self.position:], 0
+        new_chunks = []
+        num_chars_needed = max(min_length - len(self.text), 1)
+        for chunk in self.chunks:
+            new_chunks.append(chunk)
+            num_chars_needed -= len(chunk)
+            if num_chars_needed <= 0:
+                break
+        else:
+            self.exhausted = True
+        self.text += ''.join(new_chunks)
+
+
+_RE_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+_RE_JSON_ARRAY_DELIMITER = re.compile(r'[\s,\]]')
+
+#----------------------------------------------------------------------------------------------------------------------------------
 
 def strip_js_comments(js):
     """
@@ -110,6 +377,139 @@ def strip_js_comments(js):
         r' /\* .*? \*/',             # matches (and does not capture) /* */ comments
     )), re.S|re.X), lambda m: m.group(1) or m.group(2) or '', js)
 
+#----------------------------------------------------------------------------------------------------------------------------------
+# Extracting data from JavaScript code
+
+def iter_js_assignments(js, names=None):
+    """
+    Scans a string of JavaScript source code for assignments of literal values (object, array, string, number, boolean or null)
+    to a variable or property, e.g. `var config = {...}` or `window.__INITIAL_STATE__ = {...}`, and yields (name, value) pairs,
+    where `value` is the literal parsed with `lenient_json_loads`. Names are given without any leading `window.`, `self.` or
+    `this.`. `x = JSON.parse("...")` assignments are also picked up, in which case the JSON string is decoded and parsed.
+
+    The scan is lazy, so the caller can stop at the first match. If `names` is given, only assignments to those names are
+    parsed and yielded. Assignments of anything other than a literal, or of literals that we can't parse, are skipped. Comments
+    and string literals are skipped over, so an "assignment" within either won't be reported.
+
+    >>> list(iter_js_assignments('var a = 1, b = f(); window.c = {"d": [2]}; e.f = \\'g\\'; // h = 3'))
+    [('a', 1), ('c', {'d': [2]}), ('e.f', 'g')]
+    """
+    # FIXME same as `strip_js_comments`, we don't know about regex literals, so a regex containing a quote might throw us off
+    if names is not None and not any(name.split('.')[0] in js for name in names):
+        # Scanning is slow compared to a plain substring search, so we don't bother with scripts that can't possibly match
+        return
+    position = 0
+    while True:
+        match = _RE_JS_ASSIGNMENT_SCAN.search(js, position)
+        if match is None:
+            return
+        position = match.end()
+        if match.group('skip'):
+            continue
+        name = match.group('quoted_name') or re.sub(r'\s+', '', match.group('name'))
+        if names is not None and name not in names:
+            # NB we don't need to skip over the value, if it's a literal the scan will just find nothing in it
+            continue
+        position = _RE_JS_SPACE_AND_COMMENTS.match(js, position).end()
+        value, end = _parse_js_literal(js, position)
+        if end is not None:
+            yield name, value
+            position = end
+
+
+def _parse_js_literal(js, position):
+    """
+    Parses the JS literal found at `position` in `js`, and returns its value and the position where it ends, or (None, None) if
+    there's no literal there that we can parse, or if the literal is only part of a larger expression.
+    """
+    try:
+        if js[position:position+1] in ('{', '['):
+            try:
+                # Big literals are often valid JSON, in which case the C parser does it all in one go
+                value, end = _JSON_DECODER.raw_decode(js, position)
+            except ValueError:
+                end = _find_closing_bracket(js, position)
+                if end is None:
+                    return None, None
+                value = lenient_json_loads(js[position:end])
+        else:
+            match = _RE_JS_SCALAR_LITERAL.match(js, position)
+            if match is None:
+                return None, None
+            end = match.end()
+            value = lenient_json_loads(match.group('json_string') or match.group())
+            if match.group('json_string'):
+                value = lenient_json_loads(value)
+    except ValueError:
+        return None, None
+    if not _RE_JS_END_OF_EXPRESSION.match(js, end):
+        return None, None
+    return value, end
+
+
+def _find_closing_bracket(js, position):
+    depth = 0
+    for match in _RE_JS_BRACKETS.finditer(js, position):
+        token = match.group()
+        if token in ('{', '['):
+            depth += 1
+        elif token in ('}', ']'):
+            depth -= 1
+            if depth == 0:
+                return match.end()
+    return None
+
+
+_JSON_DECODER = json.JSONDecoder()
+
+# NB written as "unrolled loops", which the regex engine gets through much faster than an alternation on long strings
+_RE_JS_STRING = r'''
+    " [^"\\\n]* (?:\\.[^"\\\n]*)* "
+  | ' [^'\\\n]* (?:\\.[^'\\\n]*)* '
+  | ` [^`\\]* (?:\\.[^`\\]*)* `
+'''
+
+_RE_JS_COMMENT = r'''
+    //[^\n]*
+  | /\*.*?\*/
+'''
+
+_RE_JS_ASSIGNMENT_SCAN = re.compile(
+    r'''
+      # Runs of code that can't contain an assignment target are skipped in one go, so that we don't go back and forth between
+      # Python and the regex engine for every token
+      (?P<skip> (?:
+          %s
+        | %s
+        | [^"'`/\w\$]+
+        | [\w\$]+ (?![\w\$]|\s*[=\.\[])
+      )+ )
+    | (?<![\w\$\.])
+      (?: (?:window|self|this|globalThis) \s* (?: \. \s* | \[ \s* (?P<quote>["']) (?P<quoted_name>[^"'\\]+) (?P=quote) \s* \] ) )?
+      (?(quote) | (?P<name> [a-zA-Z_\$][\w\$]* (?: \s*\.\s* [a-zA-Z_\$][\w\$]* )* ) )
+      \s* = (?![=>])
+    ''' % (_RE_JS_STRING, _RE_JS_COMMENT),
+    re.S | re.X,
+)
+
+_RE_JS_SPACE_AND_COMMENTS = re.compile(r'(?:\s+|%s)*' % _RE_JS_COMMENT, re.S | re.X)
+
+_RE_JS_BRACKETS = re.compile(r'%s | %s | [\[\]\{\}]' % (_RE_JS_STRING, _RE_JS_COMMENT), re.S | re.X)
+
+_RE_JS_SCALAR_LITERAL = re.compile(
+    r'''
+      JSON \s* \. \s* parse \s* \( \s* (?P<json_string> " (?:[^"\\\n]|\\.)* " | ' (?:[^'\\\n]|\\.)* ' ) \s* \)
+    | " (?:[^"\\\n]|\\.)* "
+    | ' (?:[^'\\\n]|\\.)* '
+    | -? (?:\d+\.?\d*|\.\d+) (?:[eE][\+\-]?\d+)? (?![\w\$\.])
+    | (?:true|false|null) (?![\w\$])
+    ''',
+    re.S | re.X,
+)
+
+# What may follow a literal for it to be the whole value assigned, rather than, say, the first operand of a `+`
+_RE_JS_END_OF_EXPRESSION = re.compile(r'[ \t]* (?: [;,\)\}\]\r\n] | // | /\* | $ )', re.X)
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 if __name__ == '__main__':
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from collections import OrderedDict
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class LruCache(object):
+    """
+    Bounded dict-like memo, where the least recently used entries are evicted first once `max_size` is exceeded. We use this
+    rather than `functools.lru_cache` because that's not available in Python 2, and because we want to be able to inspect, size
+    and clear each cache independently.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, key, compute):
+        """
+        Returns the value cached under `key`, calling `compute(key)` to build and store it if it's not there yet.
+        """
+        try:
+            # NB pop and re-insert rather than `move_to_end`, which OrderedDict doesn't have in Python 2
+            value = self._entries.pop(key)
+        except KeyError:
+            value = compute(key)
+        self._entries[key] = value
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+#----------------------------------------------------------------------------------------------------------------------------------
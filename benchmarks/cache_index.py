@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Times lookups in the index of a DiskCache, for entries saved as records, and for entries pickled whole, as earlier versions
+# saved them. Stale lookups, which only need the entry's timestamp, are timed separately from fresh ones, which return a response.
+#
+# Usage: python -m benchmarks.cache_index [num_entries]
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from os import path
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from time import time
+
+# 3rd parties
+import requests
+
+# alcazar
+from alcazar.http.cache import CacheEntry, ShelfIndex, default_cache_key
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+def build_entry(i, timestamp):
+    url = 'http://example.com/page/%d' % i
+    request = requests.Request('GET', url, headers={'User-Agent': 'Alcazar', 'Accept': '*/*'}).prepare()
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = url
+    response.encoding = 'UTF-8'
+    response.request = request
+    response.headers = requests.structures.CaseInsensitiveDict({
+        'Content-Type': 'text/html; charset=UTF-8',
+        'Content-Length': '12345',
+        'Date': 'Mon, 19 Oct 2026 10:00:00 GMT',
+        'Cache-Control': 'private, max-age=0',
+        'Server': 'nginx',
+        'Set-Cookie': 'session=%d; Path=/' % i,
+    })
+    response.cookies.set('session', '%d' % i)
+    return CacheEntry(response=response, exception=None, timestamp=timestamp)
+
+
+def fill_index(file_path, num_entries, timestamp, whole):
+    index = ShelfIndex(file_path)
+    keys = []
+    for i in range(num_entries):
+        key = default_cache_key('GET', 'http://example.com/page/%d' % i, None)
+        entry = build_entry(i, timestamp)
+        if whole:
+            with index._modify_for_pickling(entry): # pylint: disable=protected-access
+                index.db[index._key_to_string(key)] = entry # pylint: disable=protected-access
+        else:
+            index.insert(key, entry)
+        keys.append(key)
+    index.close()
+    return keys
+
+
+def time_lookups(file_path, keys, min_timestamp):
+    index = ShelfIndex(file_path)
+    try:
+        index.db # pylint: disable=pointless-statement
+        time_before = time()
+        for key in keys:
+            index.lookup(key, min_timestamp)
+        return time() - time_before
+    finally:
+        index.close()
+
+
+def main(num_entries=5000):
+    temp_dir = mkdtemp()
+    try:
+        timestamp = time()
+        for label, whole in (('whole', True), ('records', False)):
+            file_path = path.join(temp_dir, '%s.shelf' % label)
+            keys = fill_index(file_path, num_entries, timestamp, whole)
+            fresh_seconds = time_lookups(file_path, keys, timestamp)
+            stale_seconds = time_lookups(file_path, keys, timestamp + 1)
+            print('{:<8} {} entries   fresh {:.1f}us/lookup   stale {:.1f}us/lookup'.format(
+                label,
+                num_entries,
+                1e6 * fresh_seconds / num_entries,
+                1e6 * stale_seconds / num_entries,
+            ))
+    finally:
+        rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    main(*map(int, argv[1:]))
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Times the fetching of a large response through a DiskCache, both with and without chunked transfer encoding. On a cache miss,
+# the body is saved to the cache as it streams through to the consumer, so in both modes the first bytes should reach the consumer
+# straight away, rather than once the whole body has been saved.
+#
+# Usage: python -m benchmarks.cache_tee [num_megabytes]
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from os import urandom
+from shutil import rmtree
+from sys import argv
+from tempfile import mkdtemp
+from threading import Thread
+from time import time
+
+# alcazar
+from alcazar.config import DEFAULT_CONFIG
+from alcazar.datastructures import Request
+from alcazar.http import HttpClient
+from alcazar.http.cache import DiskCache
+from alcazar.utils.compatibility import BaseHTTPRequestHandler, HTTPServer
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+BLOCK = urandom(64 * 1024)
+
+CONFIG = DEFAULT_CONFIG._replace(courtesy_seconds=0, stream=True)
+
+
+class BenchmarkRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    body_size = 0
+
+    def do_GET(self):
+        is_chunked = self.path == '/chunked'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if is_chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(self.body_size))
+        self.end_headers()
+        remaining = self.body_size
+        while remaining > 0:
+            block = BLOCK[:remaining]
+            if is_chunked:
+                self.wfile.write(('%x\r\n' % len(block)).encode('ascii') + block + b'\r\n')
+            else:
+                self.wfile.write(block)
+            remaining -= len(block)
+        if is_chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *args):
+        pass
+
+
+def time_fetch(client, url):
+    """
+    Returns the time until the first chunk of the body was read, the time until it was all read, and its size.
+    """
+    time_before = time()
+    first_chunk_seconds = None
+    num_bytes = 0
+    response = client.submit(Request(url), CONFIG)
+    for chunk in response.iter_content(chunk_size=len(BLOCK)):
+        if first_chunk_seconds is None:
+            first_chunk_seconds = time() - time_before
+        num_bytes += len(chunk)
+    response.close()
+    return first_chunk_seconds, time() - time_before, num_bytes
+
+
+def main():
+    num_megabytes = int(argv[1]) if len(argv) > 1 else 64
+    BenchmarkRequestHandler.body_size = num_megabytes * 1024 * 1024
+    server = HTTPServer(('127.0.0.1', 0), BenchmarkRequestHandler)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        for mode in ('plain', 'chunked'):
+            temp_dir = mkdtemp()
+            client = HttpClient(CONFIG, cache=DiskCache.build(temp_dir), logger=None)
+            try:
+                url = 'http://127.0.0.1:%d/%s' % (server.server_port, mode)
+                miss_first_chunk_seconds, miss_seconds, num_bytes = time_fetch(client, url)
+                _, hit_seconds, _ = time_fetch(client, url)
+            finally:
+                client.close()
+                rmtree(temp_dir)
+            num_megabytes_read = num_bytes / (1024 * 1024)
+            print('{:<8} {:.0f} MB   miss: first chunk {:.3f}s, all {:.2f}s ({:.0f} MB/s)   hit: {:.2f}s ({:.0f} MB/s)'.format(
+                mode,
+                num_megabytes_read,
+                miss_first_chunk_seconds,
+                miss_seconds,
+                num_megabytes_read / miss_seconds,
+                hit_seconds,
+                num_megabytes_read / hit_seconds,
+            ))
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Times the parsing of a feed-sized Atom document with its namespaces stripped, both by rewriting the raw bytes with regexes before
+# parsing, as `strip_xml_namespaces` does, and by renaming the elements of the parsed tree, as `parse_xml_etree` does. Parsing
+# without stripping is timed too, as a baseline.
+#
+# Usage: python -m benchmarks.xml_namespaces [num_entries]
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from sys import argv
+from time import time
+
+# 3rd parties
+import lxml.etree as ET
+
+# alcazar
+from alcazar.etree_parser import parse_xml_etree, strip_xml_namespaces
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+ENTRY = '''
+  <entry>
+    <id>urn:uuid:%(i)08d-feed-4e6f-8a3b-000000000000</id>
+    <title type="text">Entry number %(i)d</title>
+    <updated>2026-10-19T10:00:00Z</updated>
+    <link rel="alternate" type="text/html" href="http://example.com/entries/%(i)d"/>
+    <author><name>Author %(i)d</name><uri>http://example.com/authors/%(i)d</uri></author>
+    <summary type="html">&lt;p&gt;Summary of entry %(i)d&lt;/p&gt;</summary>
+    <media:group>
+      <media:thumbnail url="http://example.com/thumbs/%(i)d.jpg" width="120" height="90"/>
+      <media:content url="http://example.com/videos/%(i)d.mp4" type="video/mp4" media:medium="video"/>
+    </media:group>
+    <yt:videoId>%(i)d</yt:videoId>
+    <category scheme="http://example.com/categories" term="cat%(category)d" xml:lang="en"/>
+  </entry>'''
+
+
+def build_feed(num_entries):
+    return ''.join([
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:media="http://search.yahoo.com/mrss/"'
+        ' xmlns:yt="http://www.youtube.com/xml/schemas/2015">',
+        '\n  <title>Benchmark feed</title>',
+    ] + [
+        ENTRY % {'i': i, 'category': i % 10}
+        for i in range(num_entries)
+    ] + [
+        '\n</feed>\n',
+    ]).encode('UTF-8')
+
+
+def time_parse(parse, xml_bytes, num_runs=3):
+    best_seconds = None
+    for _ in range(num_runs):
+        time_before = time()
+        root = parse(xml_bytes)
+        seconds = time() - time_before
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+    return root, best_seconds
+
+
+def main(num_entries=20000):
+    xml_bytes = build_feed(num_entries)
+    print('{} entries, {:.1f}MB'.format(num_entries, len(xml_bytes) / 1e6))
+    results = {}
+    for label, parse in (
+            ('plain', ET.XML),
+            ('regex', lambda xml_bytes: ET.XML(strip_xml_namespaces(xml_bytes))),
+            ('tree', lambda xml_bytes: parse_xml_etree(xml_bytes, strip_namespaces=True)),
+        ):
+        root, seconds = time_parse(parse, xml_bytes)
+        results[label] = root
+        print('{:<6} {:.3f}s'.format(label, seconds))
+    # NB the two ways of stripping are meant to give the same tree, which is worth checking on bigger documents than the tests use
+    if ET.tostring(results['regex']) != ET.tostring(results['tree']):
+        print('WARNING: the regex and tree strippers gave different trees')
+
+
+if __name__ == '__main__':
+    main(*map(int, argv[1:]))
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -44,6 +44,9 @@ setuptools.setup(
         'requests>=2,<3',
         'urllib3>=1.17,<2',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+    },
     classifiers=[
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
@@ -110,7 +110,10 @@ class ServerFixture(object):
                     # RequestHandler instance to live through each individual test
                     native_string('HTTPRequestHandler'),
                     (HTTPRequestHandler, object),
-                    {'handler': handler},
+                    dict(
+                        getattr(handler, 'request_handler_attributes', {}),
+                        handler=handler,
+                    ),
                 ))
             except socket.error:
                 if attempt == num_attempts-1:
@@ -10,12 +10,17 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # standards
 from contextlib import closing
 import gzip
+from io import BytesIO
 from itertools import count
 import json
-from os import path, walk
+from os import listdir, makedirs, path, unlink, utime, walk
 import re
 from shutil import rmtree
+import tarfile
 from tempfile import mkdtemp
+from threading import Event
+from time import time
+from unittest import skipIf
 
 # 3rd parties
 import requests
@@ -23,11 +28,17 @@ import requests
 # alcazar
 from alcazar.config import DEFAULT_CONFIG, ScraperConfig
 from alcazar.datastructures import GET, POST
-from alcazar.exceptions import HttpError
+from alcazar.exceptions import CacheMiss, HttpError
 from alcazar.http import HttpClient
-from alcazar.http.cache import DiskCache
+from alcazar.http import cache_archive
+from alcazar.http.cache import DiskCache, default_cache_key
+from alcazar.http.cache_keys import Blake2KeyScheme, blake2b
+from alcazar.http.cache_archive import export_cache, import_cache
+from alcazar.http.metrics import NullMetricsSink
+from alcazar.http.storage_codecs import zstandard
+from alcazar.http.warc_cache import WarcCache
 from alcazar.scraper import Scraper
-from alcazar.utils.compatibility import native_string
+from alcazar.utils.compatibility import native_string, pickle, urlparse
 
 # tests
 from .plumbing import FetcherFixture, ClientFixture, ServerFixture, compile_test_case_classes
@@ -40,6 +51,7 @@ class CacheTestServer(object):
 
     def __init__(self):
         self.count = count()
+        self.validators_received = []
 
     def counter(self):
         count_text = '%d' % next(self.count)
@@ -105,6 +117,40 @@ class CacheTestServer(object):
             }
         }
 
+    def templated(self):
+        i = next(self.count)
+        return (
+            '<html><head><title>Item %d</title></head><body><div class="listing"><h1>Item number %d</h1>'
+            '<p>Lorem ipsum dolor sit amet %d</p></div></body></html>' % (i, i * 7, i * 13)
+        ).encode('us-ascii') * 4
+
+    def validated(self):
+        return self._conditional_response('"v1"')
+
+    def validated_changing(self):
+        return self._conditional_response('"v%d"' % len(self.validators_received))
+
+    def validated_rotating(self):
+        # NB every response, 304s included, comes with a new ETag, and any earlier one is accepted as a validator
+        validator = self.headers.get('If-None-Match')
+        self.validators_received.append(validator)
+        etag = '"v%d"' % len(self.validators_received)
+        if validator is not None:
+            return {'body': b'', 'status': 304, 'headers': {'ETag': etag}}
+        return {
+            'body': ('%d' % next(self.count)).encode('us-ascii'),
+            'headers': {'ETag': etag},
+        }
+
+    def _conditional_response(self, etag):
+        self.validators_received.append(self.headers.get('If-None-Match'))
+        if self.headers.get('If-None-Match') == etag:
+            return {'body': b'', 'status': 304, 'headers': {'ETag': etag}}
+        return {
+            'body': ('%d' % next(self.count)).encode('us-ascii'),
+            'headers': {'ETag': etag},
+        }
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class NoCacheFixture(object):
@@ -128,6 +174,19 @@ class DiskCacheFixture(CacheFixture):
         super(DiskCacheFixture, self).tearDown()
         rmtree(self.temp_dir)
 
+
+class DedupDiskCacheFixture(DiskCacheFixture, CacheFixture):
+
+    def cache(self):
+        return DiskCache.build(self.temp_dir, dedup=True)
+
+
+class WarcCacheFixture(DiskCacheFixture):
+    # NB this isn't a direct subclass of CacheFixture, as many tests below look inside the DiskCache
+
+    def cache(self):
+        return WarcCache.build(self.temp_dir)
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class UncachedTests(object):
@@ -155,7 +214,7 @@ class UncachedTests(object):
 class CachedTests(object):
 
     __fixtures__ = (
-        CacheFixture.__subclasses__(),
+        CacheFixture.__subclasses__() + [WarcCacheFixture],
         [ClientFixture],
         [ServerFixture],
     )
@@ -319,6 +378,37 @@ class CachedTests(object):
                     str(index),
                 )
 
+    def test_stale_entry_is_revalidated(self):
+        self.assertEqual(self.fetch('/validated').text, '0')
+        self.assertEqual(self.fetch('/validated', max_cache_life=0, cache_revalidation=True).text, '0')
+        self.assertEqual(self.handler.validators_received, [None, '"v1"'])
+
+    def test_revalidation_refreshes_timestamp(self):
+        self.fetch('/validated')
+        with closing(self.fetch('/validated', max_cache_life=0, cache_revalidation=True, stream=True)) as response:
+            self.assertEqual(response.raw.read(), b'0')
+        self.assertEqual(self.fetch('/validated', max_cache_life=60, cache_revalidation=True).text, '0')
+        self.assertEqual(self.handler.validators_received, [None, '"v1"'])
+
+    def test_modified_entry_is_replaced(self):
+        self.assertEqual(self.fetch('/validated_changing').text, '0')
+        self.assertEqual(self.fetch('/validated_changing', max_cache_life=0, cache_revalidation=True).text, '1')
+        self.assertEqual(self.fetch('/validated_changing').text, '1')
+        self.assertEqual(self.handler.validators_received, [None, '"v0"'])
+
+    def test_revalidation_saves_new_validators(self):
+        if isinstance(self, WarcCacheFixture):
+            self.skipTest("WARC records are left as they are when refreshed, see WarcCache.refresh")
+        self.assertEqual(self.fetch('/validated_rotating').text, '0')
+        for _ in range(2):
+            self.assertEqual(self.fetch('/validated_rotating', max_cache_life=0, cache_revalidation=True).text, '0')
+        self.assertEqual(self.handler.validators_received, [None, '"v1"', '"v2"'])
+
+    def test_no_revalidation_by_default(self):
+        self.fetch('/validated')
+        self.assertEqual(self.fetch('/validated', max_cache_life=0).text, '1')
+        self.assertEqual(self.handler.validators_received, [None, None])
+
     @staticmethod
     def _url_path(url):
         return re.sub(r'^https?://[^/]+', '', url)
@@ -328,7 +418,7 @@ class CachedTests(object):
 class CachedTestsWithCustomMethods(object):
 
     __fixtures__ = (
-        CacheFixture.__subclasses__(),
+        CacheFixture.__subclasses__() + [WarcCacheFixture],
         [ClientFixture],
         [ServerFixture],
     )
@@ -491,6 +581,679 @@ class CachedContentEncodingTests(ContentEncodingTestsDoubled):
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
+class DedupStorageTests(object):
+
+    __fixtures__ = (
+        [DedupDiskCacheFixture],
+        [ClientFixture],
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def fetch(self, path, **kwargs):
+        config = ScraperConfig.from_kwargs(kwargs, consume_all_kwargs_for='fetch')
+        return self.client.submit(GET(self.server_url(path)), config)
+
+    def _body_files(self):
+        return sorted(
+            path.join(dirpath, f)
+            for dirpath, _, filenames in walk(path.join(self.temp_dir, 'bodies'))
+            for f in filenames
+        )
+
+    def test_identical_bodies_are_stored_once(self):
+        for key in ('a', 'b', 'c'):
+            self.assertEqual(self.fetch('/landing', cache_key=(key,)).text, 'You got redirected')
+        self.assertEqual(len(self._body_files()), 1)
+        for key in ('a', 'b', 'c'):
+            self.assertEqual(self.fetch('/landing', cache_key=(key,)).text, 'You got redirected')
+
+    def test_distinct_bodies_are_stored_separately(self):
+        self.assertEqual(self.fetch('/one_kilo', cache_key=('a',)).text, '0' * 1024)
+        self.assertEqual(self.fetch('/one_kilo', cache_key=('b',)).text, '1' * 1024)
+        self.assertEqual(len(self._body_files()), 2)
+
+    def test_body_is_deleted_with_its_last_reference(self):
+        self.fetch('/landing', cache_key=('a',))
+        self.fetch('/landing', cache_key=('b',))
+        cache = self.client.session.get_adapter('http://').cache
+        cache.discard(('a',))
+        self.assertEqual(len(self._body_files()), 1)
+        self.assertEqual(self.fetch('/landing', cache_key=('b',)).text, 'You got redirected')
+        cache.discard(('b',))
+        self.assertEqual(self._body_files(), [])
+
+    def test_replaced_body_is_released(self):
+        self.assertEqual(self.fetch('/one_kilo').text, '0' * 1024)
+        self.assertEqual(self.fetch('/one_kilo', force_cache_stale=True).text, '1' * 1024)
+        self.assertEqual(len(self._body_files()), 1)
+        self.assertEqual(self.fetch('/one_kilo').text, '1' * 1024)
+
+    def test_purge_collects_orphaned_bodies(self):
+        self.fetch('/landing')
+        orphan_path = path.join(self.temp_dir, 'bodies', '00', 'orphan.gz')
+        makedirs(path.dirname(orphan_path))
+        with open(orphan_path, 'wb'):
+            pass
+        self.client.session.get_adapter('http://').cache.purge(0)
+        self.assertEqual(len(self._body_files()), 1)
+        self.assertFalse(path.isdir(path.dirname(orphan_path)))
+
+    def test_flat_files_remain_readable(self):
+        with HttpClient(DEFAULT_CONFIG._replace(courtesy_seconds=0), cache=DiskCache.build(self.temp_dir), logger=None) as client:
+            self.assertEqual(client.submit(GET(self.server_url('/counter')), DEFAULT_CONFIG).text, '0')
+        self.assertEqual(self.fetch('/counter').text, '0')
+        self.assertEqual(self._body_files(), [])
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class PurgeTests(object):
+
+    class RecordingMetricsSink(NullMetricsSink):
+
+        def __init__(self):
+            self.reported = []
+            self.purge_done = Event()
+
+        def record_cache_purge(self, report):
+            self.reported.append(report)
+            self.purge_done.set()
+
+    __fixtures__ = (
+        CacheFixture.__subclasses__(),
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def fetch(self, path, base_config=DEFAULT_CONFIG, metrics=None, **kwargs):
+        with HttpClient(base_config._replace(courtesy_seconds=0), cache=self.cache(), logger=None, metrics=metrics) as client:
+            config = ScraperConfig.from_kwargs(kwargs, consume_all_kwargs_for='fetch')
+            text = client.submit(GET(self.server_url(path)), config).text
+            if metrics is not None:
+                # NB closing the client interrupts any purge that's still running in the background, so let it finish first
+                self.assertTrue(metrics.purge_done.wait(10))
+            return text
+
+    def purge(self, **kwargs):
+        cache = self.cache()
+        try:
+            return cache.purge(**kwargs)
+        finally:
+            cache.close()
+
+    def _set_last_access(self, key, timestamp):
+        cache = self.cache()
+        try:
+            [file_path] = [file_path for k, file_path in cache.storage.iter_usage() if k == key]
+        finally:
+            cache.close()
+        utime(file_path, (timestamp, timestamp))
+        return path.getsize(file_path)
+
+    def test_old_entries_are_purged(self):
+        self.assertEqual(self.fetch('/counter', cache_key=('a',)), '0')
+        self.assertEqual(self.fetch('/counter', cache_key=('b',)), '1')
+        report = self.purge(min_timestamp=time() + 1)
+        self.assertEqual(report.num_entries_removed, 2)
+        self.assertGreater(report.num_bytes_freed, 0)
+        self.assertTrue(report.completed)
+        self.assertEqual(self.fetch('/counter', cache_key=('a',)), '2')
+
+    def test_recent_entries_are_kept(self):
+        self.assertEqual(self.fetch('/counter'), '0')
+        report = self.purge(min_timestamp=time() - 60)
+        self.assertEqual((report.num_entries_scanned, report.num_entries_removed), (1, 0))
+        self.assertEqual(self.fetch('/counter'), '0')
+
+    def test_least_recently_used_entries_are_evicted(self):
+        for key in ('a', 'b', 'c'):
+            self.fetch('/one_kilo', cache_key=(key,))
+        total_bytes = sum(
+            self._set_last_access((key,), timestamp)
+            for key, timestamp in (('a', 1000), ('b', 2000), ('c', 3000))
+        )
+        # reading 'a' makes it the most recently used
+        self.assertEqual(self.fetch('/one_kilo', cache_key=('a',)), '0' * 1024)
+        report = self.purge(max_total_bytes=total_bytes - 1)
+        self.assertEqual(report.num_entries_removed, 1)
+        self.assertEqual(self.fetch('/one_kilo', cache_key=('a',)), '0' * 1024)
+        self.assertEqual(self.fetch('/one_kilo', cache_key=('b',)), '3' * 1024)
+        self.assertEqual(self.fetch('/one_kilo', cache_key=('c',)), '2' * 1024)
+
+    def test_purge_resumes_after_time_budget(self):
+        for key in ('a', 'b', 'c'):
+            self.fetch('/counter', cache_key=(key,))
+        cache = self.cache()
+        try:
+            min_timestamp = time() + 1
+            report = cache.purge(min_timestamp=min_timestamp, time_budget=0)
+            self.assertFalse(report.completed)
+            self.assertEqual(report.num_entries_scanned, 1)
+            report = cache.purge(min_timestamp=min_timestamp)
+            self.assertTrue(report.completed)
+            self.assertEqual((report.num_entries_scanned, report.num_entries_removed), (3, 3))
+        finally:
+            cache.close()
+
+    def test_first_request_purges_in_background(self):
+        self.assertEqual(self.fetch('/counter'), '0')
+        metrics = self.RecordingMetricsSink()
+        self.fetch('/landing', base_config=DEFAULT_CONFIG._replace(max_cache_bytes=0), metrics=metrics)
+        [report] = metrics.reported
+        self.assertTrue(report.completed)
+        self.assertGreaterEqual(report.num_entries_removed, 1)
+        # NB /landing counted as 1
+        self.assertEqual(self.fetch('/counter'), '2')
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ArchiveTests(object):
+
+    __fixtures__ = (
+        CacheFixture.__subclasses__(),
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def setUp(self):
+        super(ArchiveTests, self).setUp()
+        self.other_dir = mkdtemp()
+
+    def tearDown(self):
+        super(ArchiveTests, self).tearDown()
+        rmtree(self.other_dir)
+
+    def fetch(self, path, cache, **kwargs):
+        with HttpClient(DEFAULT_CONFIG._replace(courtesy_seconds=0), cache=cache, logger=None) as client:
+            config = ScraperConfig.from_kwargs(kwargs, consume_all_kwargs_for='fetch')
+            try:
+                return client.submit(GET(self.server_url(path)), config).text
+            except HttpError as error:
+                return error.reason.response.text
+
+    def export(self, **kwargs):
+        archive = BytesIO()
+        cache = self.cache()
+        try:
+            num_exported = export_cache(cache, archive, **kwargs)
+        finally:
+            cache.close()
+        return num_exported, BytesIO(archive.getvalue())
+
+    def import_(self, archive):
+        cache = DiskCache.build(self.other_dir)
+        try:
+            return import_cache(cache, archive)
+        finally:
+            cache.close()
+
+    def test_export_and_import(self):
+        self.assertEqual(self.fetch('/counter', self.cache()), '0')
+        self.assertEqual(self.fetch('/one_kilo', self.cache()), '1' * 1024)
+        self.assertEqual(self.fetch('/five_hundred', self.cache()), 'I have failed 2 times')
+        num_exported, archive = self.export()
+        self.assertEqual(num_exported, 3)
+        self.assertEqual(self.import_(archive), 3)
+        for _ in ('first', 'again'):
+            self.assertEqual(self.fetch('/counter', DiskCache.build(self.other_dir)), '0')
+            self.assertEqual(self.fetch('/one_kilo', DiskCache.build(self.other_dir)), '1' * 1024)
+            self.assertEqual(self.fetch('/five_hundred', DiskCache.build(self.other_dir)), 'I have failed 2 times')
+
+    def test_large_bodies_are_streamed(self):
+        self.assertEqual(self.fetch('/one_kilo', self.cache()), '0' * 1024)
+        previous_max_size = cache_archive.MAX_BUFFERED_BODY_SIZE
+        cache_archive.MAX_BUFFERED_BODY_SIZE = 0
+        try:
+            _, archive = self.export()
+            self.assertEqual(self.import_(archive), 1)
+        finally:
+            cache_archive.MAX_BUFFERED_BODY_SIZE = previous_max_size
+        self.assertEqual(self.fetch('/one_kilo', DiskCache.build(self.other_dir)), '0' * 1024)
+
+    def test_export_filters(self):
+        self.fetch('/counter', self.cache(), cache_key=('a', 'x'))
+        self.fetch('/counter', self.cache(), cache_key=('b', 'x'))
+        self.assertEqual(self.export(key_prefix='a/')[0], 1)
+        self.assertEqual(self.export(min_timestamp=time() + 60)[0], 0)
+        self.assertEqual(self.export(hosts={'example.com'})[0], 0)
+        self.assertEqual(self.export(hosts={urlparse(self.server_url('/')).hostname})[0], 2)
+
+    def test_archive_is_a_plain_tar_stream(self):
+        self.fetch('/counter', self.cache(), cache_key=('a', 'x'))
+        _, archive = self.export()
+        with tarfile.open(fileobj=archive, mode='r|') as tar:
+            names = [member.name for member in tar]
+        self.assertEqual(names[0], 'entries/a/x.json')
+        self.assertTrue(re.match(r'^bodies/a/x\.\w+$', names[1]), names[1])
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class WarcCacheTests(object):
+
+    __fixtures__ = (
+        [WarcCacheFixture],
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def fetch(self, path, **kwargs):
+        with HttpClient(DEFAULT_CONFIG._replace(courtesy_seconds=0), cache=self.cache(), logger=None) as client:
+            config = ScraperConfig.from_kwargs(kwargs, consume_all_kwargs_for='fetch')
+            return client.submit(GET(self.server_url(path)), config).text
+
+    def _write_warc(self, file_name, records):
+        file_path = path.join(self.temp_dir, file_name)
+        with open(file_path, 'wb') as file_out:
+            for fields, block in records:
+                data = b'WARC/1.0\r\n' + b''.join(
+                    ('%s: %s\r\n' % field).encode('UTF-8')
+                    for field in list(fields) + [('Content-Length', len(block))]
+                ) + b'\r\n' + block + b'\r\n\r\n'
+                if file_name.endswith('.gz'):
+                    member = BytesIO()
+                    with gzip.GzipFile(fileobj=member, mode='wb') as gzip_out:
+                        gzip_out.write(data)
+                    data = member.getvalue()
+                file_out.write(data)
+
+    @staticmethod
+    def _response_record(url, http_response):
+        fields = [
+            ('WARC-Type', 'response'),
+            ('WARC-Target-URI', url),
+            ('WARC-Date', '2020-01-01T00:00:00Z'),
+            ('Content-Type', 'application/http; msgtype=response'),
+        ]
+        return fields, http_response
+
+    def test_archived_responses_are_served(self):
+        for file_name, plain_path, chunked_path in (
+                ('archive.warc', '/counter', '/one_kilo'),
+                ('archive.warc.gz', '/landing', '/templated'),
+                ):
+            self._write_warc(file_name, [
+                (
+                    [('WARC-Type', 'warcinfo'), ('WARC-Date', '2020-01-01T00:00:00Z')],
+                    b'software: test\r\n',
+                ),
+                self._response_record(
+                    self.server_url(plain_path),
+                    b'HTTP/1.1 200 OK\r\nContent-Length: 8\r\nSet-Cookie: a=1\r\n\r\narchived',
+                ),
+                self._response_record(
+                    self.server_url(chunked_path),
+                    b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n4\r\nchun\r\n3\r\nked\r\n0\r\n\r\n',
+                ),
+            ])
+        for _ in ('first', 'again'):
+            for plain_path, chunked_path in (('/counter', '/one_kilo'), ('/landing', '/templated')):
+                self.assertEqual(self.fetch(plain_path), 'archived')
+                self.assertEqual(self.fetch(chunked_path), 'chunked')
+        # the archived responses are old, but they're served as long as they're not too old
+        self.assertEqual(self.fetch('/counter', max_cache_life=3600), '0')
+        self.assertEqual(self.fetch('/counter'), '0')
+
+    def test_index_can_be_rebuilt_from_warc_files(self):
+        self.assertEqual(self.fetch('/counter'), '0')
+        self.assertEqual(self.fetch('/counter', cache_key=('custom', 'key')), '1')
+        self.assertEqual(self.fetch('/five_hundred', auto_raise_for_status=False), 'I have failed 2 times')
+        for file_name in listdir(self.temp_dir):
+            if file_name.startswith('index.cdx'):
+                unlink(path.join(self.temp_dir, file_name))
+        for _ in ('rebuilt', 'again'):
+            self.assertEqual(self.fetch('/counter'), '0')
+            self.assertEqual(self.fetch('/counter', cache_key=('custom', 'key')), '1')
+            self.assertEqual(self.fetch('/five_hundred', auto_raise_for_status=False), 'I have failed 2 times')
+
+    def test_lookups_in_sorted_index(self):
+        keys = [('key', '%d' % i) for i in range(50)]
+        for i, key in enumerate(keys):
+            self.assertEqual(self.fetch('/counter', cache_key=key), '%d' % i)
+        with open(path.join(self.temp_dir, 'index.cdx'), 'rb') as file_in:
+            lines = file_in.readlines()
+        self.assertEqual(len(lines), len(keys))
+        self.assertEqual(lines, sorted(lines))
+        self.assertFalse(path.exists(path.join(self.temp_dir, 'index.cdx.journal')))
+        cache = self.cache()
+        try:
+            for i, key in enumerate(keys):
+                with closing(cache.get(key, 0).response) as response:
+                    self.assertEqual(response.text, '%d' % i)
+            self.assertIsNone(cache.get(('key',), 0))
+            self.assertIsNone(cache.get(('key', '50'), 0))
+            self.assertTrue(cache.discard(('key', '7')))
+            self.assertFalse(cache.discard(('key', '7')))
+            self.assertIsNone(cache.get(('key', '7'), 0))
+        finally:
+            cache.close()
+        self.assertEqual(self.fetch('/counter', cache_key=('key', '7')), '50')
+        self.assertEqual(self.fetch('/counter', cache_key=('key', '8')), '8')
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class StorageCodecTests(object):
+
+    __fixtures__ = (
+        [DiskCacheFixture],
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def fetch(self, path, codec, **kwargs):
+        cache = DiskCache.build(self.temp_dir, codec=codec)
+        with HttpClient(DEFAULT_CONFIG._replace(courtesy_seconds=0), cache=cache, logger=None) as client:
+            config = ScraperConfig.from_kwargs(kwargs, consume_all_kwargs_for='fetch')
+            return client.submit(GET(self.server_url(path)), config).text
+
+    def _data_files(self):
+        return sorted(
+            path.relpath(path.join(dirpath, f), self.temp_dir)
+            for dirpath, _, filenames in walk(self.temp_dir)
+            for f in filenames
+            if dirpath != self.temp_dir and not dirpath.endswith('dictionaries')
+        )
+
+    def test_none_codec_stores_bodies_as_is(self):
+        for _ in ('live', 'from-cache'):
+            self.assertEqual(self.fetch('/counter', 'none'), '0')
+        [file_path] = self._data_files()
+        self.assertTrue(file_path.endswith('.raw'))
+        with open(path.join(self.temp_dir, file_path), 'rb') as file_in:
+            self.assertEqual(file_in.read(), b'0')
+
+    @skipIf(zstandard is NotImplemented, "zstandard not installed")
+    def test_zstd_codec(self):
+        for _ in ('live', 'from-cache'):
+            self.assertEqual(self.fetch('/counter', 'zstd'), '0')
+        [file_path] = self._data_files()
+        self.assertTrue(file_path.endswith('.zst'))
+        with open(path.join(self.temp_dir, file_path), 'rb') as file_in:
+            self.assertEqual(zstandard.ZstdDecompressor().decompressobj().decompress(file_in.read()), b'0')
+
+    @skipIf(zstandard is NotImplemented, "zstandard not installed")
+    def test_bodies_stored_with_another_codec_remain_readable(self):
+        self.assertEqual(self.fetch('/counter', 'gzip'), '0')
+        self.assertEqual(self.fetch('/counter', 'zstd'), '0')
+        self.assertEqual(self.fetch('/counter', 'zstd', force_cache_stale=True), '1')
+        [file_path] = self._data_files()
+        self.assertTrue(file_path.endswith('.zst'))
+        self.assertEqual(self.fetch('/counter', 'gzip'), '1')
+
+    @skipIf(zstandard is NotImplemented, "zstandard not installed")
+    def test_dictionary_training_and_rotation(self):
+        for i in range(40):
+            self.fetch('/templated', 'zstd+dict', cache_key=('k%02d' % i,))
+        cache = DiskCache.build(self.temp_dir, codec='zstd+dict')
+        try:
+            first_dict_id = cache.train_dictionary(dict_size=1024)
+        finally:
+            cache.close()
+        first_text = self.fetch('/templated', 'zstd+dict', cache_key=('first',))
+        with open(path.join(self.temp_dir, 'first.zst'), 'rb') as file_in:
+            self.assertEqual(zstandard.get_frame_parameters(file_in.read(18)).dict_id, first_dict_id)
+        cache = DiskCache.build(self.temp_dir, codec='zstd+dict')
+        try:
+            second_dict_id = cache.train_dictionary(dict_size=1024)
+        finally:
+            cache.close()
+        self.assertNotEqual(first_dict_id, second_dict_id)
+        self.assertEqual(self.fetch('/templated', 'zstd+dict', cache_key=('first',)), first_text)
+        second_text = self.fetch('/templated', 'zstd+dict', cache_key=('second',))
+        with open(path.join(self.temp_dir, 'second.zst'), 'rb') as file_in:
+            self.assertEqual(zstandard.get_frame_parameters(file_in.read(18)).dict_id, second_dict_id)
+        self.assertEqual(self.fetch('/templated', 'gzip', cache_key=('second',)), second_text)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            DiskCache.build(self.temp_dir, codec='lz4')
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+@skipIf(blake2b is NotImplemented, "BLAKE2 not available")
+class CacheKeySchemeTests(object):
+
+    __fixtures__ = (
+        [DiskCacheFixture],
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def fetch(self, request, scheme, **kwargs):
+        base_config = DEFAULT_CONFIG._replace(courtesy_seconds=0, cache_key_scheme=scheme)
+        with HttpClient(base_config, cache=DiskCache.build(self.temp_dir), logger=None) as client:
+            config = ScraperConfig.from_kwargs(kwargs, base_config, consume_all_kwargs_for='fetch')
+            return client.submit(request, config).text
+
+    def _data_files(self):
+        return sorted(
+            tuple(path.relpath(path.join(dirpath, f), self.temp_dir).split(path.sep))
+            for dirpath, _, filenames in walk(self.temp_dir)
+            for f in filenames
+            if dirpath != self.temp_dir and not dirpath.endswith('dictionaries')
+        )
+
+    def test_md5_is_the_default(self):
+        self.assertEqual(self.fetch(GET(self.server_url('/counter')), 'md5'), '0')
+        key = default_cache_key('GET', self.server_url('/counter'), None)
+        self.assertEqual(self._data_files(), [key[:-1] + (key[-1] + '.gz',)])
+
+    def test_blake2_keys(self):
+        for _ in ('live', 'from-cache'):
+            self.assertEqual(self.fetch(POST(self.server_url('/counter'), data=b'x' * 100000), 'blake2b'), '0')
+        self.assertEqual(self.fetch(POST(self.server_url('/counter'), data=b'y' * 100000), 'blake2b'), '1')
+        self.assertEqual(self.fetch(POST(self.server_url('/counter'), data=b'x' * 100000), 'blake2b', cache_key_salt=1), '2')
+        self.assertEqual(
+            [tuple(len(part) for part in file_path[:-1]) for file_path in self._data_files()],
+            [(2, 2)] * 3,
+        )
+
+    def test_fan_out_depth(self):
+        scheme = Blake2KeyScheme(fan_out_depth=3, digest_size=20)
+        key = scheme.compute('GET', 'http://example.com/', None)
+        self.assertEqual([len(part) for part in key], [2, 2, 2, 34])
+        self.assertNotEqual(key, scheme.compute('GET', 'http://example.com/', b''))
+        self.assertNotEqual(scheme.compute('GET', 'http://example.com/a', 'b'), scheme.compute('GET', 'http://example.com/ab', ''))
+
+    def test_compatibility_mode_finds_md5_keys(self):
+        url = self.server_url('/counter')
+        self.assertEqual(self.fetch(GET(url), 'md5'), '0')
+        self.assertEqual(self.fetch(GET(url), 'blake2b+md5'), '0')
+        self.assertEqual(self.fetch(GET(url), 'blake2b'), '1')
+        # NB now that there's an entry under the BLAKE2 key, it's the one that's found
+        self.assertEqual(self.fetch(GET(url), 'blake2b+md5'), '1')
+        self.assertEqual(self.fetch(GET(url), 'md5'), '0')
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            self.fetch(GET(self.server_url('/counter')), 'sha1')
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ShelfIndexTests(object):
+
+    __fixtures__ = (
+        [DiskCacheFixture],
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def fetch(self, path, **kwargs):
+        with HttpClient(DEFAULT_CONFIG._replace(courtesy_seconds=0), cache=DiskCache.build(self.temp_dir), logger=None) as client:
+            config = ScraperConfig.from_kwargs(kwargs, consume_all_kwargs_for='fetch')
+            response = client.submit(GET(self.server_url(path)), config)
+            response.content # pylint: disable=pointless-statement
+            return response
+
+    def test_responses_are_indexed_as_records(self):
+        self.fetch('/counter')
+        key = default_cache_key('GET', self.server_url('/counter'), None)
+        cache = DiskCache.build(self.temp_dir)
+        try:
+            record_format, timestamp, _ = cache.index.db[cache.index._key_to_string(key)]
+            self.assertEqual(record_format, cache.index.record_format)
+            self.assertIsNone(cache.index.lookup(key, timestamp + 1))
+            self.assertEqual(cache.index.lookup(key, timestamp).timestamp, timestamp)
+        finally:
+            cache.close()
+
+    def test_response_rebuilt_from_record(self):
+        live = self.fetch('/counter')
+        cached = self.fetch('/counter')
+        self.assertEqual(cached.text, '0')
+        for response in (live, cached):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.url, self.server_url('/counter'))
+            self.assertEqual(response.headers['Set-Cookie'], 'counter=0; Path=/')
+            self.assertEqual(response.cookies.get('counter'), '0')
+            self.assertEqual(response.request.method, 'GET')
+            self.assertEqual(response.request.url, self.server_url('/counter'))
+
+    def test_record_keeps_history_and_elapsed(self):
+        # NB with stream=True the body is only read, and the entry indexed, once requests has followed the redirects
+        live = self.fetch('/redirect', stream=True)
+        key = default_cache_key('GET', self.server_url('/landing'), None)
+        cache = DiskCache.build(self.temp_dir)
+        try:
+            cached = cache.index.lookup(key).response
+        finally:
+            cache.close()
+        self.assertEqual(
+            [(response.url, response.status_code) for response in cached.history],
+            [(response.url, response.status_code) for response in live.history],
+        )
+        self.assertEqual([response.url for response in cached.history], [
+            self.server_url('/redirect'),
+            self.server_url('/redirect_again'),
+        ])
+        self.assertEqual(cached.history[0].cookies.get('redirect'), '0')
+        self.assertEqual(cached.history[1].content, live.history[1].content)
+        self.assertEqual(cached.elapsed, live.elapsed)
+
+    def test_records_without_history_are_still_read(self):
+        self.fetch('/counter')
+        key = default_cache_key('GET', self.server_url('/counter'), None)
+        cache = DiskCache.build(self.temp_dir)
+        try:
+            key_string = cache.index._key_to_string(key)
+            record_format, timestamp, pickled_record = cache.index.db[key_string]
+            # NB this is how records were saved before they had `history`, `elapsed` and `content`
+            short_record = pickle.loads(pickled_record)[:9]
+            cache.index.db[key_string] = (record_format, timestamp, pickle.dumps(short_record))
+        finally:
+            cache.close()
+        cached = self.fetch('/counter')
+        self.assertEqual(cached.text, '0')
+        self.assertEqual(cached.history, [])
+
+    def test_entries_pickled_whole_are_still_read(self):
+        self.fetch('/counter')
+        key = default_cache_key('GET', self.server_url('/counter'), None)
+        cache = DiskCache.build(self.temp_dir)
+        try:
+            entry = cache.index.lookup(key)
+            # NB this is how entries used to be saved
+            with cache.index._modify_for_pickling(entry):
+                cache.index.db[cache.index._key_to_string(key)] = entry
+        finally:
+            cache.close()
+        self.assertEqual(self.fetch('/counter').text, '0')
+        self.assertEqual(self.fetch('/counter', max_cache_life=0).text, '1')
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ReadOnlyCacheTests(object):
+
+    __fixtures__ = (
+        [DiskCacheFixture, DedupDiskCacheFixture],
+        [ServerFixture],
+    )
+
+    new_server = CacheTestServer
+
+    def setUp(self):
+        super(ReadOnlyCacheTests, self).setUp()
+        # NB the cache is filled before it's opened read-only
+        self.fetch('/counter', self.cache())
+
+    def read_only_cache(self):
+        return DiskCache.build(self.temp_dir, dedup=isinstance(self, DedupDiskCacheFixture), read_only=True)
+
+    def fetch(self, path, cache, **kwargs):
+        with HttpClient(DEFAULT_CONFIG._replace(courtesy_seconds=0), cache=cache, logger=None) as client:
+            config = ScraperConfig.from_kwargs(kwargs, consume_all_kwargs_for='fetch')
+            return client.submit(GET(self.server_url(path)), config).text
+
+    def _file_stats(self):
+        return sorted(
+            (path.join(dirpath, f), path.getmtime(path.join(dirpath, f)))
+            for dirpath, _, filenames in walk(self.temp_dir)
+            for f in filenames
+        )
+
+    def test_many_readers_at_once(self):
+        file_stats = self._file_stats()
+        readers = [self.read_only_cache() for _ in range(3)]
+        try:
+            for reader in readers:
+                self.assertEqual(self.fetch('/counter', reader), '0')
+        finally:
+            for reader in readers:
+                reader.close()
+        self.assertEqual(self._file_stats(), file_stats)
+
+    def test_misses_are_not_saved(self):
+        file_stats = self._file_stats()
+        self.assertEqual(self.fetch('/counter', self.read_only_cache(), force_cache_stale=True), '1')
+        self.assertEqual(self.fetch('/counter', self.read_only_cache(), max_cache_life=0, cache_revalidation=True), '2')
+        self.assertEqual(self.fetch('/counter', self.read_only_cache()), '0')
+        self.assertEqual(self._file_stats(), file_stats)
+
+    def test_offline_misses_raise(self):
+        self.assertEqual(self.fetch('/counter', self.read_only_cache(), cache_offline=True), '0')
+        with self.assertRaises(CacheMiss):
+            self.fetch('/counter', self.read_only_cache(), cache_offline=True, cache_key_salt='missing')
+        with self.assertRaises(CacheMiss):
+            self.fetch('/counter', self.read_only_cache(), cache_offline=True, force_cache_stale=True)
+        self.assertEqual(self.fetch('/counter', self.cache(), force_cache_stale=True), '1')
+
+    def test_writes_are_refused(self):
+        cache = self.read_only_cache()
+        try:
+            key = default_cache_key('GET', self.server_url('/counter'), None)
+            with self.assertRaises(ValueError):
+                cache.discard(key)
+            with self.assertRaises(ValueError):
+                cache.purge(min_timestamp=time())
+            self.assertIsNotNone(cache.get(key, 0))
+        finally:
+            cache.close()
+
+    def test_scraper_does_not_retry_offline_misses(self):
+        scraper = Scraper(
+            courtesy_seconds=0,
+            cache_root_path=self.temp_dir,
+            cache_dedup=isinstance(self, DedupDiskCacheFixture),
+            cache_read_only=True,
+            cache_offline=True,
+        )
+        parse = lambda page: page.response.text
+        try:
+            self.assertEqual(scraper.scrape(self.server_url('/counter'), parse=parse), '0')
+            with self.assertRaises(CacheMiss):
+                scraper.scrape(self.server_url('/counter?missing=1'), parse=parse)
+        finally:
+            scraper.release_resources()
+        self.assertEqual(self.fetch('/counter', self.cache(), force_cache_stale=True), '1')
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
 class ErrorHandlingTests(object):
 
     class SilentScraper(Scraper):
@@ -512,7 +1275,7 @@ class ErrorHandlingTests(object):
             return self.on_error
 
     __fixtures__ = (
-        CacheFixture.__subclasses__(),
+        CacheFixture.__subclasses__() + [WarcCacheFixture],
         [ClientFixture],
         [ServerFixture],
     )
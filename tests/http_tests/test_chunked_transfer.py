@@ -13,8 +13,14 @@ from .test_cache import CacheFixture, NoCacheFixture
 
 #----------------------------------------------------------------------------------------------------------------------------------
 
+BIG_CHUNKS = [('%04d' % i).encode('ascii') * 250 for i in range(200)]
+
+
 class ChunkedTransferTestServer(object):
 
+    def __init__(self):
+        self.num_big_chunked_requests = 0
+
     def chunked(self):
         return {
             'headers': {
@@ -30,6 +36,18 @@ class ChunkedTransferTestServer(object):
             ),
         }
 
+    def big_chunked(self):
+        self.num_big_chunked_requests += 1
+        return {
+            'headers': {
+                'Transfer-Encoding': 'chunked',
+            },
+            'body': bytes().join(
+                b'%x\r\n%s\r\n' % (len(chunk), chunk)
+                for chunk in BIG_CHUNKS
+            ) + b'0\r\n\r\n',
+        }
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
 class ChunkedTransferTests(object):
@@ -61,6 +79,17 @@ class ChunkedTransferTests(object):
             b'look: 16 octets\noh wow: 16 more\n',
         )
 
+    def test_chunked_content_cached_while_streaming(self):
+        for _ in range(2):
+            self.assertEqual(
+                bytes().join(self.fetch('/big_chunked', stream=True).iter_content(chunk_size=100)),
+                bytes().join(BIG_CHUNKS),
+            )
+        self.assertEqual(
+            self.handler.num_big_chunked_requests,
+            1 if isinstance(self, CacheFixture) else 2,
+        )
+
     # def test_natrail(self):
     #     self.assertRegex(
     #         self.client.get('http://ojp.nationalrail.co.uk/service/timesandfares/EDB/GLQ/110817/1500/dep').text,
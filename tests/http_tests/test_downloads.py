@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import hashlib
+from os import listdir, path
+import re
+from shutil import rmtree
+from tempfile import mkdtemp
+
+# alcazar
+from alcazar.backoff import ExponentialBackoff
+from alcazar.exceptions import ScraperError
+from alcazar.http import HttpClient
+from alcazar.scraper import Scraper
+
+# tests
+from .plumbing import ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+DATA = bytes(bytearray(range(256))) * 1000
+
+
+class DownloadTestServer(object):
+
+    def __init__(self):
+        self.range_headers = []
+
+    def blob(self, num_truncated='0', ranges='1'):
+        range_header = self.headers.get('Range')
+        self.range_headers.append(range_header)
+        start, end, status = 0, len(DATA), 200
+        headers = {'Content-Type': 'application/octet-stream'}
+        if ranges == '1':
+            headers['Accept-Ranges'] = 'bytes'
+            if range_header:
+                match = re.match(r'bytes=(\d+)-(\d*)$', range_header)
+                start = int(match.group(1))
+                end = int(match.group(2)) + 1 if match.group(2) else len(DATA)
+                status = 206
+                headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end - 1, len(DATA))
+        body = DATA[start:end]
+        headers['Content-Length'] = str(len(body))
+        if len(self.range_headers) <= int(num_truncated):
+            # NB the connection is closed before the whole body is sent
+            body = body[:len(body) // 2]
+        return {'body': body, 'status': status, 'headers': headers}
+
+
+class DownloadingScraper(Scraper):
+
+    download_chunk_size = 10000
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('courtesy_seconds', 0)
+        kwargs.setdefault('http_client', HttpClient(logger=None, cache=None))
+        kwargs.setdefault('backoff_policy', ExponentialBackoff(initial=0))
+        super(DownloadingScraper, self).__init__(**kwargs)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class DownloadTests(object):
+
+    __fixtures__ = [
+        [ServerFixture],
+    ]
+
+    new_server = DownloadTestServer
+
+    def setUp(self):
+        super(DownloadTests, self).setUp()
+        self.temp_dir = mkdtemp()
+        self.file_path = path.join(self.temp_dir, 'blob.bin')
+        self.scraper = DownloadingScraper()
+
+    def tearDown(self):
+        self.scraper.release_resources()
+        rmtree(self.temp_dir)
+        super(DownloadTests, self).tearDown()
+
+    def download(self, url, **kwargs):
+        self.scraper.download(self.server_url(url), self.file_path, **kwargs)
+        with open(self.file_path, 'rb') as file_in:
+            return file_in.read()
+
+    def test_download(self):
+        self.assertEqual(self.download('/blob', checksum=('sha256', hashlib.sha256(DATA).hexdigest())), DATA)
+        self.assertEqual(self.handler.range_headers, [None])
+        self.assertEqual(listdir(self.temp_dir), ['blob.bin'])
+
+    def test_resumes_with_range(self):
+        self.assertEqual(self.download('/blob?num_truncated=2', expected_size=len(DATA)), DATA)
+        self.assertEqual(self.handler.range_headers, [None, 'bytes=128000-', 'bytes=192000-'])
+
+    def test_resumes_leftover_part_file(self):
+        with open(self.file_path + '.part', 'wb') as file_out:
+            file_out.write(DATA[:1000])
+        self.assertEqual(self.download('/blob'), DATA)
+        self.assertEqual(self.handler.range_headers, ['bytes=1000-'])
+
+    def test_starts_over_if_server_ignores_range(self):
+        self.assertEqual(self.download('/blob?num_truncated=1&ranges=0'), DATA)
+        self.assertEqual(self.handler.range_headers, [None, 'bytes=128000-'])
+
+    def test_checksum_mismatch(self):
+        with self.assertRaises(ScraperError):
+            self.download('/blob', checksum=('md5', '0' * 32))
+        self.assertEqual(listdir(self.temp_dir), [])
+
+    def test_parallel_segments(self):
+        self.assertEqual(self.download('/blob?num_truncated=2', num_segments=4), DATA)
+        self.assertEqual(self.handler.range_headers[0], 'bytes=0-0')
+        # NB one of the four segments was truncated and had to be resumed, but which one depends on the threads
+        self.assertEqual(len(self.handler.range_headers), 6)
+        self.assertTrue(
+            {'bytes=0-63999', 'bytes=64000-127999', 'bytes=128000-191999', 'bytes=192000-255999'} < set(self.handler.range_headers)
+        )
+        self.assertEqual(listdir(self.temp_dir), ['blob.bin'])
+
+    def test_existing_file_is_kept(self):
+        with open(self.file_path, 'wb') as file_out:
+            file_out.write(b'old')
+        self.assertEqual(self.download('/blob'), b'old')
+        self.assertEqual(self.download('/blob', overwrite=True), DATA)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
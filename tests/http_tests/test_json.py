@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import json
+
+# alcazar
+from alcazar.config import DEFAULT_CONFIG
+from alcazar.datastructures import GET, Query
+from alcazar.fetcher import Fetcher
+from alcazar.husker import JmesPathHusker
+
+# tests
+from .plumbing import ClientFixture, ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class JsonTestServer(object):
+
+    records = [{'id': i, 'name': 'record é %d' % i} for i in range(500)]
+
+    def utf8(self):
+        return {
+            'body': json.dumps({'text': 'été'}, ensure_ascii=False).encode('UTF-8'),
+            'headers': {'Content-Type': 'application/json'},
+        }
+
+    def latin1(self):
+        return {
+            'body': json.dumps({'text': 'été'}, ensure_ascii=False).encode('ISO-8859-1'),
+            'headers': {'Content-Type': 'application/json; charset=ISO-8859-1'},
+        }
+
+    def array(self):
+        return {
+            'body': json.dumps(self.records).encode('UTF-8'),
+            'headers': {'Content-Type': 'application/json'},
+        }
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class JsonTests(object):
+
+    __fixtures__ = [
+        [ClientFixture],
+        [ServerFixture],
+    ]
+
+    new_server = JsonTestServer
+
+    def setUp(self):
+        super(JsonTests, self).setUp()
+        self.fetcher = Fetcher(DEFAULT_CONFIG, http_client=self.client)
+
+    def query(self, path, **config):
+        return Query(GET(self.server_url(path)), config=DEFAULT_CONFIG._replace(courtesy_seconds=0, **config))
+
+    def test_json_page_decodes_utf8_bytes(self):
+        page = self.fetcher.fetch(self.query('/utf8'))
+        self.assertIsInstance(page.husker, JmesPathHusker)
+        self.assertEqual(page.one('text'), 'été')
+
+    def test_json_page_honours_declared_charset(self):
+        page = self.fetcher.fetch_json(self.query('/latin1'))
+        self.assertEqual(page.one('text'), 'été')
+
+    def test_json_page_with_stdlib_decoder(self):
+        page = self.fetcher.fetch_json(self.query('/utf8', json_decoder='json'))
+        self.assertEqual(page.one('text'), 'été')
+
+    def test_json_records_are_streamed(self):
+        self.fetcher.json_stream_chunk_size = 100
+        records = self.fetcher.fetch_json_records(self.query('/array'))
+        first = next(records)
+        self.assertIsInstance(first, JmesPathHusker)
+        self.assertEqual(first.one('id'), 0)
+        self.assertEqual(
+            [first.raw] + [record.raw for record in records],
+            JsonTestServer.records,
+        )
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import io
+import json
+from os import path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+# alcazar
+from alcazar.config import DEFAULT_CONFIG
+from alcazar.datastructures import GET
+from alcazar.exceptions import HttpError
+from alcazar.http import HttpClient
+from alcazar.http.cache import CachePurgeReport, DiskCache
+from alcazar.http.metrics import (
+    JsonLinesMetricsSink, MetricsAggregator, MultiMetricsSink, PrometheusMetricsSink, RequestMetrics,
+)
+from alcazar.http.pool import HostPoolStats
+from alcazar.scraper import Scraper
+
+# tests
+from .plumbing import AlcazarTestCase, ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class MetricsTestServer(object):
+
+    def page(self):
+        return {
+            'body': b'<html><body><p>hello</p></body></html>',
+            'headers': {'Content-Type': 'text/html; charset=UTF-8'},
+        }
+
+    def redirect(self):
+        return {
+            'body': b'',
+            'status': 302,
+            'headers': {'Location': '/page'},
+        }
+
+    def missing(self):
+        return {
+            'body': b'not here',
+            'status': 404,
+        }
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class MetricsTests(object):
+
+    __fixtures__ = [
+        [ServerFixture],
+    ]
+
+    new_server = MetricsTestServer
+
+    def setUp(self):
+        super(MetricsTests, self).setUp()
+        self.temp_dir = mkdtemp()
+        self.aggregator = MetricsAggregator()
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+        super(MetricsTests, self).tearDown()
+
+    config = DEFAULT_CONFIG._replace(courtesy_seconds=0)
+
+    def new_client(self, cache=None, metrics=None):
+        return HttpClient(
+            self.config,
+            cache=cache,
+            logger=None,
+            metrics=metrics or self.aggregator,
+        )
+
+    def test_network_request(self):
+        with self.new_client() as client:
+            response = client.submit(GET(self.server_url('/page')), self.config)
+            metrics = response.metrics
+        self.assertEqual(metrics.method, 'GET')
+        self.assertEqual(metrics.url, self.server_url('/page'))
+        self.assertEqual(metrics.status, 200)
+        self.assertEqual(metrics.cache, 'miss')
+        self.assertEqual(metrics.bytes_in, len(MetricsTestServer().page()['body']))
+        self.assertEqual(sorted(metrics.timings), ['cache_lookup', 'connect', 'download', 'ttfb'])
+        self.assertEqual(self.aggregator.num_requests, 1)
+        self.assertEqual(self.aggregator.bytes_in, metrics.bytes_in)
+
+    def test_redirects_are_summed_into_one_record(self):
+        with self.new_client() as client:
+            metrics = client.submit(GET(self.server_url('/redirect')), self.config).metrics
+        self.assertEqual(metrics.num_redirects, 1)
+        self.assertEqual(metrics.status, 200)
+        self.assertEqual(self.aggregator.num_requests, 1)
+        self.assertEqual(self.aggregator.summary()['ttfb'].count, 1)
+
+    def test_cache_hits_and_misses(self):
+        cache = DiskCache.build(self.temp_dir)
+        with self.new_client(cache=cache) as client:
+            for _ in range(2):
+                client.submit(GET(self.server_url('/page')), self.config)
+        self.assertEqual(self.aggregator.cache_counts, {'hit': 1, 'miss': 1})
+        summary = self.aggregator.summary()
+        self.assertEqual(summary['cache_lookup'].count, 2)
+        self.assertEqual(summary['ttfb'].count, 1)
+
+    def test_errors_are_recorded(self):
+        with self.new_client() as client:
+            with self.assertRaises(HttpError):
+                client.submit(GET(self.server_url('/missing')), self.config)
+        self.assertEqual(self.aggregator.num_errors, 1)
+        self.assertEqual(self.aggregator.status_counts, {404: 1})
+
+    def test_fetcher_adds_parse_timings(self):
+        scraper = Scraper(http_client=self.new_client())
+        try:
+            page = scraper.fetch(self.server_url('/page'), courtesy_seconds=0)
+        finally:
+            scraper.release_resources()
+        self.assertEqual(page('p').text, 'hello')
+        self.assertEqual(self.aggregator.num_requests, 1)
+        self.assertEqual(
+            sorted(self.aggregator.summary()),
+            ['cache_lookup', 'connect', 'decode', 'download', 'husk', 'parse', 'ttfb'],
+        )
+
+    def test_jsonl_and_prometheus_sinks(self):
+        jsonl_path = path.join(self.temp_dir, 'metrics.jsonl')
+        prom_path = path.join(self.temp_dir, 'metrics.prom')
+        sink = MultiMetricsSink(JsonLinesMetricsSink(jsonl_path), PrometheusMetricsSink(prom_path, write_interval=3600))
+        with self.new_client(metrics=sink) as client:
+            for _ in range(3):
+                client.submit(GET(self.server_url('/page')), self.config)
+        with io.open(jsonl_path, 'rt', encoding='UTF-8') as file_in:
+            records = [json.loads(line) for line in file_in]
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[0]['status'], 200)
+        self.assertIn('ttfb', records[0]['timings'])
+        with io.open(prom_path, 'rt', encoding='UTF-8') as file_in:
+            prom_lines = file_in.read().splitlines()
+        self.assertIn('alcazar_request_phase_seconds_count{phase="ttfb"} 3', prom_lines)
+        self.assertIn('alcazar_request_phase_seconds_bucket{phase="ttfb",le="+Inf"} 3', prom_lines)
+        self.assertIn('alcazar_requests_total{cache="miss"} 3', prom_lines)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class AggregatorTests(AlcazarTestCase):
+
+    def test_percentiles(self):
+        aggregator = MetricsAggregator()
+        for i in range(1, 101):
+            metrics = RequestMetrics()
+            metrics.add_time('ttfb', i / 100)
+            metrics.attempt = 1 if i % 10 == 0 else 0
+            aggregator.record(metrics)
+        summary = aggregator.summary()['ttfb']
+        self.assertEqual(summary.count, 100)
+        self.assertEqual(summary.p50, 0.5)
+        self.assertEqual(summary.p90, 0.9)
+        self.assertEqual(summary.p99, 0.99)
+        self.assertEqual(summary.max, 1.0)
+        self.assertEqual(aggregator.percentile('ttfb', 25), 0.25)
+        self.assertEqual(aggregator.percentile('parse', 50), None)
+        self.assertEqual(aggregator.num_retries, 10)
+
+    def test_pool_stats_and_cache_purges(self):
+        aggregator = MetricsAggregator()
+        sink = MultiMetricsSink(aggregator)
+        sink.record_pool_stats({'a:80': HostPoolStats(num_requests=3, num_new_connections=1)})
+        sink.record_pool_stats({'a:80': HostPoolStats(num_requests=1, num_new_connections=1)})
+        sink.record_cache_purge(CachePurgeReport(
+            num_entries_scanned=5,
+            num_entries_removed=2,
+            num_bytes_freed=100,
+            completed=True,
+        ))
+        self.assertEqual(aggregator.pool_stats, {'a:80': HostPoolStats(num_requests=4, num_new_connections=2)})
+        self.assertEqual(aggregator.format_summary().split('\n')[1:], [
+            '[pool] a:80: 4 requests, 2 new connections, 50% reused',
+            '[cache] purge done: removed 2 of 5 entries scanned, freed 100 bytes',
+        ])
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
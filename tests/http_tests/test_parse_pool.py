@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from os import getpid
+
+# alcazar
+from alcazar.backoff import ExponentialBackoff
+from alcazar.crawler import Crawler
+from alcazar.exceptions import ScraperError, SkipThisPage
+from alcazar.http import HttpClient
+from alcazar.parse_pool import query_from_spec, query_to_spec
+
+# tests
+from .plumbing import AlcazarTestCase, ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ParsePoolTestServer(object):
+
+    def page(self, n):
+        n = int(n)
+        links = ''.join(
+            '<a href="/page?n=%d">%d</a>' % (child, child)
+            for child in (2 * n + 1, 2 * n + 2)
+            if child < 7
+        )
+        return {
+            'body': ('<html><body><p>%d</p>%s</body></html>' % (n, links)).encode('ascii'),
+            'headers': {'Content-Type': 'text/html; charset=UTF-8'},
+        }
+
+
+class TreeCrawler(Crawler):
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('courtesy_seconds', 0)
+        kwargs.setdefault('http_client', HttpClient(logger=None, cache=None))
+        kwargs.setdefault('backoff_policy', ExponentialBackoff(initial=0))
+        super(TreeCrawler, self).__init__(**kwargs)
+
+    def parse(self, page):
+        n = page('p').str
+        if n == '3' and page.query.attempt == 0:
+            raise ScraperError('try again')
+        if n == '6':
+            raise SkipThisPage('not wanted')
+        for link in page.selection('//a'):
+            self.enqueue(link.attrib('href').str, base=page)
+        return (n, page.query.depth, page.query.attempt, getpid())
+
+    def record_payload(self, page, payload):
+        assert page.husker is None or self.num_parse_processes == 0, page
+        return payload
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ParsePoolTests(object):
+
+    __fixtures__ = [
+        [ServerFixture],
+    ]
+
+    new_server = ParsePoolTestServer
+
+    def crawl(self, **kwargs):
+        crawler = TreeCrawler(**kwargs)
+        try:
+            crawler.enqueue(self.server_url('/page?n=0'))
+            return sorted(crawler.crawl_iter())
+        finally:
+            crawler.release_resources()
+
+    def test_parse_pool_gives_same_payloads(self):
+        in_process = self.crawl()
+        in_pool = self.crawl(num_parse_processes=2)
+        self.assertEqual(
+            [(n, depth, attempt) for n, depth, attempt, _ in in_pool],
+            [('0', 0, 0), ('1', 1, 0), ('2', 1, 0), ('3', 1, 1), ('4', 1, 0), ('5', 1, 0)],
+        )
+        self.assertEqual(
+            [payload[:3] for payload in in_process],
+            [payload[:3] for payload in in_pool],
+        )
+        self.assertEqual({pid for _, _, _, pid in in_process}, {getpid()})
+        self.assertNotIn(getpid(), {pid for _, _, _, pid in in_pool})
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class QuerySpecTests(AlcazarTestCase):
+
+    def test_bound_methods_are_sent_by_name(self):
+        crawler = TreeCrawler()
+        other_crawler = TreeCrawler()
+        handle_error = lambda query, error, attempt_i: None
+        query = crawler.query('http://example.com/', extras={'a': 1}, handle_error=handle_error)
+        spec = query_to_spec(crawler, query)
+        self.assertEqual(spec[1]['parse'], 'parse')
+        self.assertIs(spec[1]['handle_error'], handle_error)
+        copy = query_from_spec(other_crawler, spec)
+        self.assertEqual(copy.methods.parse, other_crawler.parse)
+        self.assertIs(copy.methods.handle_error, handle_error)
+        self.assertEqual(copy.url, 'http://example.com/')
+        self.assertEqual(copy.extras, {'a': 1})
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
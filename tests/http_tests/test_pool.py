@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+import socket
+
+# alcazar
+from alcazar import HttpClient
+from alcazar.config import DEFAULT_CONFIG
+from alcazar.http.metrics import NullMetricsSink
+from alcazar.http.pool import HostPoolStats
+
+# tests
+from .plumbing import GetReq, ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class KeepAliveTestServer(object):
+
+    # HTTP/1.1, so that the server keeps connections open. The timeout is how long the server waits for the next request on an
+    # open connection, which also bounds how long it takes to shut down the server at the end of each test.
+    request_handler_attributes = {
+        'protocol_version': 'HTTP/1.1',
+        'timeout': 0.5,
+    }
+
+    def hello(self):
+        return {
+            'body': b'hello',
+            'headers': {'Content-Length': '5'},
+        }
+
+
+class RecordingMetricsSink(NullMetricsSink):
+
+    def __init__(self):
+        self.reported = []
+
+    def record_pool_stats(self, stats):
+        self.reported.append(stats)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ConnectionPoolTests(object):
+
+    __fixtures__ = [
+        [ServerFixture],
+        [GetReq],
+    ]
+
+    new_server = KeepAliveTestServer
+
+    def setUp(self):
+        super(ConnectionPoolTests, self).setUp()
+        self.metrics = RecordingMetricsSink()
+        self.client = None
+
+    def tearDown(self):
+        if self.client is not None:
+            self.client.close()
+        super(ConnectionPoolTests, self).tearDown()
+
+    def new_client(self, **kwargs):
+        self.client = HttpClient(
+            DEFAULT_CONFIG._replace(courtesy_seconds=0),
+            cache=None,
+            logger=None,
+            metrics=self.metrics,
+            **kwargs
+        )
+        return self.client
+
+    @property
+    def host(self):
+        return 'localhost:%d' % self.port
+
+    def test_connections_are_reused(self):
+        self.new_client()
+        for _ in range(3):
+            self.assertEqual(self.fetch('/hello', courtesy_seconds=0).text, 'hello')
+        self.assertEqual(self.client.pool_stats, {self.host: HostPoolStats(num_requests=3, num_new_connections=1)})
+        self.assertAlmostEqual(self.client.pool_stats[self.host].reuse_ratio, 2/3)
+
+    def test_idle_connections_are_not_reused(self):
+        self.new_client(pool_idle_timeout=0)
+        for _ in range(2):
+            self.assertEqual(self.fetch('/hello', courtesy_seconds=0).text, 'hello')
+        self.assertEqual(self.client.pool_stats, {self.host: HostPoolStats(num_requests=2, num_new_connections=2)})
+
+    def test_stats_are_reported_on_close(self):
+        self.new_client()
+        self.fetch('/hello', courtesy_seconds=0)
+        self.client.close()
+        self.client = None
+        self.assertEqual(self.metrics.reported, [{self.host: HostPoolStats(num_requests=1, num_new_connections=1)}])
+
+    def test_pool_options(self):
+        client = self.new_client(max_pools=3, pool_size=5, pool_block=True, tcp_keep_alive=True)
+        poolmanager = client.session.get_adapter('http://').poolmanager
+        self.assertEqual(poolmanager.pools._maxsize, 3)
+        self.assertEqual(poolmanager.connection_pool_kw['maxsize'], 5)
+        self.assertEqual(poolmanager.connection_pool_kw['block'], True)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), poolmanager.connection_pool_kw['socket_options'])
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
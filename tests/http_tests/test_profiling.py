@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from os import listdir
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import skipIf
+
+# alcazar
+from alcazar.crawler import Crawler
+from alcazar.exceptions import ScraperError
+from alcazar.http import HttpClient
+from alcazar.profiling import CProfileSampler, StageTimer, TracemallocSampler, tracemalloc
+
+# tests
+from .plumbing import ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ProfilingTestServer(object):
+
+    def page(self, n='0'):
+        return {
+            'body': ('<html><body><p>%s</p></body></html>' % n).encode('ascii'),
+            'headers': {'Content-Type': 'text/html; charset=UTF-8'},
+        }
+
+
+class ProfiledCrawler(Crawler):
+
+    id = 'profiled'
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('courtesy_seconds', 0)
+        kwargs.setdefault('http_client', HttpClient(logger=None, cache=None))
+        super(ProfiledCrawler, self).__init__(**kwargs)
+        self.num_failures = 0
+
+    def parse(self, page):
+        if page('p').text == '1' and self.num_failures == 0:
+            self.num_failures += 1
+            raise ScraperError('try again')
+        return [page('p').text] * 1000
+
+    def handle_error(self, query, error, attempt_i):
+        return 0 # retry straight away
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ProfilingTests(object):
+
+    __fixtures__ = [
+        [ServerFixture],
+    ]
+
+    new_server = ProfilingTestServer
+
+    def crawl(self, *hooks):
+        crawler = ProfiledCrawler(profiling_hooks=hooks)
+        try:
+            crawler.enqueue_many(self.server_url('/page?n=%d' % n) for n in range(4))
+            return list(crawler.crawl_iter())
+        finally:
+            crawler.release_resources()
+
+    def test_stage_timer(self):
+        timer = StageTimer()
+        with self.assertLogs(level='INFO') as logs:
+            payloads = self.crawl(timer)
+        self.assertEqual(len(payloads), 4)
+        stats = timer.stats('profiled')
+        self.assertEqual(
+            {stage: stage_stats.count for stage, stage_stats in stats.items()},
+            {
+                'fetch': 5,
+                'decode': 5,
+                'parse': 5,
+                'husk': 5,
+                'parse_callback': 5,
+                'handle_error': 1,
+                'record_payload': 4,
+            },
+        )
+        self.assertGreaterEqual(stats['fetch'].wall_seconds, stats['parse'].wall_seconds)
+        self.assertEqual(timer.stats('someone_else'), {})
+        self.assertTrue(any(line.startswith('INFO:root:[profile] profiled') for line in logs.output))
+
+    def test_cprofile_sampler(self):
+        sampler = CProfileSampler(sample_every=2, stages=('parse_callback',))
+        self.crawl(sampler)
+        stats = sampler.stats('profiled', 'parse_callback')
+        self.assertIsNotNone(stats)
+        self.assertEqual(
+            sum(
+                num_calls
+                for (file_path, _, function_name), (_, num_calls, _, _, _) in stats.stats.items()
+                if function_name == 'parse' and file_path.endswith('test_profiling.py')
+            ),
+            3,
+        )
+        self.assertIsNone(sampler.stats('profiled', 'fetch'))
+        temp_dir = mkdtemp()
+        try:
+            sampler.dump_stats(temp_dir)
+            self.assertEqual(listdir(temp_dir), ['profiled.parse_callback.prof'])
+        finally:
+            rmtree(temp_dir)
+
+    @skipIf(tracemalloc is NotImplemented, "tracemalloc not available")
+    def test_tracemalloc_sampler(self):
+        was_tracing = tracemalloc.is_tracing()
+        sampler = TracemallocSampler(sample_every=1, stages=('parse_callback',))
+        try:
+            self.crawl(sampler)
+        finally:
+            if not was_tracing:
+                tracemalloc.stop()
+        top_allocations = sampler.top_allocations('profiled', 'parse_callback')
+        self.assertTrue(top_allocations)
+        self.assertEqual(sampler.top_allocations('profiled', 'fetch'), [])
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
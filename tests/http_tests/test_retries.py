@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from sys import exc_info
+from time import time
+from traceback import extract_tb
+
+# alcazar
+from alcazar.backoff import CircuitBreaker, ExponentialBackoff, NoRetry, PerErrorClassBackoff
+from alcazar.crawler import Crawler
+from alcazar.exceptions import HttpError, ScraperError
+from alcazar.http import HttpClient
+from alcazar.scraper import Scraper
+
+# tests
+from .plumbing import AlcazarTestCase, ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class RetriesTestServer(object):
+
+    def __init__(self):
+        self.num_requests = {}
+
+    def _count(self, name):
+        self.num_requests[name] = self.num_requests.get(name, 0) + 1
+        return self.num_requests[name]
+
+    def ok(self, n='0'):
+        self._count('ok')
+        return ('ok %s' % n).encode('ascii')
+
+    def flaky(self):
+        if self._count('flaky') <= 2:
+            return {'body': b'', 'status': 503}
+        return b'flaky ok'
+
+    def broken(self):
+        self._count('broken')
+        return {'body': b'', 'status': 500}
+
+    def missing(self):
+        self._count('missing')
+        return {'body': b'', 'status': 404}
+
+
+class RecordingCrawler(Crawler):
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('courtesy_seconds', 0)
+        kwargs.setdefault('http_client', HttpClient(logger=None, cache=None))
+        super(RecordingCrawler, self).__init__(**kwargs)
+        self.sleeps = []
+
+    def parse(self, page):
+        return page.text
+
+    def record_error(self, query, error):
+        return 'failed'
+
+    def _sleep(self, delay):
+        self.sleeps.append(delay)
+        super(RecordingCrawler, self)._sleep(delay)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class RetriesTests(object):
+
+    __fixtures__ = [
+        [ServerFixture],
+    ]
+
+    new_server = RetriesTestServer
+
+    def crawl(self, paths, **kwargs):
+        crawler = RecordingCrawler(**kwargs)
+        try:
+            crawler.enqueue_many(self.server_url(path) for path in paths)
+            return crawler, list(crawler.crawl_iter())
+        finally:
+            crawler.release_resources()
+
+    def test_crawler_keeps_going_during_backoff(self):
+        crawler, payloads = self.crawl(
+            ['/flaky', '/ok?n=1', '/ok?n=2'],
+            backoff_policy=ExponentialBackoff(initial=0.1, multiplier=1),
+        )
+        # NB the other queries went through while /flaky was waiting to be re-attempted
+        self.assertEqual(payloads, ['ok 1', 'ok 2', 'flaky ok'])
+        self.assertEqual(self.handler.num_requests['flaky'], 3)
+        self.assertEqual(len(crawler.sleeps), 2)
+        self.assertTrue(all(0 < delay <= 0.1 for delay in crawler.sleeps))
+
+    def test_per_error_class_policy(self):
+        _, payloads = self.crawl(
+            ['/missing', '/flaky'],
+            backoff_policy=PerErrorClassBackoff(
+                [(HttpError.Http404, None)],
+                default=ExponentialBackoff(initial=0),
+            ),
+        )
+        self.assertEqual(payloads, ['failed', 'flaky ok'])
+        self.assertEqual(self.handler.num_requests['missing'], 1)
+
+    def test_circuit_breaker_pauses_host(self):
+        circuit_breaker = CircuitBreaker(max_consecutive_failures=2, pause_seconds=0.2)
+        time_before = time()
+        crawler, payloads = self.crawl(
+            ['/broken', '/broken', '/ok'],
+            backoff_policy=NoRetry(),
+            circuit_breaker=circuit_breaker,
+        )
+        # NB the host was paused after the second failure, so /ok had to wait
+        self.assertEqual(payloads, ['failed', 'failed', 'ok 0'])
+        self.assertEqual(len(crawler.sleeps), 1)
+        self.assertGreaterEqual(time() - time_before, 0.2)
+        self.assertIsNone(circuit_breaker.paused_until(self.server_url('/ok')))
+
+    def test_scrape_waits_inline(self):
+        scraper = Scraper(
+            http_client=HttpClient(logger=None, cache=None),
+            courtesy_seconds=0,
+            backoff_policy=ExponentialBackoff(initial=0.05, multiplier=2),
+        )
+        try:
+            time_before = time()
+            page = scraper.scrape(self.server_url('/flaky'))
+        finally:
+            scraper.release_resources()
+        self.assertEqual(page.text, 'flaky ok')
+        self.assertGreaterEqual(time() - time_before, 0.15)
+
+    def test_handle_error_override_returning_none_gets_backoff(self):
+        class LegacyCrawler(RecordingCrawler):
+            handled = []
+            def handle_error(self, query, error, attempt_i):
+                self.handled.append(attempt_i)
+        crawler = LegacyCrawler(backoff_policy=ExponentialBackoff(initial=0.05, multiplier=1))
+        try:
+            crawler.enqueue(self.server_url('/flaky'))
+            self.assertEqual(list(crawler.crawl_iter()), ['flaky ok'])
+        finally:
+            crawler.release_resources()
+        self.assertEqual(crawler.handled, [0, 1])
+        self.assertEqual(len(crawler.sleeps), 2)
+        self.assertTrue(all(0 < delay <= 0.05 for delay in crawler.sleeps))
+
+    def test_final_error_keeps_its_traceback(self):
+        def parse(page):
+            raise ScraperError('unparseable')
+        scraper = Scraper(http_client=HttpClient(logger=None, cache=None), courtesy_seconds=0, backoff_policy=NoRetry())
+        try:
+            scraper.scrape(self.server_url('/ok'), parse=parse, record_error=lambda query, error: None)
+        except ScraperError:
+            self.assertEqual(extract_tb(exc_info()[2])[-1][2], 'parse')
+        else:
+            self.fail("No error raised")
+        finally:
+            scraper.release_resources()
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class BackoffPolicyTests(AlcazarTestCase):
+
+    def test_exponential_backoff(self):
+        error = ScraperError()
+        self.assertEqual([ExponentialBackoff().delay(error, i) for i in range(4)], [1, 5, 25, 125])
+        capped = ExponentialBackoff(initial=2, multiplier=2, max_delay=10)
+        self.assertEqual([capped.delay(error, i) for i in range(5)], [2, 4, 8, 10, 10])
+        jittered = ExponentialBackoff(initial=10, multiplier=1, jitter=0.5)
+        for _ in range(100):
+            self.assertTrue(5 <= jittered.delay(error, 0) <= 10)
+
+    def test_per_error_class_backoff(self):
+        policy = PerErrorClassBackoff([
+            (HttpError.Http404, None),
+            (HttpError.Http429, ExponentialBackoff(initial=30, multiplier=2)),
+        ])
+        self.assertIsNone(policy.delay(HttpError.Http404(), 0))
+        self.assertEqual(policy.delay(HttpError.Http429(), 1), 60)
+        self.assertEqual(policy.delay(HttpError.Http500(), 1), 5)
+
+    def test_circuit_breaker_is_half_open_after_pause(self):
+        circuit_breaker = CircuitBreaker(max_consecutive_failures=3, pause_seconds=0)
+        url = 'http://example.com/'
+        for _ in range(2):
+            circuit_breaker.record_failure(url)
+        circuit_breaker.record_success(url)
+        for _ in range(2):
+            circuit_breaker.record_failure(url)
+        self.assertEqual(circuit_breaker._num_failures, {'example.com': 2})
+        circuit_breaker.record_failure(url)
+        self.assertEqual(circuit_breaker._num_failures, {'example.com': 2})
+        self.assertIn('example.com', circuit_breaker._paused_until)
+        self.assertTrue(circuit_breaker.is_failure(HttpError.Http503()))
+        self.assertTrue(circuit_breaker.is_failure(HttpError('connection refused')))
+        self.assertFalse(circuit_breaker.is_failure(HttpError.Http404()))
+        self.assertFalse(circuit_breaker.is_failure(ScraperError()))
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from os import getpid, path
+from shutil import rmtree
+from tempfile import mkdtemp
+
+# alcazar
+from alcazar.crawler import Crawler
+from alcazar.http import HttpClient
+from alcazar.sharding import ShardedCrawl, SqliteBroker, shard_for_url
+from alcazar.utils.compatibility import urlparse
+
+# tests
+from .plumbing import AlcazarTestCase, ServerFixture, compile_test_case_classes
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+# Both names reach the test server, and they hash to different shards
+HOSTS = ('localhost', '127.0.0.1')
+
+NUM_PAGES = 15
+
+
+class ShardingTestServer(object):
+
+    def page(self, n):
+        return {
+            'body': ('<html><body><p>%s</p></body></html>' % n).encode('ascii'),
+            'headers': {'Content-Type': 'text/html; charset=UTF-8'},
+        }
+
+
+class ShardCrawler(Crawler):
+
+    def __init__(self, output_path, **kwargs):
+        kwargs.setdefault('courtesy_seconds', 0)
+        kwargs.setdefault('http_client', HttpClient(logger=None, cache=None))
+        super(ShardCrawler, self).__init__(**kwargs)
+        self.output_path = output_path
+
+    def parse(self, page):
+        n = int(page('p').str)
+        port = urlparse(page.url).port
+        for child in (2 * n + 1, 2 * n + 2):
+            if child < NUM_PAGES:
+                self.enqueue('http://%s:%d/page?n=%d' % (HOSTS[child % 2], port, child))
+        return n
+
+    def record_payload(self, page, payload):
+        with open(self.output_path, 'a') as file_out:
+            file_out.write('%d %s %d\n' % (payload, urlparse(page.url).hostname, getpid()))
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ShardingTests(object):
+
+    __fixtures__ = [
+        [ServerFixture],
+    ]
+
+    new_server = ShardingTestServer
+
+    def setUp(self):
+        super(ShardingTests, self).setUp()
+        self.temp_dir = mkdtemp()
+
+    def tearDown(self):
+        rmtree(self.temp_dir)
+        super(ShardingTests, self).tearDown()
+
+    def test_sharded_crawl(self):
+        output_path = path.join(self.temp_dir, 'payloads.txt')
+        broker_path = path.join(self.temp_dir, 'frontier.sqlite')
+        crawl = ShardedCrawl(
+            ShardCrawler,
+            num_shards=2,
+            broker_path=broker_path,
+            crawler_kwargs={'output_path': output_path},
+            poll_seconds=0.05,
+        )
+        crawl.enqueue(self.server_url('/page?n=0'))
+        crawl.run()
+        with open(output_path) as file_in:
+            lines = [line.split() for line in file_in]
+        self.assertEqual(sorted(int(n) for n, _, _ in lines), list(range(NUM_PAGES)))
+        pids_by_host = {}
+        for _, host, pid in lines:
+            pids_by_host.setdefault(host, set()).add(int(pid))
+        # NB each host was crawled by one process, and not this one
+        self.assertEqual(sorted(pids_by_host), sorted(HOSTS))
+        self.assertTrue(all(len(pids) == 1 for pids in pids_by_host.values()))
+        self.assertEqual(len(set.union(*pids_by_host.values())), 2)
+        self.assertNotIn(getpid(), set.union(*pids_by_host.values()))
+        self.assertEqual(SqliteBroker(broker_path).count(), 0)
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ShardingUnitTests(AlcazarTestCase):
+
+    def test_shard_for_url(self):
+        self.assertEqual(
+            {shard_for_url('http://example.com/%d' % i, 7) for i in range(10)},
+            {shard_for_url('http://example.com/', 7)},
+        )
+        self.assertNotEqual(shard_for_url('http://localhost/', 2), shard_for_url('http://127.0.0.1/', 2))
+
+    def test_shards_get_their_own_cache(self):
+        crawl = ShardedCrawl(ShardCrawler, 3, ':memory:', crawler_kwargs={'cache_root_path': '/tmp/cache', 'id': 'x'})
+        self.assertEqual(crawl.shard_crawler_kwargs(2), {'cache_root_path': path.join('/tmp/cache', 'shard-2'), 'id': 'x'})
+        self.assertEqual(crawl.crawler_kwargs['cache_root_path'], '/tmp/cache')
+
+    def test_shards_share_a_read_only_cache(self):
+        kwargs = {'cache_root_path': '/tmp/cache', 'cache_read_only': True}
+        crawl = ShardedCrawl(ShardCrawler, 3, ':memory:', crawler_kwargs=kwargs)
+        self.assertEqual(crawl.shard_crawler_kwargs(2), kwargs)
+
+    def test_broker_knows_when_the_crawl_is_over(self):
+        broker = SqliteBroker(':memory:')
+        broker.reset_shards(2)
+        broker.push_many([(1, b'query')])
+        self.assertIsNone(broker.poll_idle(0))
+        self.assertFalse(broker.poll_idle(1))
+        self.assertEqual(broker.pop(1), b'query')
+        self.assertIsNone(broker.pop(1))
+        self.assertTrue(broker.poll_idle(1))
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+compile_test_case_classes(globals())
+
+#----------------------------------------------------------------------------------------------------------------------------------
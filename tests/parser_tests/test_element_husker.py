@@ -13,7 +13,9 @@ from decimal import Decimal
 import re
 
 # alcazar
-from alcazar.husker import ElementHusker, HuskerMismatch, HuskerMultipleSpecMatch, HuskerNotUnique, HuskerValueError
+from alcazar.husker import (
+    ElementHusker, HuskerMismatch, HuskerMultipleSpecMatch, HuskerNotUnique, HuskerValueError, JmesPathHusker,
+)
 from alcazar.utils.compatibility import PY2, text_type
 
 # tests
@@ -238,6 +240,34 @@ class ComprehensiveTest(HtmlHuskerTest, AlcazarTest):
         with self.assertRaises(HuskerNotUnique):
             root = self.husker.some('p')
 
+    def test_not_unique_error_reports_full_count(self):
+        with self.assertRaises(HuskerNotUnique) as raised:
+            self.husker.one('p')
+        self.assertIn(
+            'found %d' % len(self.husker.selection('p')),
+            text_type(raised.exception),
+        )
+
+    def test_limited_selection_matches_full_selection(self):
+        section = self.husker.one('section#discourse')
+        for root, path in (
+                (self.husker, 'p'),
+                (self.husker, '//p'),
+                (self.husker, './/p'),
+                (self.husker, 'p.discourse'),
+                (self.husker, '//p/@id'),
+                (self.husker, '//section[@id]/p/text()'),
+                (self.husker, 'html'),
+                (section, 'p'),
+                (section, './p'),
+                (section, 'missing'),
+                (self.husker, 'section p'),
+                ):
+            full = root.selection(path)
+            self.assertEqual(root.selection(path, limit=1), full[:1])
+            self.assertEqual(root.selection(path, limit=2), full[:2])
+            self.assertEqual(root.any(path), full[0] if full else None)
+
 
     def test_first_match(self):
         root = self.husker.first('section#discourse p')
@@ -1141,3 +1171,53 @@ class PreTagHandlingTest(AlcazarTest):
     # TODO: tail text on a pre tag is not pre-formatted
 
 #----------------------------------------------------------------------------------------------------------------------------------
+
+class JsAssignmentsTest(AlcazarTest):
+
+    @with_inline_html('''
+        <html><head>
+            <script>
+                var answer = 42, message = "a = b; c = 'd'", unrelated = compute();
+                // state = {"commented": true};
+                window.__INITIAL_STATE__ = {
+                    user: {name: 'Ada', tags: ['x', 'y',]},
+                    html: "<b>{[</b>",
+                };
+            </script>
+            <script src="/ignored.js"></script>
+            <script>
+                window["__CONFIG__"] = JSON.parse('{"debug": false}');
+                App.settings = [1, 2, 3].map(double);
+                App.settings = [1, 2, 3];
+                answer = 43;
+            </script>
+        </head><body></body></html>
+    ''')
+    def test_js_var(self):
+        husker = ElementHusker(self.html, is_full_document=True)
+        self.assertEqual(husker.js_var('answer').raw, 42)
+        self.assertEqual(husker.js_var('message').raw, "a = b; c = 'd'")
+        self.assertEqual(husker.js_var('__INITIAL_STATE__').one('user.name'), 'Ada')
+        self.assertEqual(husker.js_var('__INITIAL_STATE__').one('html'), '<b>{[</b>')
+        self.assertEqual(husker.js_var('__CONFIG__').raw, {'debug': False})
+        self.assertEqual(husker.js_var('App.settings').raw, [1, 2, 3])
+        with self.assertRaises(HuskerMismatch):
+            husker.js_var('state')
+        with self.assertRaises(HuskerMismatch):
+            husker.js_var('unrelated')
+        self.assertIsNone(husker.js_var('unrelated', None))
+
+    @with_inline_html('''
+        <div>
+            <script>var a = 1; b = {c: 'd'}; e = new Date(); f = {g: function () {}};</script>
+        </div>
+    ''')
+    def test_js_assignments(self):
+        husker = ElementHusker(self.html)
+        self.assertEqual(
+            [(name, value.raw) for name, value in husker.js_assignments()],
+            [('a', 1), ('b', {'c': 'd'})],
+        )
+        self.assertIsInstance(husker.js_var('b'), JmesPathHusker)
+
+#----------------------------------------------------------------------------------------------------------------------------------
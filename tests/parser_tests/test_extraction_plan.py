@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#----------------------------------------------------------------------------------------------------------------------------------
+# includes
+
+# 2+3 compat
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# standards
+from decimal import Decimal
+
+# alcazar
+from alcazar.husker import (
+    ElementHusker, ExtractionPlan, Field, HuskerMismatch, HuskerNotUnique, JmesPathHusker, Scope, TextHusker,
+)
+
+# tests
+from .plumbing import AlcazarTest, HtmlFixture
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class ElementExtractionPlanTest(HtmlFixture, AlcazarTest):
+
+    fixture_file = 'comprehensive.html'
+    fixture_encoding = 'UTF-8'
+
+    def setUp(self):
+        super(ElementExtractionPlanTest, self).setUp()
+        self.husker = ElementHusker(self.html, is_full_document=True)
+
+    def test_plain_path_returns_husker(self):
+        extracted = ExtractionPlan({'title': '/html/head/title'}).extract(self.husker)
+        self.assertIsInstance(extracted['title'], ElementHusker)
+        self.assertEqual(extracted['title'].text, 'Comprehensive Test')
+
+    def test_field_conversions(self):
+        extracted = ExtractionPlan({
+            'int': Field('p#int', then='int'),
+            'float': Field('p#float', then='text.str'),
+            'upper': Field('p#one', then='text.upper()'),
+            'callable': Field('p#one', then=lambda p: p.attrib('num').int),
+            'all': Field('p.discourse', select='all', then='str'),
+        }).extract(self.husker)
+        self.assertEqual(extracted, {
+            'int': 24,
+            'float': '2.4',
+            'upper': 'IT BEGINS.',
+            'callable': 1,
+            'all': ['It begins.', 'It runs.', 'It ends.'],
+        })
+
+    def test_scopes(self):
+        extracted = ExtractionPlan({
+            'discourse': Scope('section#discourse', {
+                'first': Field('p', select='first', then='str'),
+                'last': Field('p', select='last', then='str'),
+                'missing': Field('p#missing', select='some', then='str'),
+            }),
+            'missing': Scope('section#missing', select='some', fields={
+                'p': Field('p', then='text.normalized'),
+            }),
+        }).extract(self.husker)
+        self.assertEqual(extracted, {
+            'discourse': {
+                'first': 'It begins.',
+                'last': 'It ends.',
+                'missing': None,
+            },
+            'missing': {
+                'p': None,
+            },
+        })
+
+    def test_mismatch_is_raised(self):
+        plan = ExtractionPlan({'missing': 'p#missing'})
+        with self.assertRaises(HuskerMismatch):
+            plan.extract(self.husker)
+
+    def test_not_unique_is_raised(self):
+        plan = ExtractionPlan({'p': 'p.discourse'})
+        with self.assertRaises(HuskerNotUnique):
+            plan.extract(self.husker)
+
+    def test_identical_selections_are_run_once(self):
+        selections = []
+        class CountingHusker(ElementHusker):
+            def one(self, *spec):
+                selections.append(spec)
+                return super(CountingHusker, self).one(*spec)
+        ExtractionPlan({
+            'int': Field('p#int', then='int'),
+            'value': Field('p#int', then=lambda p: p.attrib('value').int),
+        }).extract(CountingHusker(self.html, is_full_document=True))
+        self.assertEqual(selections, [('p#int',)])
+
+    def test_invalid_specs(self):
+        with self.assertRaises(ValueError):
+            ExtractionPlan({'x': Field('p', select='every')})
+        with self.assertRaises(ValueError):
+            ExtractionPlan({'x': Field('p', then='text..str')})
+        with self.assertRaises(ValueError):
+            ExtractionPlan({'x': 42})
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class JmesPathExtractionPlanTest(AlcazarTest):
+
+    def test_jmespath_document(self):
+        husker = JmesPathHusker({
+            'product': {'name': 'Widget', 'price': '9.99', 'tags': ['a', 'b']},
+        })
+        extracted = ExtractionPlan({
+            'product': Scope('product', {
+                'name': 'name',
+                'price': Field('price', then='decimal'),
+                'tags': Field('tags[]', select='all', then='raw'),
+            }),
+        }).extract(husker)
+        self.assertIsInstance(extracted['product']['name'], TextHusker)
+        self.assertEqual(extracted['product']['name'], 'Widget')
+        self.assertEqual(extracted['product']['price'], Decimal('9.99'))
+        self.assertEqual(extracted['product']['tags'], ['a', 'b'])
+
+#----------------------------------------------------------------------------------------------------------------------------------
@@ -13,6 +13,7 @@ from os import path
 
 # alcazar
 from alcazar.husker import HuskerNotUnique, HuskerValueError, JmesPathHusker, ListHusker, ScalarHusker, TextHusker
+from alcazar.husker.jmespath import _husk
 
 # tests
 from .plumbing import AlcazarTest
@@ -246,6 +247,44 @@ class ComprehensiveJmesPathTests(JmesPathHuskerTest):
         self.assertIsInstance(result, ListHusker)
         self.assertEqual(sorted(result.raw), [1, 2, 3])
 
+    ### fast path for plain lookups
+
+    def test_lookup_fast_path_matches_tree_interpreter(self):
+        for path in (
+                'int',
+                'string.length',
+                'missing',
+                'missing.deeper',
+                'list_of_ints[0]',
+                'list_of_ints[-1]',
+                'list_of_ints[7]',
+                'list_of_ints.key',
+                'string[0]',
+                'list_of_lists_of_ints[1][2]',
+                'list_of_dicts_of_ints[1].b',
+                'list_of_dicts_of_lists_of_ints.one.a[2]',
+                '"list_of_ints"[1]',
+                '@.int',
+                ):
+            lookup_steps, parsed = JmesPathHusker._compile_expression(path)
+            self.assertIsNotNone(lookup_steps, path)
+            self.assertEqual(
+                (path, self.husker.selection(path)),
+                (path, _husk([JmesPathHusker.visitor.visit(parsed, self.data)])),
+            )
+
+    def test_lookup_fast_path_not_used_for_projections(self):
+        for path in ('list_of_ints[*]', 'list_of_ints[:2]', 'dict_of_ints | keys(@)', 'list_of_dicts_of_ints[?a]'):
+            lookup_steps, _ = JmesPathHusker._compile_expression(path)
+            self.assertIsNone(lookup_steps, path)
+
+    def test_expressions_are_cached(self):
+        JmesPathHusker.expression_cache.clear()
+        self.husker.one('int')
+        self.husker.one('int')
+        self.husker.all('list_of_ints[*]')
+        self.assertEqual(len(JmesPathHusker.expression_cache), 2)
+
     # def test_simple_string_funny_chars(self):
     #     self.assertEqual(
     #         self.husker.one("`funny chars in key: '\\\"\\`!#$%^&*()_=-+[{}];:\\|/?,<>.`"),
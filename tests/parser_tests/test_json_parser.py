@@ -7,12 +7,182 @@
 # 2+3 compat
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+# standards
+import json
+
+# alcazar
+from alcazar.utils import jsonutils
+from alcazar.utils.jsonutils import iter_json_array, lenient_json_loads, pick_json_decoder
+
+# tests
+from .plumbing import AlcazarTest
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class JsonDecoderTests(AlcazarTest):
+
+    def test_default_decoder_parses_bytes(self):
+        self.assertEqual(
+            pick_json_decoder()('{"a": [1, 2.5, "é"]}'.encode('UTF-8')),
+            {'a': [1, 2.5, 'é']},
+        )
+
+    def test_default_decoder_is_as_lenient_as_stdlib(self):
+        self.assertEqual(
+            repr(pick_json_decoder()(b'[1, NaN, -Infinity]')),
+            repr(json.loads('[1, NaN, -Infinity]')),
+        )
+
+    def test_default_decoder_keeps_big_integers_exact(self):
+        self.assertEqual(
+            pick_json_decoder()(b'[18446744073709551616, -9223372036854775809]'),
+            [18446744073709551616, -9223372036854775809],
+        )
+
+    def test_stdlib_decoder_by_name(self):
+        self.assertIs(pick_json_decoder('json'), json.loads)
+
+    def test_callable_decoder(self):
+        loads = lambda data: 'custom'
+        self.assertIs(pick_json_decoder(loads), loads)
+
+    def test_unknown_decoder(self):
+        with self.assertRaises(ValueError):
+            pick_json_decoder('yaml')
+
+    def _with_accelerators(self, accelerators, test):
+        saved = dict(jsonutils.JSON_DECODERS)
+        jsonutils.JSON_DECODERS.update(accelerators)
+        try:
+            test()
+        finally:
+            jsonutils.JSON_DECODERS.update(saved)
+
+    def test_missing_accelerators_fall_back_to_stdlib(self):
+        def test():
+            for decoder in ('auto', 'orjson', 'ujson'):
+                self.assertIs(pick_json_decoder(decoder), json.loads)
+        self._with_accelerators({'orjson': NotImplemented, 'ujson': NotImplemented}, test)
+
+    def test_auto_prefers_an_installed_accelerator(self):
+        def fast_loads(data):
+            return ('fast', data)
+        def test():
+            self.assertEqual(pick_json_decoder('auto')(b'[1]'), ('fast', b'[1]'))
+            self.assertEqual(pick_json_decoder()('[1]'), ('fast', b'[1]'))
+        self._with_accelerators({'orjson': NotImplemented, 'ujson': fast_loads}, test)
+
+    def test_accelerator_errors_fall_back_to_stdlib(self):
+        def strict_loads(data):
+            raise ValueError(data)
+        def test():
+            self.assertEqual(
+                repr(pick_json_decoder('orjson')(b'[1, NaN, -Infinity]')),
+                repr(json.loads('[1, NaN, -Infinity]')),
+            )
+        self._with_accelerators({'orjson': strict_loads}, test)
+
+    def test_possibly_wide_integers_are_left_to_stdlib(self):
+        def lossy_loads(data):
+            return [float(number) for number in json.loads(data)]
+        def test():
+            self.assertEqual(pick_json_decoder('orjson')(b'[18446744073709551616]'), [18446744073709551616])
+            self.assertEqual(pick_json_decoder('orjson')(b'[184467440737095516]'), [184467440737095516.0])
+        self._with_accelerators({'orjson': lossy_loads}, test)
+
 #----------------------------------------------------------------------------------------------------------------------------------
 
-def main():
-    pass
+class IterJsonArrayTests(AlcazarTest):
+
+    data = [
+        {'id': 1, 'name': 'one', 'tags': ['a', 'b']},
+        12345,
+        'a "quoted" string',
+        [[], {}],
+        None,
+        True,
+        -0.5e3,
+    ]
+
+    def test_elements_split_across_chunks(self):
+        text = json.dumps(self.data)
+        for chunk_size in (1, 2, 3, 7, 64, len(text)):
+            chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+            self.assertEqual(
+                (chunk_size, list(iter_json_array(chunks))),
+                (chunk_size, self.data),
+            )
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_array([' [ ', ' ] '])), [])
+
+    def test_not_an_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['{"a": 1}']))
+
+    def test_truncated_array(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['[1, 2', ', 3']))
+
+    def test_missing_or_extra_separators(self):
+        for text in ('[1 2]', '[1,,2]', '[,1]', '[1,]', '[1 ,, 2]', '[[1] {}]', '[1] 2', '[1]]', '[] x'):
+            for chunks in ([text], list(text)):
+                with self.assertRaises(ValueError):
+                    list(iter_json_array(chunks))
+
+#----------------------------------------------------------------------------------------------------------------------------------
+
+class LenientJsonLoadsTests(AlcazarTest):
+
+    def test_plain_json(self):
+        self.assertEqual(
+            lenient_json_loads(r'{"a": [1, "b\"c", null], "d": "\\x41"}'),
+            {'a': [1, 'b"c', None], 'd': r'\x41'},
+        )
+
+    def test_js_object_literal(self):
+        self.assertEqual(
+            lenient_json_loads(r'''
+                // the initial state
+                {
+                    id: 12, $ref: 'x', _private: true, 3: /* three */ 'three',
+                    single: 'it\'s "quoted"',
+                    url: "http://example.com/path", // not a comment
+                    hex: '\x41\x42', vtab: '\v', missing: undefined,
+                    list: [1, 2, 3,],
+                }
+            '''),
+            {
+                'id': 12, '$ref': 'x', '_private': True, '3': 'three',
+                'single': 'it\'s "quoted"',
+                'url': 'http://example.com/path',
+                'hex': 'AB', 'vtab': '\x0b', 'missing': None,
+                'list': [1, 2, 3],
+            },
+        )
+
+    def test_elisions_and_trailing_commas(self):
+        for js, expected in (
+                ('[,]', [None]),
+                ('[,,1]', [None, None, 1]),
+                ('[ , 1]', [None, 1]),
+                ('[1,,2]', [1, None, 2]),
+                ('[1, /* hole */ , 2]', [1, None, 2]),
+                ('[1,]', [1]),
+                ('[1,,]', [1, None]),
+                ('{a: [1, // comment\n ], b: 2,}', {'a': [1], 'b': 2}),
+                ):
+            self.assertEqual((js, lenient_json_loads(js)), (js, expected))
+
+    def test_keywords_as_keys(self):
+        self.assertEqual(
+            lenient_json_loads('{true: 1, nullable: null, NaNa: 2}'),
+            {'true': 1, 'nullable': None, 'NaNa': 2},
+        )
 
-if __name__ == '__main__':
-    main()
+    def test_invalid_js(self):
+        for js in ('{a: b}', '{a: 1', 'new Date()'):
+            with self.assertRaises(ValueError):
+                lenient_json_loads(js)
 
 #----------------------------------------------------------------------------------------------------------------------------------
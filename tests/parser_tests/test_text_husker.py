@@ -11,7 +11,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import re
 
 # alcazar
-from alcazar.husker import TextHusker
+from alcazar.husker import ListHusker, TextHusker
 
 # tests
 from .plumbing import AlcazarTest
@@ -48,4 +48,33 @@ class TextHuskerTest(AlcazarTest):
             'text',
         )
 
+    def test_search_returns_first_match(self):
+        self.assertEqual(
+            TextHusker(self.text_str).search(r'\bi(\w)'),
+            's',
+        )
+
+    def test_search_with_no_match_returns_null(self):
+        self.assertFalse(
+            TextHusker(self.text_str).search(r'xyzzy'),
+        )
+
+    def test_search_with_many_groups(self):
+        result = TextHusker(self.text_str).search(r'(\w+) is (\w+)')
+        self.assertIsInstance(result, ListHusker)
+        self.assertEqual(result, ['This', 'my'])
+
+    def test_findall_returns_raw_strings(self):
+        self.assertEqual(
+            TextHusker(self.text_str).findall(r'\bi(\w)', 'i'),
+            ['s', 't', 's'],
+        )
+
+    def test_compiled_regexes_are_cached(self):
+        TextHusker.regex_cache.clear()
+        TextHusker(self.text_str).one(r'This is my (\w+)')
+        TextHusker(self.text_str).any(r'This is my (\w+)', 'i')
+        self.assertEqual(len(TextHusker.regex_cache), 2)
+        self.assertIn((r'This is my (\w+)', 'i'), TextHusker.regex_cache)
+
 #----------------------------------------------------------------------------------------------------------------------------------
@@ -7,8 +7,11 @@
 # 2+3 compat
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+# 3rd parties
+import lxml.etree as ET
+
 # alcazar
-from alcazar.etree_parser import strip_xml_namespaces
+from alcazar.etree_parser import parse_xml_etree, strip_xml_namespaces
 
 # tests
 from .plumbing import AlcazarTest
@@ -28,4 +31,44 @@ class XmlLoaderTests(AlcazarTest):
                 xml_bytes_without_namespaces,
             )
 
+    def test_parse_xml_etree_strip_namespaces(self):
+        for prefix in ("bookreview", "getcapabilities", "soap", "soap2"):
+            with self.open_fixture(prefix + "_with_namespaces.xml") as fh:
+                xml_bytes_with_namespaces = fh.read()
+            with self.open_fixture(prefix + "_without_namespaces.xml") as fh:
+                xml_bytes_without_namespaces = fh.read()
+            self.assertEqual(
+                ET.tostring(parse_xml_etree(xml_bytes_with_namespaces, strip_namespaces=True)),
+                ET.tostring(parse_xml_etree(xml_bytes_without_namespaces)),
+            )
+
+    def test_parse_xml_etree_keeps_attribute_order(self):
+        root = parse_xml_etree(
+            b'<a xmlns:x="urn:x"><b one="1" x:two="2" three="3" xml:lang="en"/></a>',
+            strip_namespaces=True,
+        )
+        self.assertEqual(
+            ET.tostring(root),
+            b'<a><b one="1" two="2" three="3" lang="en"/></a>',
+        )
+
+    def test_parse_xml_etree_clashing_attribute_names(self):
+        root = parse_xml_etree(
+            b'<a xmlns:xlink="http://www.w3.org/1999/xlink">'
+            b'<b xlink:href="#first" href="#second"/><c href="#first" xlink:href="#second"/></a>',
+            strip_namespaces=True,
+        )
+        self.assertEqual(
+            ET.tostring(root),
+            b'<a><b href="#first"/><c href="#first"/></a>',
+        )
+
+    def test_parse_xml_etree_undeclared_prefixes(self):
+        root = parse_xml_etree(b'<a><x:b y:c="1">text</x:b></a>', strip_namespaces=True)
+        self.assertEqual(ET.tostring(root), b'<a><b c="1">text</b></a>')
+
+    def test_parse_xml_etree_keeps_namespaces(self):
+        root = parse_xml_etree(b'<a xmlns="urn:a"><b/></a>')
+        self.assertEqual(root[0].tag, '{urn:a}b')
+
 #----------------------------------------------------------------------------------------------------------------------------------